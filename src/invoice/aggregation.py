@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'GROUP_SEPARATOR',
+    'GroupKind',
+    'Aggregate',
+    'register_group_kind',
+    'get_group_kind',
+    'group_kind_names',
+    'parse_group',
+    'group_label',
+    'group_value',
+    'aggregate',
+]
+
+import calendar
+import collections
+import datetime
+
+from . import conf
+from .invoice import Invoice
+from .calendar_table import Calendar
+
+
+GroupKind = collections.namedtuple('GroupKind', ('name', 'label', 'key_function', 'value_function'))
+GroupKind.__doc__ = """GroupKind(name, label, key_function, value_function)
+   A stats group kind: key_function(invoice) returns the (sortable) group
+   key of the invoice; value_function(key, aggregate) returns the tuple
+   (value, date_from, date_to) shown for the group."""
+
+GROUP_SEPARATOR = ','
+
+_GROUP_KINDS = collections.OrderedDict()
+
+
+class Aggregate(object):
+    """Aggregate(keep_invoices=False)
+       Aggregates of a group, computed incrementally: invoice count,
+       income, distinct clients, min/max date and the first invoice; if
+       keep_invoices is True, the invoices are also collected.
+    """
+    __slots__ = ('count', 'income', 'clients', 'date_from', 'date_to', 'first', 'invoices')
+
+    def __init__(self, keep_invoices=False):
+        self.count = 0
+        self.income = 0.0
+        self.clients = set()
+        self.date_from = None
+        self.date_to = None
+        self.first = None
+        if keep_invoices:
+            self.invoices = []
+        else:
+            self.invoices = None
+
+    def add(self, invoice):
+        self.count += 1
+        if invoice.income is not None:
+            self.income += invoice.income
+        self.clients.add(invoice.tax_code)
+        date = invoice.date
+        if date is not None:
+            if self.date_from is None or date < self.date_from:
+                self.date_from = date
+            if self.date_to is None or date > self.date_to:
+                self.date_to = date
+        if self.first is None:
+            self.first = invoice
+        if self.invoices is not None:
+            self.invoices.append(invoice)
+
+    @property
+    def client_count(self):
+        return len(self.clients)
+
+
+def register_group_kind(name, label, key_function, value_function=None):
+    """register_group_kind(name, label, key_function, value_function=None) -> GroupKind
+       Registers a stats group kind; by default the group value is the
+       key, and the group dates are the min/max invoice dates.
+    """
+    if value_function is None:
+        value_function = _default_value
+    group_kind = GroupKind(name=name, label=label, key_function=key_function, value_function=value_function)
+    _GROUP_KINDS[name] = group_kind
+    return group_kind
+
+
+def get_group_kind(name):
+    try:
+        return _GROUP_KINDS[name]
+    except KeyError:
+        raise ValueError("raggruppamento {!r} non valido (i valori leciti sono {})".format(name, ', '.join(_GROUP_KINDS)))
+
+
+def group_kind_names():
+    return tuple(_GROUP_KINDS)
+
+
+def parse_group(s):
+    """parse_group(s) -> tuple
+       Parses a simple ('month') or composite ('year,client') group.
+    """
+    names = tuple(name.strip() for name in s.split(GROUP_SEPARATOR))
+    for name in names:
+        get_group_kind(name)
+    return names
+
+
+def _group_names(group):
+    if isinstance(group, str):
+        return parse_group(group)
+    return tuple(group)
+
+
+def group_label(group):
+    return GROUP_SEPARATOR.join(get_group_kind(name).label for name in _group_names(group))
+
+
+def group_value(group, key, aggregate):
+    """group_value(group, key, aggregate) -> (values, date_from, date_to)
+       Returns the values of the group components; the group dates are the
+       intersection of the component dates.
+    """
+    values = []
+    date_from, date_to = None, None
+    for name, component_key in zip(_group_names(group), key):
+        value, c_date_from, c_date_to = get_group_kind(name).value_function(component_key, aggregate)
+        values.append(value)
+        if c_date_from is not None and (date_from is None or c_date_from > date_from):
+            date_from = c_date_from
+        if c_date_to is not None and (date_to is None or c_date_to < date_to):
+            date_to = c_date_to
+    return tuple(values), date_from, date_to
+
+
+def aggregate(invoices, group, keep_invoices=False):
+    """aggregate(invoices, group, keep_invoices=False) -> list of (key, Aggregate)
+       Groups the invoices with a single hash pass; invoices can be any
+       iterable (for instance a db cursor). The groups are sorted by key.
+    """
+    key_functions = tuple(get_group_kind(name).key_function for name in _group_names(group))
+    aggregates = {}
+    for invoice in invoices:
+        key = tuple(key_function(invoice) for key_function in key_functions)
+        group_aggregate = aggregates.get(key, None)
+        if group_aggregate is None:
+            group_aggregate = aggregates[key] = Aggregate(keep_invoices=keep_invoices)
+        group_aggregate.add(invoice)
+    return sorted(aggregates.items(), key=lambda item: item[0])
+
+
+## default group kinds
+def _default_value(key, aggregate):
+    return key, aggregate.date_from, aggregate.date_to
+
+
+def _year_value(year, aggregate):
+    return year, datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+
+
+def _month_value(key, aggregate):
+    year, month = key
+    date_from = datetime.date(year, month, 1)
+    date_to = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    return date_from.strftime("%Y-%m"), date_from, date_to
+
+
+_CALENDAR = Calendar()
+
+def _week_value(key, aggregate):
+    year, week_number = key
+    date_from, date_to = _CALENDAR.week_range(year=year, week_number=week_number)
+    return "{:4d}:{:02d}".format(year, week_number), date_from, date_to
+
+
+def _day_value(date, aggregate):
+    return date, date, date
+
+
+def _weekday_value(weekday, aggregate):
+    return conf.WEEKDAY_TRANSLATION[weekday], aggregate.date_from, aggregate.date_to
+
+
+register_group_kind(conf.STATS_GROUP_YEAR, 'anno',
+    lambda invoice: invoice.year, _year_value)
+register_group_kind(conf.STATS_GROUP_MONTH, 'mese',
+    lambda invoice: (invoice.year, invoice.date.month), _month_value)
+register_group_kind(conf.STATS_GROUP_WEEK, 'settimana',
+    lambda invoice: (invoice.year, _CALENDAR.week_number(invoice.date)), _week_value)
+register_group_kind(conf.STATS_GROUP_DAY, 'giorno',
+    lambda invoice: invoice.date, _day_value)
+register_group_kind(conf.STATS_GROUP_WEEKDAY, 'giorno',
+    lambda invoice: invoice.date.weekday(), _weekday_value)
+register_group_kind(conf.STATS_GROUP_SERVICE, Invoice.get_field_translation('service'),
+    lambda invoice: invoice.service)
+register_group_kind(conf.STATS_GROUP_TASK, 'incarico',
+    lambda invoice: (invoice.tax_code, invoice.name, invoice.service))
+register_group_kind(conf.STATS_GROUP_CLIENT, Invoice.get_field_translation('tax_code'),
+    lambda invoice: invoice.tax_code)
+register_group_kind(conf.STATS_GROUP_CITY, Invoice.get_field_translation('city'),
+    lambda invoice: invoice.city)
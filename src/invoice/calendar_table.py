@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'CalendarDay',
+    'Calendar',
+    'CALENDAR_FIRST_YEAR',
+    'CALENDAR_LAST_YEAR',
+]
+
+import array
+import collections
+import datetime
+
+from .week import Week
+
+
+CalendarDay = collections.namedtuple('CalendarDay', ('date', 'year', 'month', 'week_number', 'week_first', 'week_last', 'weekday'))
+CalendarDay.__doc__ = """CalendarDay(date, year, month, week_number, week_first, week_last, weekday)
+   A row of the calendar dimension table; week_number, week_first and
+   week_last are None for the days without a week (see Calendar)."""
+
+CALENDAR_FIRST_YEAR = 1970
+CALENDAR_LAST_YEAR = 2099
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+class Calendar(object):
+    """Calendar(first_year=CALENDAR_FIRST_YEAR, last_year=CALENDAR_LAST_YEAR)
+       Week numbers and week days of the WeekManager, precomputed in arrays
+       indexed by date ordinal; the arrays are built on first use, days
+       outside the year range are computed on the fly.
+       The WeekManager semantics are kept exactly: weeks start on Monday,
+       the first week starts on January 1st, and a day is looked up with
+       its 1-based day of the year, so the last day of the year has no
+       week and raises IndexError.
+    """
+    def __init__(self, first_year=CALENDAR_FIRST_YEAR, last_year=CALENDAR_LAST_YEAR):
+        self.first_year = first_year
+        self.last_year = last_year
+        self._first_ordinal = datetime.date(first_year, 1, 1).toordinal()
+        self._last_ordinal = datetime.date(last_year, 12, 31).toordinal()
+        self._week_numbers = None
+        self._week_days = None
+        self._year_weeks = {}
+
+    @classmethod
+    def year_week_numbers(cls, year):
+        """year_week_numbers(year) -> (week_numbers, week_days)
+           Per-day lists for the year; the week number is 0 for the days
+           without a week.
+        """
+        jan1 = datetime.date(year, 1, 1)
+        num_days = datetime.date(year, 12, 31).toordinal() - jan1.toordinal() + 1
+        week_day0 = jan1.weekday()
+        # the day with index 'yday' in the WeekManager list of days
+        week_numbers = [(yday + week_day0) // 7 + 1 for yday in range(1, num_days)]
+        week_days = [yday if week_number == 1 else (yday + week_day0) % 7 \
+                        for yday, week_number in enumerate(week_numbers, 1)]
+        week_numbers.append(0)
+        week_days.append(0)
+        return week_numbers, week_days
+
+    def _setup(self):
+        week_numbers = array.array('b')
+        week_days = array.array('b')
+        for year in range(self.first_year, self.last_year + 1):
+            year_week_numbers, year_week_days = self.year_week_numbers(year)
+            week_numbers.extend(year_week_numbers)
+            week_days.extend(year_week_days)
+        self._week_numbers = week_numbers
+        self._week_days = week_days
+
+    def week(self, day):
+        ordinal = day.toordinal()
+        if self._first_ordinal <= ordinal <= self._last_ordinal:
+            if self._week_numbers is None:
+                self._setup()
+            index = ordinal - self._first_ordinal
+            week_number = self._week_numbers[index]
+            week_day = self._week_days[index]
+        else:
+            yday = ordinal - datetime.date(day.year, 1, 1).toordinal()
+            week_numbers, week_days = self.year_week_numbers(day.year)
+            week_number = week_numbers[yday]
+            week_day = week_days[yday]
+        if week_number == 0:
+            raise IndexError("{}: settimana non disponibile".format(day))
+        return Week(week_number=week_number, week_day=week_day)
+
+    def week_number(self, day):
+        return self.week(day).week_number
+
+    def week_day(self, day):
+        return self.week(day).week_day
+
+    def get_year_weeks(self, year):
+        year_weeks = self._year_weeks.get(year, None)
+        if year_weeks is None:
+            jan1 = datetime.date(year, 1, 1)
+            dec31 = datetime.date(year, 12, 31)
+            week_first = jan1
+            week_last = jan1 + _ONE_DAY * (6 - jan1.weekday())
+            year_weeks = [(week_first, week_last)]
+            while week_last < dec31:
+                week_first = week_last + _ONE_DAY
+                week_last = min(week_first + _ONE_DAY * 6, dec31)
+                year_weeks.append((week_first, week_last))
+            self._year_weeks[year] = year_weeks
+        return year_weeks
+
+    def week_range(self, year, week_number):
+        return self.get_year_weeks(year)[week_number - 1]
+
+    def year_days(self, year):
+        """year_days(year) -> list of CalendarDay
+           The calendar table rows for the year.
+        """
+        year_weeks = self.get_year_weeks(year)
+        week_numbers, week_days = self.year_week_numbers(year)
+        day = datetime.date(year, 1, 1)
+        calendar_days = []
+        for week_number in week_numbers:
+            if week_number:
+                week_first, week_last = year_weeks[week_number - 1]
+            else:
+                week_number, week_first, week_last = None, None, None
+            calendar_days.append(CalendarDay(date=day, year=year, month=day.month, week_number=week_number,
+                                             week_first=week_first, week_last=week_last, weekday=day.weekday()))
+            day += _ONE_DAY
+        return calendar_days
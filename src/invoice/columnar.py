@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'KIND_INT',
+    'KIND_FLOAT',
+    'KIND_DATE',
+    'KIND_STR',
+    'KIND_CATEGORY',
+    'INVOICE_COLUMN_KINDS',
+    'ARROW_AVAILABLE',
+    'get_columnar_format',
+    'write_columnar',
+    'read_columnar',
+]
+
+import array
+import ast
+import collections
+import datetime
+import itertools
+import math
+import sys
+import zipfile
+
+from . import conf
+from .error import InvoiceArgumentError
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    ARROW_AVAILABLE = True
+except ImportError: # pragma: no cover
+    ARROW_AVAILABLE = False
+
+
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_DATE = 'date'
+KIND_STR = 'str'
+KIND_CATEGORY = 'category'
+
+INVOICE_COLUMN_KINDS = collections.OrderedDict((
+    ('doc_filename',	KIND_STR),
+    ('year',		KIND_INT),
+    ('number',		KIND_INT),
+    ('name',		KIND_CATEGORY),
+    ('tax_code',	KIND_CATEGORY),
+    ('city',		KIND_CATEGORY),
+    ('date',		KIND_DATE),
+    ('service',		KIND_CATEGORY),
+    ('fee',		KIND_FLOAT),
+    ('refunds',		KIND_FLOAT),
+    ('p_cpa',		KIND_FLOAT),
+    ('cpa',		KIND_FLOAT),
+    ('p_vat',		KIND_FLOAT),
+    ('vat',		KIND_FLOAT),
+    ('p_deduction',	KIND_FLOAT),
+    ('deduction',	KIND_FLOAT),
+    ('taxes',		KIND_FLOAT),
+    ('income',		KIND_FLOAT),
+    ('currency',	KIND_CATEGORY),
+    ('exceptions',	KIND_CATEGORY),
+))
+
+DEFAULT_BATCH_SIZE = 65536
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+# numpy's NaT
+_NAT = -2 ** 63
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+_NPY_DESCR = {
+    KIND_INT:		('<i8', 'q'),
+    KIND_FLOAT:		('<f8', 'd'),
+    KIND_DATE:		('<M8[D]', 'q'),
+    KIND_CATEGORY:	('<i4', 'i'),
+}
+
+
+def get_columnar_format(columnar_format):
+    """get_columnar_format(columnar_format) -> format
+       Resolves the 'auto' format: arrow if pyarrow is available, npz
+       otherwise.
+    """
+    if columnar_format is None:
+        columnar_format = conf.DEFAULT_EXPORT_FORMAT
+    if columnar_format == conf.EXPORT_FORMAT_AUTO:
+        if ARROW_AVAILABLE:
+            columnar_format = conf.EXPORT_FORMAT_ARROW
+        else:
+            columnar_format = conf.EXPORT_FORMAT_NPZ
+    if columnar_format == conf.EXPORT_FORMAT_ARROW and not ARROW_AVAILABLE:
+        raise ImportError("modulo 'pyarrow' non trovato - prova ad installare python3-pyarrow")
+    if columnar_format not in (conf.EXPORT_FORMAT_ARROW, conf.EXPORT_FORMAT_NPZ):
+        raise InvoiceArgumentError("formato {!r} non valido".format(columnar_format))
+    return columnar_format
+
+
+def _date_days(value):
+    # dates can be datetime.date or db ISO strings
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def _days_date(days):
+    return datetime.date.fromordinal(days + _EPOCH_ORDINAL)
+
+
+class _Categories(object):
+    # the dictionary of a categorical column; codes are assigned in order
+    # of first appearance, so that the dictionary only grows
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value, None)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+## npz
+
+def _npy_bytes(descr, shape_len, data):
+    header = "{{'descr': '{}', 'fortran_order': False, 'shape': ({},), }}".format(descr, shape_len)
+    # magic, version and header length are 10 bytes; the data start is
+    # aligned to 64 bytes
+    header_len = len(header) + 1
+    header_len += (64 - (10 + header_len) % 64) % 64
+    header = header.ljust(header_len - 1) + '\n'
+    return _NPY_MAGIC + header_len.to_bytes(2, 'little') + header.encode('latin1') + data
+
+
+def _array_bytes(values):
+    if sys.byteorder == 'big': # pragma: no cover
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _str_npy(values):
+    size = max(1, max((len(value) for value in values), default=1))
+    data = b''.join(value.encode('utf-32-le').ljust(4 * size, b'\0') for value in values)
+    return _npy_bytes('<U{}'.format(size), len(values), data)
+
+
+def _write_npz(file, column_kinds, rows):
+    field_names = tuple(column_kinds)
+    kinds = tuple(column_kinds.values())
+    columns = []
+    masks = []
+    categories = {}
+    for field_name, kind in column_kinds.items():
+        if kind == KIND_STR:
+            columns.append([])
+        else:
+            columns.append(array.array(_NPY_DESCR[kind][1]))
+        masks.append(None)
+        if kind == KIND_CATEGORY:
+            categories[field_name] = _Categories()
+    appenders = [column.append for column in columns]
+    encoders = []
+    for field_name, kind in column_kinds.items():
+        if kind == KIND_CATEGORY:
+            encoders.append(categories[field_name].code)
+        elif kind == KIND_DATE:
+            encoders.append(_date_days)
+        else:
+            encoders.append(None)
+    missing = {KIND_INT: 0, KIND_FLOAT: math.nan, KIND_DATE: _NAT, KIND_STR: '', KIND_CATEGORY: -1}
+    num_rows = 0
+    for num_rows, values in enumerate(rows, 1):
+        for index, value in enumerate(values):
+            if value is None:
+                kind = kinds[index]
+                if kind in (KIND_INT, KIND_STR):
+                    if masks[index] is None:
+                        masks[index] = bytearray(num_rows - 1)
+                appenders[index](missing[kinds[index]])
+            else:
+                encode = encoders[index]
+                if encode is not None:
+                    value = encode(value)
+                appenders[index](value)
+            mask = masks[index]
+            if mask is not None:
+                mask.append(value is None)
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_STORED, allowZip64=True) as zip_file:
+        for field_name, kind, column, mask in zip(field_names, kinds, columns, masks):
+            if kind == KIND_STR:
+                data = _str_npy(column)
+            else:
+                data = _npy_bytes(_NPY_DESCR[kind][0], len(column), _array_bytes(column))
+            zip_file.writestr(field_name + '.npy', data)
+            if kind == KIND_CATEGORY:
+                zip_file.writestr(field_name + '.categories.npy', _str_npy(categories[field_name].values))
+            if mask is not None:
+                zip_file.writestr(field_name + '.mask.npy', _npy_bytes('|b1', len(mask), bytes(mask)))
+    return num_rows
+
+
+def _read_npy(zip_file, name):
+    data = zip_file.read(name)
+    if not data.startswith(_NPY_MAGIC):
+        raise ValueError("{}: formato npy non valido".format(name))
+    header_len = int.from_bytes(data[8:10], 'little')
+    descr = ast.literal_eval(data[10:10 + header_len].decode('latin1'))['descr']
+    data = data[10 + header_len:]
+    if descr.startswith('<U'):
+        size = 4 * int(descr[2:])
+        return descr, [data[i:i + size].decode('utf-32-le').rstrip('\0') for i in range(0, len(data), size)]
+    elif descr == '|b1':
+        return descr, [bool(b) for b in data]
+    typecode = dict(_NPY_DESCR.values())[descr]
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big': # pragma: no cover
+        values.byteswap()
+    return descr, values
+
+
+def _read_npz(file):
+    with zipfile.ZipFile(file, 'r') as zip_file:
+        names = set(zip_file.namelist())
+        field_names = [name[:-4] for name in zip_file.namelist() if name.endswith('.npy') and name.count('.') == 1]
+        columns = []
+        for field_name in field_names:
+            descr, values = _read_npy(zip_file, field_name + '.npy')
+            if field_name + '.categories.npy' in names:
+                categories = _read_npy(zip_file, field_name + '.categories.npy')[1]
+                values = [categories[code] if code >= 0 else None for code in values]
+            elif descr == _NPY_DESCR[KIND_DATE][0]:
+                values = [None if days == _NAT else _days_date(days) for days in values]
+            elif descr == _NPY_DESCR[KIND_FLOAT][0]:
+                values = [None if math.isnan(value) else value for value in values]
+            if field_name + '.mask.npy' in names:
+                mask = _read_npy(zip_file, field_name + '.mask.npy')[1]
+                values = [None if is_null else value for value, is_null in zip(values, mask)]
+            columns.append(values)
+    return field_names, zip(*columns)
+
+
+## arrow
+
+def _arrow_type(kind):
+    if kind == KIND_INT:
+        return pyarrow.int64()
+    elif kind == KIND_FLOAT:
+        return pyarrow.float64()
+    elif kind == KIND_DATE:
+        return pyarrow.date32()
+    elif kind == KIND_STR:
+        return pyarrow.string()
+    elif kind == KIND_CATEGORY:
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+
+
+def _write_arrow(file, column_kinds, rows, batch_size):
+    schema = pyarrow.schema([(field_name, _arrow_type(kind)) for field_name, kind in column_kinds.items()])
+    kinds = tuple(column_kinds.values())
+    # the dictionaries only grow, so that each batch adds a delta
+    categories = [_Categories() if kind == KIND_CATEGORY else None for kind in kinds]
+    options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    num_rows = 0
+    rows = iter(rows)
+    with pyarrow.OSFile(file, 'wb') as sink, pyarrow.ipc.new_stream(sink, schema, options=options) as writer:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            num_rows += len(batch)
+            arrays = []
+            for index, (kind, column) in enumerate(zip(kinds, zip(*batch))):
+                if kind == KIND_CATEGORY:
+                    code = categories[index].code
+                    indices = pyarrow.array([None if value is None else code(value) for value in column], type=pyarrow.int32())
+                    dictionary = pyarrow.array(categories[index].values, type=pyarrow.string())
+                    arrays.append(pyarrow.DictionaryArray.from_arrays(indices, dictionary))
+                elif kind == KIND_DATE:
+                    days = [None if value is None else _date_days(value) for value in column]
+                    arrays.append(pyarrow.array(days, type=pyarrow.int32()).cast(pyarrow.date32()))
+                else:
+                    arrays.append(pyarrow.array(column, type=schema.field(index).type))
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+    return num_rows
+
+
+def _read_arrow(file):
+    reader = pyarrow.ipc.open_stream(pyarrow.memory_map(file, 'r'))
+    field_names = reader.schema.names
+    def column_values(column):
+        if isinstance(column, pyarrow.DictionaryArray):
+            # decoding the indices is faster than column.to_pylist()
+            dictionary = column.dictionary.to_pylist()
+            return [None if index is None else dictionary[index] for index in column.indices.to_pylist()]
+        return column.to_pylist()
+    def rows():
+        for batch in reader:
+            yield from zip(*(column_values(column) for column in batch.columns))
+    return field_names, rows()
+
+
+def write_columnar(file, rows, *, column_kinds=INVOICE_COLUMN_KINDS, columnar_format=None, batch_size=DEFAULT_BATCH_SIZE):
+    """write_columnar(file, rows, *, column_kinds=INVOICE_COLUMN_KINDS, columnar_format=None, batch_size=DEFAULT_BATCH_SIZE) -> number of rows
+       Writes the rows (sequences of values in column_kinds order) with a
+       single pass:
+        * arrow: an Arrow IPC stream of record batches of batch_size rows;
+          categorical columns are dictionary encoded, and each batch adds
+          its new values to the dictionaries;
+        * npz: a NumPy .npz archive with a .npy array for each column;
+          categorical columns are stored as int32 codes ('<field>.npy',
+          -1 for None) and values ('<field>.categories.npy'), dates as
+          datetime64[D], None values as NaN/NaT or with a '<field>.mask.npy'
+          boolean array. The columns are buffered in compact arrays, numpy
+          is not needed.
+       Dates can be datetime.date or ISO strings.
+    """
+    columnar_format = get_columnar_format(columnar_format)
+    if columnar_format == conf.EXPORT_FORMAT_ARROW:
+        return _write_arrow(file, column_kinds, rows, batch_size)
+    else:
+        return _write_npz(file, column_kinds, rows)
+
+
+def read_columnar(file):
+    """read_columnar(file) -> (field_names, iterator over row tuples)
+       Reads a file written by write_columnar; the format is detected from
+       the content.
+    """
+    with open(file, 'rb') as f_in:
+        is_zip = f_in.read(4) == b'PK\x03\x04'
+    if is_zip:
+        return _read_npz(file)
+    elif ARROW_AVAILABLE:
+        return _read_arrow(file)
+    else:
+        raise ImportError("modulo 'pyarrow' non trovato - prova ad installare python3-pyarrow")
@@ -29,6 +29,7 @@ __all__ = [
     'LIST_FIELD_NAMES_FULL',
     'LIST_FIELD_NAMES',
     'DEFAULT_LIST_FIELD_NAMES',
+    'MONEY_FIELD_NAMES',
     'STATS_GROUP_YEAR',
     'STATS_GROUP_MONTH',
     'STATS_GROUP_WEEK',
@@ -43,12 +44,26 @@ __all__ = [
     'STATS_MODE_SHORT',
     'STATS_MODE_LONG',
     'STATS_MODE_FULL',
+    'STATS_MODE_ROLLING',
     'STATS_MODES',
     'DEFAULT_STATS_MODE',
+    'DEFAULT_STATS_WINDOW_DAYS',
+    'STATS_BACKEND_PYTHON',
+    'STATS_BACKEND_SQL',
+    'STATS_BACKEND_AUTO',
+    'STATS_BACKENDS',
+    'DEFAULT_STATS_BACKEND',
     'TABLE_MODE_TEXT',
     'TABLE_MODE_CSV',
     'TABLE_MODE_SCSV',
     'TABLE_MODE_XLSX',
+    'TABLE_MODE_NDJSON',
+    'EXPORT_FORMAT_ARROW',
+    'EXPORT_FORMAT_NPZ',
+    'EXPORT_FORMAT_AUTO',
+    'EXPORT_FORMATS',
+    'DEFAULT_EXPORT_FORMAT',
+    'DEFAULT_REPORT_CACHE_SIZE',
     'TABLE_MODES',
     'DEFAULT_TABLE_MODE',
     'DEFAULT_MAX_INTERRUPTION_DAYS',
@@ -161,11 +176,21 @@ LIST_FIELD_NAMES_FULL = FIELD_NAMES
 
 DEFAULT_LIST_FIELD_NAMES = LIST_FIELD_NAMES_LONG
 
+MONEY_FIELD_NAMES = ('fee', 'refunds', 'cpa', 'vat', 'deduction', 'taxes', 'income')
+
 STATS_MODE_SHORT = 'short'
 STATS_MODE_LONG = 'long'
 STATS_MODE_FULL = 'full'
-STATS_MODES = (STATS_MODE_SHORT, STATS_MODE_LONG, STATS_MODE_FULL)
+STATS_MODE_ROLLING = 'rolling'
+STATS_MODES = (STATS_MODE_SHORT, STATS_MODE_LONG, STATS_MODE_FULL, STATS_MODE_ROLLING)
 DEFAULT_STATS_MODE = STATS_MODE_LONG
+DEFAULT_STATS_WINDOW_DAYS = 30
+
+STATS_BACKEND_PYTHON = 'python'
+STATS_BACKEND_SQL = 'sql'
+STATS_BACKEND_AUTO = 'auto'
+STATS_BACKENDS = (STATS_BACKEND_PYTHON, STATS_BACKEND_SQL, STATS_BACKEND_AUTO)
+DEFAULT_STATS_BACKEND = STATS_BACKEND_AUTO
 
 STATS_GROUP_YEAR = 'year'
 STATS_GROUP_MONTH = 'month'
@@ -183,9 +208,19 @@ TABLE_MODE_TEXT = 'text'
 TABLE_MODE_CSV = 'csv'
 TABLE_MODE_SCSV = 'scsv'
 TABLE_MODE_XLSX = 'xlsx'
-TABLE_MODES = (TABLE_MODE_TEXT, TABLE_MODE_CSV, TABLE_MODE_SCSV, TABLE_MODE_XLSX)
+TABLE_MODE_NDJSON = 'ndjson'
+TABLE_MODES = (TABLE_MODE_TEXT, TABLE_MODE_CSV, TABLE_MODE_SCSV, TABLE_MODE_XLSX, TABLE_MODE_NDJSON)
 DEFAULT_TABLE_MODE = TABLE_MODE_TEXT
 
+EXPORT_FORMAT_ARROW = 'arrow'
+EXPORT_FORMAT_NPZ = 'npz'
+EXPORT_FORMAT_AUTO = 'auto'
+EXPORT_FORMATS = (EXPORT_FORMAT_ARROW, EXPORT_FORMAT_NPZ, EXPORT_FORMAT_AUTO)
+DEFAULT_EXPORT_FORMAT = EXPORT_FORMAT_AUTO
+
+# bytes of rendered reports kept in the report cache (0 disables it)
+DEFAULT_REPORT_CACHE_SIZE = 16 * 2 ** 20
+
 DEFAULT_MAX_INTERRUPTION_DAYS = 365
 
 _VERSION_STRING = '4.1.2'  ### bumpversion!
@@ -60,6 +60,11 @@ class Db(object):
             cursor = connection.cursor()
             return tuple(row[0] for row in self.execute(cursor, "SELECT name FROM sqlite_master WHERE type == 'table';"))
 
+    def get_index_names(self, connection=None):
+        with self.connect(connection) as connection:
+            cursor = connection.cursor()
+            return tuple(row[0] for row in self.execute(cursor, "SELECT name FROM sqlite_master WHERE type == 'index';"))
+
     def create_table(self, table_name, table_fields, connection=None):
         with self.connect(connection) as connection:
             cursor = connection.cursor()
@@ -96,7 +101,6 @@ class Db(object):
             where = ""
         table = self.TABLES[table_name]
         field_names = table.field_names
-        fields = table.fields
         if table.singleton:
             limit = " ORDER BY rowid DESC LIMIT 1";
         else:
@@ -108,14 +112,65 @@ class Db(object):
             limit=limit,
         )
         records = []
-        dict_type = table.dict_type
         with self.connect(connection) as connection:
             cursor = connection.cursor()
             for values in self.execute(cursor, sql):
-                record_d = dict((field_name, fields[field_name].db_from(value)) for field_name, value in zip(field_names, values))
-                records.append(dict_type(**record_d))
+                records.append(self.make_record(table_name, values))
         return records
+
+    def iter_values(self, table_name, field_names=None, where=None, values=None, order_by=None, limit=None, offset=None, connection=None):
+        """iter_values(table_name, field_names=None, where=None, values=None, order_by=None, limit=None, offset=None, connection=None) -> iterator
+           Yields the tuples of the raw db values of the selected fields,
+           fetched from the cursor one row at a time; values are the
+           parameters of the where clauses.
+        """
+        if where:
+            if isinstance(where, str):
+                 where_list = [where]
+            else:
+                 where_list = where
+            where = " WHERE ({})".format(" AND ".join("( {} )".format(w) for w in where_list))
+        else:
+            where = ""
+        if field_names is None:
+            field_names = self.TABLES[table_name].field_names
+        if order_by:
+            order_by = " ORDER BY {}".format(', '.join(order_by))
+        else:
+            order_by = ""
+        if limit is not None or offset is not None:
+            if limit is None:
+                limit = -1
+            limit = " LIMIT {:d}".format(limit)
+            if offset:
+                limit += " OFFSET {:d}".format(offset)
+        else:
+            limit = ""
+        sql = """SELECT {field_names} FROM {table_name}{where}{order_by}{limit};""".format(
+            field_names=', '.join(field_names),
+            table_name=table_name,
+            where=where,
+            order_by=order_by,
+            limit=limit,
+        )
+        with self.connect(connection) as connection:
+            cursor = connection.cursor()
+            yield from self.execute(cursor, sql, values)
+
+    def make_record(self, table_name, values):
+        table = self.TABLES[table_name]
+        fields = table.fields
+        record_d = dict((field_name, fields[field_name].db_from(value)) for field_name, value in zip(table.field_names, values))
+        return table.dict_type(**record_d)
         
+    def count(self, table_name, connection=None):
+        sql = """SELECT COUNT(*) FROM {table_name};""".format(
+            table_name=table_name,
+        )
+        with self.connect(connection) as connection:
+            cursor = connection.cursor()
+            return self.execute(cursor, sql).fetchone()[0]
+
     def update(self, table_name, key, records, connection=None):
         table = self.TABLES[table_name]
         field_names = [field_name for field_name in table.field_names if field_name != key]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'ClientDateIndex',
+    'IncomeIndex',
+]
+
+import bisect
+import datetime
+
+
+class ClientDateIndex(object):
+    """ClientDateIndex(invoices)
+       Sorted invoice dates of each client (tax_code); answers "is there an
+       invoice of this client in a date interval" with a binary search.
+    """
+    def __init__(self, invoices):
+        client_dates = {}
+        for invoice in invoices:
+            if invoice.date is not None:
+                client_dates.setdefault(invoice.tax_code, []).append(invoice.date)
+        for dates in client_dates.values():
+            dates.sort()
+        self.client_dates = client_dates
+
+    def count(self, tax_code, date_from, date_to, include_from=True, include_to=True):
+        """count(tax_code, date_from, date_to, include_from=True, include_to=True) -> int
+           Number of invoices of the client between date_from and date_to.
+        """
+        dates = self.client_dates.get(tax_code, None)
+        if not dates:
+            return 0
+        if include_from:
+            lo = bisect.bisect_left(dates, date_from)
+        else:
+            lo = bisect.bisect_right(dates, date_from)
+        if include_to:
+            hi = bisect.bisect_right(dates, date_to, lo)
+        else:
+            hi = bisect.bisect_left(dates, date_to, lo)
+        return max(hi - lo, 0)
+
+    def any_before(self, tax_code, date, interval):
+        """any_before(tax_code, date, interval) -> bool
+           True if the client has an invoice in [date - interval, date).
+        """
+        return self.count(tax_code, date - interval, date, include_to=False) > 0
+
+    def any_after(self, tax_code, date, interval):
+        """any_after(tax_code, date, interval) -> bool
+           True if the client has an invoice in (date, date + interval].
+        """
+        return self.count(tax_code, date, date + interval, include_from=False) > 0
+
+
+class IncomeIndex(object):
+    """IncomeIndex(invoices)
+       Per-day prefix sums of the invoice count and income: the totals of
+       any date interval are answered with two binary searches, and the
+       moving totals of a window with a single pass (see rolling).
+       The invoices without a date are not indexed.
+    """
+    def __init__(self, invoices):
+        day_totals = {}
+        for invoice in invoices:
+            if invoice.date is not None:
+                count, income = day_totals.get(invoice.date, (0, 0.0))
+                if invoice.income is not None:
+                    income += invoice.income
+                day_totals[invoice.date] = (count + 1, income)
+        self.days = sorted(day_totals)
+        # cum_counts[i] and cum_incomes[i] are the totals of days[:i]
+        self.cum_counts = [0]
+        self.cum_incomes = [0.0]
+        cum_count, cum_income = 0, 0.0
+        for day in self.days:
+            count, income = day_totals[day]
+            cum_count += count
+            cum_income += income
+            self.cum_counts.append(cum_count)
+            self.cum_incomes.append(cum_income)
+
+    def _range_totals(self, lo, hi):
+        return self.cum_counts[hi] - self.cum_counts[lo], self.cum_incomes[hi] - self.cum_incomes[lo]
+
+    def _day_range(self, date_from, date_to):
+        if date_from is None:
+            lo = 0
+        else:
+            lo = bisect.bisect_left(self.days, date_from)
+        if date_to is None:
+            hi = len(self.days)
+        else:
+            hi = bisect.bisect_right(self.days, date_to)
+        if hi < lo:
+            hi = lo
+        return lo, hi
+
+    def totals(self, date_from=None, date_to=None):
+        """totals(date_from=None, date_to=None) -> (invoice_count, income)
+           The totals of the invoices between date_from and date_to
+           (included); None is an open bound.
+        """
+        return self._range_totals(*self._day_range(date_from, date_to))
+
+    def bounds(self, date_from=None, date_to=None):
+        """bounds(date_from=None, date_to=None) -> (first_day, last_day)
+           The first and last indexed days between date_from and date_to
+           (included), or None if there are none.
+        """
+        lo, hi = self._day_range(date_from, date_to)
+        if lo == hi:
+            return None
+        return self.days[lo], self.days[hi - 1]
+
+    def rolling(self, window, date_from=None, date_to=None):
+        """rolling(window, date_from=None, date_to=None) -> iterator
+           Yields (date_from, date_to, invoice_count, income) for each
+           indexed day date_to between date_from and date_to, with the
+           totals of the window of days ending at date_to; the days before
+           date_from are never counted. The window start only moves
+           forward, so the whole pass is linear.
+        """
+        days = self.days
+        first, last = self._day_range(date_from, date_to)
+        lo = first
+        for hi in range(first + 1, last + 1):
+            day = days[hi - 1]
+            window_from = day - window + datetime.timedelta(days=1)
+            while days[lo] < window_from:
+                lo += 1
+            yield (window_from, day) + self._range_totals(lo, hi)
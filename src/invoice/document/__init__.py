@@ -15,7 +15,7 @@
 # limitations under the License.
 #
 
-from .document import document
+from .document import document, documents, parse_output, DocumentOutput
 from .base import item_getter, attr_getter, Formula
 from .formats import Formats
 
@@ -23,6 +23,9 @@ from .formats import Formats
 __author__ = "Simone Campagna"
 __all__ = [
     'document',
+    'documents',
+    'parse_output',
+    'DocumentOutput',
     'item_getter',
     'attr_getter',
     'Formula',
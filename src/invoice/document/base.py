@@ -16,6 +16,7 @@
 #
 
 import abc
+import operator
 
 
 __author__ = "Simone Campagna"
@@ -97,11 +98,24 @@ class BasePageTemplate(metaclass=abc.ABCMeta):
         return value
 
     def transform(self, data):
-        if self.show_header and data:
-            yield self.header
-        convert = self.convert
+        # the header is shown only if there is data; data can be an iterator
+        show_header = self.show_header
+        transform_value = self.transform_value
+        get_values = self.values_getter()
+        converters = [self.convert.get(field_name, str) for field_name in self.field_names]
         for entry in data:
-            yield tuple(convert.get(field_name, str)(self.transform_value(self.getter(entry, field_name))) for field_name in self.field_names)
+            if show_header:
+                yield self.header
+                show_header = False
+            yield tuple([convert(transform_value(value)) for convert, value in zip(converters, get_values(entry))])
+
+    def values_getter(self):
+        # returns a function extracting all the field values of an entry
+        field_names = tuple(self.field_names)
+        if self.getter is attr_getter and len(field_names) > 1:
+            return operator.attrgetter(*field_names)
+        getter = self.getter
+        return lambda entry: [getter(entry, field_name) for field_name in field_names]
 
 
 class BaseDocument(metaclass=abc.ABCMeta):
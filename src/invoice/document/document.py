@@ -15,6 +15,7 @@
 # limitations under the License.
 #
 
+import collections
 import contextlib
 import sys
 
@@ -25,15 +26,37 @@ from ..log import get_default_logger
 
 __author__ = "Simone Campagna"
 __all__ = [
-    'document'
+    'DocumentOutput',
+    'parse_output',
+    'document',
+    'documents',
 ]
 
 from .text_csv import TextDocument, CsvDocument, SCsvDocument
 from .xlsx import XlsxDocument, XLSX_AVAILABLE
+from .ndjson import NdjsonDocument
+from .multi import MultiDocument
+
+
+DocumentOutput = collections.namedtuple('DocumentOutput', ('file', 'mode'))
+DocumentOutput.__doc__ = """DocumentOutput(file, mode)
+   An output of the documents() fan-out; mode is None if not specified."""
+
+
+def parse_output(output):
+    """parse_output(output) -> DocumentOutput
+       Parses a 'FILE[:MODE]' output; the suffix is a mode only if it is a
+       valid table mode, so that other colons are part of the filename.
+    """
+    if ':' in output:
+        file, mode = output.rsplit(':', 1)
+        if mode in conf.TABLE_MODES:
+            return DocumentOutput(file=file, mode=mode)
+    return DocumentOutput(file=output, mode=None)
 
 
 @contextlib.contextmanager
-def document(mode=conf.TABLE_MODE_TEXT, file=None, *, logger=None):
+def document(mode=conf.TABLE_MODE_TEXT, file=None, *, logger=None, page_options=None, constant_memory=True):
     if logger is None:
         logger = get_default_logger()
     has_filename = False
@@ -49,7 +72,7 @@ def document(mode=conf.TABLE_MODE_TEXT, file=None, *, logger=None):
             raise InvoiceArgumentError("non è possibile produrre una tabella in formato {} su terminale; utilizzare --output".format(mode))
         if not XLSX_AVAILABLE:
             raise ImportError("modulo 'xlsxwriter' non trovato - prova ad installare python3-xlsxwriter")
-        doc = XlsxDocument(logger=logger, filename=file)
+        doc = XlsxDocument(logger=logger, filename=file, page_options=page_options, constant_memory=constant_memory)
     else:
         if has_filename:
             file_handle = open(file, "w")
@@ -63,9 +86,28 @@ def document(mode=conf.TABLE_MODE_TEXT, file=None, *, logger=None):
             document_class = CsvDocument
         elif mode == conf.TABLE_MODE_SCSV:
             document_class = SCsvDocument
-        doc = document_class(logger=logger, file=file_handle)
+        elif mode == conf.TABLE_MODE_NDJSON:
+            document_class = NdjsonDocument
+        doc = document_class(logger=logger, file=file_handle, page_options=page_options)
     yield doc
     if must_close:
         file_handle.close()
     doc.close()
 
+
+
+@contextlib.contextmanager
+def documents(outputs, *, logger=None, page_options=None, constant_memory=True):
+    """documents(outputs, *, logger=None, page_options=None, constant_memory=True)
+       A document writing the same pages to all the (file, mode) outputs:
+       the rows are computed once, and fanned out to each backend.
+    """
+    if logger is None:
+        logger = get_default_logger()
+    with contextlib.ExitStack() as stack:
+        docs = [stack.enter_context(document(mode=mode, file=file, logger=logger, page_options=page_options, constant_memory=constant_memory)) \
+                for file, mode in outputs]
+        if len(docs) == 1:
+            yield docs[0]
+        else:
+            yield MultiDocument(logger=logger, documents=docs, page_options=page_options)
@@ -25,18 +25,55 @@ __all__ = [
 
 
 class Formats(object):
+    """Formats()
+       Format names by row (col=None), by column (row=None) or by cell;
+       row formats take precedence over column formats, cell formats over
+       both.
+       Offsets are recorded and applied when a row is looked up, and the
+       formats of a whole row are compiled once in a tuple (see
+       row_formats), so that a page with a few row and column formats is
+       rendered without per-cell lookups.
+    """
     def __init__(self):
         self._formats = collections.OrderedDict()
+        self._offsets = []
+        self._compiled = {}
 
     def add_format(self, format, *, row=None, col=None):
+        if self._offsets:
+            self._materialize_offsets()
+        self._compiled.clear()
         if not row in self._formats:
             self._formats[row] = collections.OrderedDict()
         row_formats = self._formats[row]
         row_formats[col] = format
 
+    def _materialize_offsets(self):
+        for row, offset in self._offsets:
+            swp = self._formats
+            self._formats = collections.OrderedDict()
+            for key, value in swp.items():
+                if key is not None and key >= row:
+                    key += offset
+                self._formats[key] = value
+        self._offsets.clear()
+
+    def _row_key(self, row):
+        # the key of the row in self._formats, None if it has no row formats
+        for offset_row, offset in reversed(self._offsets):
+            if row >= offset_row + offset:
+                row -= offset
+            elif row >= offset_row:
+                # a row inserted by apply_offset
+                return None
+        if row in self._formats:
+            return row
+        else:
+            return None
+
     def get_format(self, row, col):
         rc_format_name = None
-        for rkey in None, row:
+        for rkey in None, self._row_key(row):
             if rkey in self._formats:
                 row_formats = self._formats[rkey]
                 for ckey in None, col:
@@ -44,10 +81,36 @@ class Formats(object):
                         rc_format_name = row_formats[ckey]
         return rc_format_name
 
+    def row_formats(self, row, num_cols):
+        """row_formats(row, num_cols) -> tuple of format names
+           The format names of the first num_cols columns of the row.
+        """
+        key = (self._row_key(row), num_cols)
+        compiled = self._compiled.get(key, None)
+        if compiled is None:
+            compiled = [None for col in range(num_cols)]
+            for rkey in None, key[0]:
+                if rkey in self._formats:
+                    row_formats = self._formats[rkey]
+                    if None in row_formats:
+                        compiled = [row_formats[None] for col in range(num_cols)]
+                    for col, format_name in row_formats.items():
+                        if col is not None and col < num_cols:
+                            compiled[col] = format_name
+            compiled = tuple(compiled)
+            self._compiled[key] = compiled
+        return compiled
+
+    def copy(self):
+        """copy() -> Formats
+           An independent copy, so that the offsets applied by a document
+           do not affect the other ones.
+        """
+        formats = self.__class__()
+        for row, row_formats in self._formats.items():
+            formats._formats[row] = row_formats.copy()
+        formats._offsets.extend(self._offsets)
+        return formats
+
     def apply_offset(self, row, offset):
-        swp = self._formats
-        self._formats = collections.OrderedDict()
-        for key, value in swp.items():
-            if key is not None and key >= row:
-                key += offset
-            self._formats[key] = value
+        self._offsets.append((row, offset))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from .base import BaseDocument
+
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'MultiDocument',
+    'MultiPageTemplate',
+]
+
+
+class MultiPageTemplate(object):
+    """MultiPageTemplate(page_templates)
+       The page templates of the documents of a MultiDocument.
+    """
+    def __init__(self, page_templates):
+        self.page_templates = page_templates
+
+
+class MultiDocument(BaseDocument):
+    """MultiDocument(logger, documents, page_options=None)
+       Fans every page out to all the documents; the page data is
+       materialized once, so that rows produced by an iterator are computed
+       a single time, and each document gets its own copy of the formats.
+       The documents are owned (and closed) by the caller.
+    """
+    def __init__(self, logger, documents, page_options=None):
+        super().__init__(logger=logger, page_options=page_options)
+        self.documents = documents
+
+    def define_format(self, format_name, format_data):
+        for document in self.documents:
+            document.define_format(format_name, format_data)
+
+    def create_page_template(self, field_names, *, header=None, getter=None, convert=None, align=None, **options):
+        return MultiPageTemplate([document.create_page_template(field_names, header=header, getter=getter, convert=convert, align=align, **options) \
+                                  for document in self.documents])
+
+    def add_page(self, page_template, data, *, title=None, formats=None, prologue=None, epilogue=None):
+        if iter(data) is data:
+            data = tuple(data)
+        for document, document_page_template in zip(self.documents, page_template.page_templates):
+            if formats is not None:
+                document_formats = formats.copy()
+            else:
+                document_formats = None
+            document.add_page(document_page_template, data, title=title, formats=document_formats, prologue=prologue, epilogue=epilogue)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import datetime
+import json
+import sys
+
+from .. import conf
+from .base import BasePageTemplate, BaseDocument, Formula
+
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'NdjsonPageTemplate',
+    'NdjsonDocument',
+    'NDJSON_AVAILABLE',
+]
+
+
+NDJSON_AVAILABLE = True
+
+
+def _json_default(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    elif isinstance(value, Formula):
+        return value.value
+    raise TypeError("{!r}: valore non serializzabile in JSON".format(value))
+
+
+class NdjsonPageTemplate(BasePageTemplate):
+    """NdjsonPageTemplate(document, field_names, *, header=None, getter=None, convert=None, align=None, **options)
+       Each row is a JSON object {field_name: value} on a single line.
+       Values keep their native types: dates are ISO strings and the
+       'cents' fields (by default conf.MONEY_FIELD_NAMES) are integer
+       cents, formulas included; header, convert and align are ignored.
+    """
+    def __init__(self, document, field_names, *, header=None, getter=None, convert=None, align=None, **options):
+        super().__init__(document=document, field_names=field_names, header=header, getter=getter, convert=convert, align=align)
+        cents = options.get("cents", None)
+        if cents is None:
+            cents = conf.MONEY_FIELD_NAMES
+        self.cents_indices = tuple(index for index, field_name in enumerate(self.field_names) if field_name in cents)
+
+    def transform(self, data):
+        get_values = self.values_getter()
+        cents_indices = self.cents_indices
+        field_names = self.field_names
+        for entry in data:
+            values = get_values(entry)
+            if cents_indices:
+                values = list(values)
+                for index in cents_indices:
+                    value = values[index]
+                    if isinstance(value, Formula):
+                        value = value.value
+                    if isinstance(value, float):
+                        values[index] = int(round(value * 100))
+            yield dict(zip(field_names, values))
+
+    def getlines(self, data):
+        encode = self.document.encoder.encode
+        for obj in self.transform(data):
+            yield encode(obj)
+
+
+class NdjsonDocument(BaseDocument):
+    """NdjsonDocument(logger, file=sys.stdout, page_options=None)
+       Newline-delimited JSON; rows are written one at a time as soon as
+       they are produced. Titles, prologues and epilogues are not written.
+    """
+    def __init__(self, logger, file=sys.stdout, page_options=None):
+        self.file = file
+        self.encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_json_default)
+        super().__init__(logger=logger, page_options=page_options)
+
+    def define_format(self, format_name, format_data):
+        pass
+
+    def create_page_template(self, field_names, *, header=None, getter=None, convert=None, align=None, **options):
+        options = self.page_template_options(options)
+        return NdjsonPageTemplate(document=self, field_names=field_names, header=header,
+                                  getter=getter, convert=convert, align=align, **options)
+
+    def add_page(self, page_template, data, *, title=None, formats=None, prologue=None, epilogue=None):
+        write = self.file.write
+        for line in page_template.getlines(data):
+            write(line)
+            write('\n')
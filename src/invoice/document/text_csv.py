@@ -16,6 +16,9 @@
 #
 
 import abc
+import csv
+import io
+import itertools
 import sys
 
 from .base import BasePageTemplate, BaseDocument
@@ -30,14 +33,30 @@ __all__ = [
     'CsvPageTemplate',
     'SCsvPageTemplate',
     'CSV_AVAILABLE',
+    'WIDTH_EXACT',
+    'WIDTH_SAMPLE',
+    'DEFAULT_SAMPLE_SIZE',
 ]
 
 
 TEXT_AVAILABLE = True
 CSV_AVAILABLE = True
 
+WIDTH_EXACT = 'exact'
+WIDTH_SAMPLE = 'sample'
+DEFAULT_SAMPLE_SIZE = 1000
+
 
 class BaseTCPageTemplate(BasePageTemplate):
+    """BaseTCPageTemplate(document, field_names, *, header=None, getter=None, convert=None, align=None, **options)
+       Lines are generated one at a time. Justified columns are as wide as
+       the 'width' option says:
+        * WIDTH_EXACT (default): the widest value; the data are traversed
+          twice (only the widths are kept), iterators are materialized;
+        * WIDTH_SAMPLE: the widest value in the first 'sample_size' rows;
+        * an int or a {field_name: int} dict: fixed widths.
+       Values wider than the column are not truncated.
+    """
     JUSTIFY = True
     FIELD_SEPARATOR = " "
     def __init__(self, document, field_names, *, header=None, getter=None, convert=None, align=None, **options):
@@ -50,23 +69,52 @@ class BaseTCPageTemplate(BasePageTemplate):
         if field_separator is None:
             field_separator = self.FIELD_SEPARATOR
         self.field_separator = field_separator
+        width = options.get("width", None)
+        if width is None:
+            width = WIDTH_EXACT
+        self.width = width
+        sample_size = options.get("sample_size", None)
+        if sample_size is None:
+            sample_size = DEFAULT_SAMPLE_SIZE
+        self.sample_size = sample_size
+
+    def column_lengths(self, rows):
+        lengths = [0 for f in self.field_names]
+        for row in rows:
+            lengths = list(map(max, lengths, map(len, row)))
+        return lengths
 
     def getlines(self, data):
-        rows = tuple(self.transform(data))
-        if rows:
-            if self.justify:
-                lengths = [max(len(entry[c]) for entry in rows) for c, f in enumerate(self.field_names)]
-            else:
-                lengths = ['' for f in self.field_names]
-            fmt = self.field_separator.join("{{row[{i}]:{align}{{lengths[{i}]}}s}}".format(i=i, align=self.align.get(f, '<')) for i, f in enumerate(self.field_names))
-            for row in rows:
-                yield fmt.format(row=row, lengths=lengths)
+        if not self.justify:
+            field_separator = self.field_separator
+            for row in self.transform(data):
+                yield field_separator.join(row)
+            return
+        rows = self.transform(data)
+        width = self.width
+        if width == WIDTH_EXACT:
+            if iter(data) is data:
+                rows = tuple(rows)
+            lengths = self.column_lengths(rows)
+            if not isinstance(rows, tuple):
+                rows = self.transform(data)
+        elif width == WIDTH_SAMPLE:
+            sample = tuple(itertools.islice(rows, self.sample_size))
+            lengths = self.column_lengths(sample)
+            rows = itertools.chain(sample, rows)
+        elif isinstance(width, int):
+            lengths = [width for f in self.field_names]
+        else:
+            lengths = [width.get(f, 0) for f in self.field_names]
+        fmt = self.field_separator.join("{{row[{i}]:{align}{{lengths[{i}]}}s}}".format(i=i, align=self.align.get(f, '<')) for i, f in enumerate(self.field_names))
+        for row in rows:
+            yield fmt.format(row=row, lengths=lengths)
 
     def transform_value(self, value):
         if value is None:
             return ''
         else:
-            return super().transform_value(value)
+            return value
 
 
 class TextPageTemplate(BaseTCPageTemplate):
@@ -75,8 +123,49 @@ class TextPageTemplate(BaseTCPageTemplate):
 
 
 class CsvPageTemplate(BaseTCPageTemplate):
+    """CsvPageTemplate(document, field_names, *, header=None, getter=None, convert=None, align=None, **options)
+       Rows are written by a csv.writer, with the field separator as
+       delimiter and quoting of the values containing it; only the columns
+       with a converter are transformed, the other values are formatted by
+       the writer.
+    """
     JUSTIFY = False
     FIELD_SEPARATOR = ","
+    def __init__(self, document, field_names, *, header=None, getter=None, convert=None, align=None, **options):
+        super().__init__(document, field_names, header=header, getter=getter, convert=convert, align=align, **options)
+        self.column_converters = tuple((index, self.convert[field_name]) \
+                                        for index, field_name in enumerate(self.field_names) if field_name in self.convert)
+
+    def csv_rows(self, data):
+        show_header = self.show_header
+        get_values = self.values_getter()
+        column_converters = self.column_converters
+        transform_value = self.transform_value
+        for entry in data:
+            if show_header:
+                yield self.header
+                show_header = False
+            values = get_values(entry)
+            if column_converters:
+                values = list(values)
+                for index, convert in column_converters:
+                    values[index] = convert(transform_value(values[index]))
+            yield values
+
+    def csv_writer(self, file):
+        return csv.writer(file, delimiter=self.field_separator, lineterminator='\n')
+
+    def writerows(self, file, data):
+        self.csv_writer(file).writerows(self.csv_rows(data))
+
+    def getlines(self, data):
+        stream = io.StringIO()
+        writer = self.csv_writer(stream)
+        for row in self.csv_rows(data):
+            writer.writerow(row)
+            yield stream.getvalue()[:-1]
+            stream.seek(0)
+            stream.truncate()
 
 
 class SCsvPageTemplate(CsvPageTemplate):
@@ -116,11 +205,10 @@ class BaseTCDocument(BaseDocument):
 
     def add_page(self, page_template, data, *, title=None, formats=None, prologue=None, epilogue=None):
         self._add_prologue(prologue)
-        text = "\n".join(page_template.getlines(data))
-        if text:
-            text += "\n"
         self._show_title(title)
-        self.file.write(text)
+        write = self.file.write
+        for line in page_template.getlines(data):
+            write(line + "\n")
         self._add_epilogue(epilogue)
 
     @abc.abstractmethod
@@ -146,6 +234,12 @@ class CsvDocument(BaseTCDocument):
     def page_template_class(cls):
         return CsvPageTemplate
 
+    def add_page(self, page_template, data, *, title=None, formats=None, prologue=None, epilogue=None):
+        self._add_prologue(prologue)
+        self._show_title(title)
+        page_template.writerows(self.file, data)
+        self._add_epilogue(epilogue)
+
     def _show_title(self, title):
         if title:
             self.file.write("# {}\n".format(title))
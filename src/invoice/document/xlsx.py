@@ -16,11 +16,13 @@
 #
 
 import contextlib
+import itertools
 from .. import conf
 from ..log import get_default_logger
 
 from .base import BasePageTemplate, BaseDocument, Formula
 from .formats import Formats
+from .text_csv import DEFAULT_SAMPLE_SIZE
 
 try:
     from xlsxwriter.workbook import Workbook
@@ -37,19 +39,39 @@ __all__ = [
 
 
 class XlsxPageTemplate(BasePageTemplate):
+    def __init__(self, document, field_names, *, header=None, getter=None, convert=None, align=None, **options):
+        super().__init__(document=document, field_names=field_names, header=header, getter=getter, convert=convert, align=align)
+        sample_size = options.get("sample_size", None)
+        if sample_size is None:
+            sample_size = DEFAULT_SAMPLE_SIZE
+        self.sample_size = sample_size
+
     def transform(self, data):
-        if self.show_header and data:
-            yield self.header
+        # the header is shown only if there is data; data can be an iterator
+        show_header = self.show_header
         convert = self.convert
         for entry in data:
+            if show_header:
+                yield self.header
+                show_header = False
             yield tuple(convert.get(field_name, lambda x: x)(self.getter(entry, field_name)) for field_name in self.field_names)
 
 
 
 class XlsxDocument(BaseDocument):
-    def __init__(self, logger, filename, page_options=None):
-        self.workbook = Workbook(filename)
+    """XlsxDocument(logger, filename, page_options=None, constant_memory=True)
+       In constant memory mode rows are flushed to disk as soon as they are
+       written, and the column widths are taken from the first
+       'sample_size' rows of each page; otherwise the whole workbook is
+       kept in memory and the widths fit all the rows.
+       Cells are written with write_row, a call for each run of columns
+       sharing the same format.
+    """
+    def __init__(self, logger, filename, page_options=None, constant_memory=True):
+        self.constant_memory = constant_memory
+        self.workbook = Workbook(filename, {'constant_memory': constant_memory})
         self._formats = {}
+        self._row_runs = {}
         super().__init__(logger=logger, page_options=page_options)
         self._merge_format = self.workbook.add_format({
             #'bold':     True,
@@ -66,22 +88,46 @@ class XlsxDocument(BaseDocument):
 
     def define_format(self, format_name, format_data):
         self._formats[format_name] = self.workbook.add_format(format_data)
+        self._row_runs.clear()
+
+    def get_row_runs(self, row_formats):
+        """get_row_runs(row_formats) -> list of (col_begin, col_end, format)
+           The runs of consecutive columns with the same format.
+        """
+        row_runs = self._row_runs.get(row_formats, None)
+        if row_runs is None:
+            row_runs = []
+            col_begin = 0
+            for col in range(1, len(row_formats) + 1):
+                if col == len(row_formats) or row_formats[col] != row_formats[col_begin]:
+                    format_name = row_formats[col_begin]
+                    if format_name:
+                        rc_format = self._formats.get(format_name)
+                    else:
+                        rc_format = None
+                    row_runs.append((col_begin, col, rc_format))
+                    col_begin = col
+            self._row_runs[row_formats] = row_runs
+        return row_runs
 
     def _add_rows(self, worksheet, rows, *, row_offset=0, formats=None, formula_offset=0):
+        def write_formula(worksheet, r, c, formula, rc_format):
+            return worksheet.write_formula(r, c, formula.get_formula(offset=formula_offset), rc_format, formula.value)
+        worksheet.add_write_handler(Formula, write_formula)
+
         num_rows = 0
-        for ridx, row in enumerate(rows):
-            r = row_offset + ridx
+        for r, row in enumerate(rows, row_offset):
             num_rows += 1
-            for c, col in enumerate(row):
-                rc_format = None
-                if formats:
-                    format_name = formats.get_format(r, c)
-                    if format_name:
-                        rc_format = self._formats.get(format_name)
-                if isinstance(col, Formula):
-                    worksheet.write(r, c, col.get_formula(offset=formula_offset), rc_format, col.value)
+            num_cols = len(row)
+            if formats:
+                row_formats = formats.row_formats(r, num_cols)
+            else:
+                row_formats = (None, ) * num_cols
+            for col_begin, col_end, rc_format in self.get_row_runs(row_formats):
+                if col_begin == 0 and col_end == num_cols:
+                    worksheet.write_row(r, 0, row, rc_format)
                 else:
-                    worksheet.write(r, c, col, rc_format)
+                    worksheet.write_row(r, col_begin, row[col_begin:col_end], rc_format)
         return num_rows
 
     def _add_xxxlogue(self, worksheet, row_offset, xxxlogue, formats, pre, post):
@@ -121,9 +167,14 @@ class XlsxDocument(BaseDocument):
         #    #worksheet.merge_range(rrfirst, row_offset, 0, 100, '\n'.join(" ".join(row) for row in prologue))
         row_offset, added_offset = self._add_prologue(worksheet, row_offset, prologue, formats)
         formula_offset = added_offset + 1  # row numbering starts with 1
-        rows = tuple(page_template.transform(data))
-        if rows:
-            lengths = [max(len(str(entry[c])) for entry in rows) for c, f in enumerate(page_template.field_names)]
+        rows = page_template.transform(data)
+        if self.constant_memory:
+            sample = tuple(itertools.islice(rows, page_template.sample_size))
+            rows = itertools.chain(sample, rows)
+        else:
+            rows = sample = tuple(rows)
+        if sample:
+            lengths = [max(len(str(entry[c])) for entry in sample) for c, f in enumerate(page_template.field_names)]
             for c, length in enumerate(lengths):
                 l = 8.43 * length / 6
                 worksheet.set_column(c, c, l)
@@ -35,68 +35,20 @@ from .error import InvoiceUndefinedFieldError, \
                    InvoiceMissingTaxError, \
                    InvoiceSyntaxError
 
-from .validation_result import ValidationResult
+from .validation_result import ValidationResult, ValidationMessage
+from .tax_code import check_tax_code, KIND_VAT_NUMBER, ERROR_LENGTH, ERROR_SYMBOLS
 from . import conf
 
-InvoiceNamedTuple = collections.namedtuple('InvoiceNamedTuple', conf.FIELD_NAMES)
-
-_TAX_CODE_EVEN_ODD = {
-    'A':	(0,	1),
-    'B':	(1,	0),
-    'C':	(2,	5),
-    'D':	(3,	7),
-    'E':	(4,	9),
-    'F':	(5,	13),
-    'G':	(6,	15),
-    'H':	(7,	17),
-    'I':	(8,	19),
-    'J':	(9,	21),
-    'K':	(10,	2),
-    'L':	(11,	4),
-    'M':	(12,	18),
-    'N':	(13,	20),
-    'O':	(14,	11),
-    'P':	(15,	3),
-    'Q':	(16,	6),
-    'R':	(17,	8),
-    'S':	(18,	12),
-    'T':	(19,	14),
-    'U':	(20,	16),
-    'V':	(21,	10),
-    'W':	(22,	22),
-    'X':	(23,	25),
-    'Y':	(24,	24),
-    'Z':	(25,	23),
-}
-
-for digit in range(10):
-    letter = chr(ord('A') + digit)
-    _TAX_CODE_EVEN_ODD[str(digit)] = _TAX_CODE_EVEN_ODD[letter]
-
-_TAX_CODE_CONTROL_LETTER = {i: chr(i + ord('A')) for i in range(26)}
-
+def _parse_filter_date(x):
+    return datetime.datetime.strptime(x, '%Y-%m-%d').date()
 
-def _cin_personal(tax_code):
-    # control internal number for personal tax_code
-    s = 0
-    for c, symbol in enumerate(tax_code[:-1]):
-        s += _TAX_CODE_EVEN_ODD[symbol][(c + 1) % 2]
-    cin = _TAX_CODE_CONTROL_LETTER[s % 26]
-    return cin
-
-
-def _cin_luhn(tax_code):
-    # control internal number for vat number
-    digits = [int(i) for i in tax_code]
-    control_digit = digits.pop(-1)
-    value_x = sum(digits[0::2])
-    value_y = sum(((2 * i) % 9) for i in digits[1::2])
-    value_t = (value_x + value_y) % 10
-    value_c = (10 - value_t) % 10
-    return str(value_c)
 
+InvoiceNamedTuple = collections.namedtuple('InvoiceNamedTuple', conf.FIELD_NAMES)
 
 class Invoice(InvoiceNamedTuple):
+    # to be incremented when the validate() rules change
+    VALIDATION_RULES_VERSION = 1
+
     def _asdict(self):
         return collections.OrderedDict(((field, getattr(self, field)) for field in self._fields))
     __dict__ = property(_asdict)
@@ -110,40 +62,63 @@ class Invoice(InvoiceNamedTuple):
         return conf.REV_FIELD_TRANSLATION.get(field_translation, field_translation)
 
     @classmethod
-    def compile_filter_function(cls, function_source):
+    def compile_filter_code(cls, function_source):
         try:
-            function_code = compile(function_source, '<string>', 'eval')
+            return compile(function_source, '<string>', 'eval')
         except SyntaxError as err:
             raise InvoiceSyntaxError("funzione filtro {!r} non valida".format(function_source), "funzione filter non valida", function_source, err)
+
+    @classmethod
+    def make_filter_function(cls, function_code):
         def filter(invoice):
-            d = invoice._asdict()
-            d['Date'] = lambda x: datetime.datetime.strptime(x, '%Y-%m-%d').date()
-            d['Weekday'] = conf.WEEKDAY_NUMBER
-            for field_name, name in conf.FIELD_TRANSLATION.items():
-                if field_name != name:
-                    d[name] = d[field_name]
-            locals().update(datetime=datetime, **d)
-            return eval(function_code)
+            return cls.eval_filter_code(function_code, invoice.filter_namespace())
+        filter.function_code = function_code
         return filter
 
-    def validate(self, validation_result):
+    @classmethod
+    def compile_filter_function(cls, function_source):
+        return cls.make_filter_function(cls.compile_filter_code(function_source))
+
+    @classmethod
+    def eval_filter_code(cls, function_code, namespace):
+        return eval(function_code, globals(), namespace)
+
+    def filter_namespace(self):
+        """filter_namespace() -> dict
+           The names available to filter functions; the same namespace can
+           be shared by all the functions evaluated on this invoice.
+        """
+        d = dict(zip(self._fields, self))
+        d['Date'] = _parse_filter_date
+        d['Weekday'] = conf.WEEKDAY_NUMBER
+        for field_name, name in conf.FIELD_TRANSLATION.items():
+            if field_name != name:
+                d[name] = d[field_name]
+        d['datetime'] = datetime
+        return d
+
+    def validate(self, validation_result, tax_code_check=None):
+        """validate(validation_result, tax_code_check=None) -> validation_result
+           Per-invoice checks; tax_code_check is the TaxCodeCheck of the
+           invoice tax code, if already available.
+        """
         for key in self._fields:
             val = getattr(self, key)
             if val is None:
                 validation_result.add_error(
                     invoice=self,
                     exc_type=InvoiceUndefinedFieldError,
-                    message="fattura {}: il campo {!r} non è definito".format(self.doc_filename, self.get_field_translation(key)))
+                    message=ValidationMessage("fattura {}: il campo {!r} non è definito", self.doc_filename, self.get_field_translation(key)))
         if self.currency != 'euro':
             validation_result.add_error(
                     invoice=self,
                     exc_type=InvoiceUnsupportedCurrencyError,
-                    message="fattura {}: la valuta {!r} non è supportata".format(self.doc_filename, self.currency))
+                    message=ValidationMessage("fattura {}: la valuta {!r} non è supportata", self.doc_filename, self.currency))
         if self.date is not None and self.date.year != self.year:
             validation_result.add_error(
                     invoice=self,
                     exc_type=InvoiceYearError,
-                    message="fattura {}: data {} e anno {} sono incompatibili".format(self.doc_filename, self.date, self.year))
+                    message=ValidationMessage("fattura {}: data {} e anno {} sono incompatibili", self.doc_filename, self.date, self.year))
         income_parts = conf.DERIVATIVES['income']
         income_values = [getattr(self, part) for part in income_parts]
         expected_income = sum(v for v in income_values if v is not None)
@@ -152,7 +127,7 @@ class Invoice(InvoiceNamedTuple):
             validation_result.add_error(
                     invoice=self,
                     exc_type=InvoiceInconsistentIncomeError,
-                    message="fattura {}: incasso non coerente: {} - totale:{} - atteso:{}".format(self.doc_filename, parts, self.income, expected_income))
+                    message=ValidationMessage("fattura {}: incasso non coerente: {} - totale:{} - atteso:{}", self.doc_filename, parts, self.income, expected_income))
         ndecimals = 2
         change_date = datetime.date(2024, 10, 7)  # after this date, the cpa must be computed including the taxes (a.k.a. bolli)
         for key in "cpa", "vat", "deduction":
@@ -179,7 +154,7 @@ class Invoice(InvoiceNamedTuple):
                     validation_result.add_error(
                             invoice=self,
                             exc_type=error_class,
-                            message="fattura {d}: {f} {v} non corretto: sorgente: {s} = {t} - percentuale: {p}% - atteso:{e}".format(
+                            message=ValidationMessage("fattura {d}: {f} {v} non corretto: sorgente: {s} = {t} - percentuale: {p}% - atteso:{e}",
                                 d=self.doc_filename,
                                 f=self.get_field_translation(key),
                                 v=val,
@@ -197,7 +172,7 @@ class Invoice(InvoiceNamedTuple):
                     else:
                         exceptions = []
                     if 'no-bollo' not in exceptions:
-                        message = "fattura {}: imponibile={}, iva={}, ritenuta={}, bolli={}: è richiesto un bollo di almeno 2 euro".format(
+                        message = ValidationMessage("fattura {}: imponibile={}, iva={}, ritenuta={}, bolli={}: è richiesto un bollo di almeno 2 euro",
                             self.doc_filename,
                             taxable_income,
                             self.vat,
@@ -211,82 +186,37 @@ class Invoice(InvoiceNamedTuple):
 
         tax_code = self.tax_code
         if tax_code:
-            valid_tax_code = True
-            # length check
-
-            cin_function = None
-            if valid_tax_code:
-                # è una partita iva?
-                if len([ch for ch in tax_code if ch not in set('0123456789')]) == 0:
-                    # partita iva
-                    cin_function = _cin_luhn
-                    if len(tax_code) != 11:
-                        message = "fattura {}: partita iva {!r} non corretto: la lunghezza è {!r}, non 11 come richiesto".format(
-                            self.doc_filename,
-                            tax_code,
-                            len(tax_code),
-                        )
-                        validation_result.add_error(
-                            invoice=self,
-                            exc_type=InvoiceMalformedTaxCodeError,
-                            message=message)
-                        valid_tax_code = False
-                else:
-                    if len(tax_code) != 16:
-                        message = "fattura {}: codice fiscale {!r} non corretto: la lunghezza è {!r}, non 16 come richiesto".format(
-                            self.doc_filename,
-                            tax_code,
-                            len(tax_code),
-                        )
-                        validation_result.add_error(
-                            invoice=self,
-                            exc_type=InvoiceMalformedTaxCodeError,
-                            message=message)
-                        valid_tax_code = False
+            if tax_code_check is None:
+                tax_code_check = check_tax_code(tax_code)
+            if not tax_code_check.valid:
+                if tax_code_check.error == ERROR_LENGTH:
+                    if tax_code_check.kind == KIND_VAT_NUMBER:
+                        message = "fattura {}: partita iva {!r} non corretto: la lunghezza è {!r}, non {} come richiesto"
                     else:
-                        cin_function = _cin_personal
-                        # symbols check
-                        expected_ch = 'LLLLLLNNLNNLNNNL'
-                        error_fmt = '[{}]'
-                        success_fmt = '{}'
-                        error_l = []
-                        num_errors = 0
-                        for ch, expected_ch in zip(tax_code, expected_ch):
-                            error = False
-                            if expected_ch == 'L' and not (ord('A') <= ord(ch) <= ord('Z')):
-                                error = True
-                            elif expected_ch == 'N' and not (ord('0') <= ord(ch) <= ord('9')):
-                                error = True
-                            if error:
-                                error_l.append(error_fmt.format(ch))
-                                num_errors += 1
-                            else:
-                                error_l.append(success_fmt.format(ch))
-                        if num_errors:
-                            message = "fattura {}: codice fiscale {!r} non corretto: i caratteri non corretti sono {!r}".format(
-                                self.doc_filename,
-                                tax_code,
-                                ''.join(error_l),
-                            )
-                            validation_result.add_error(
-                                invoice=self,
-                                exc_type=InvoiceMalformedTaxCodeError,
-                                message=message)
-                            valid_tax_code = False
-
-            if valid_tax_code:
-                # control letter check
-                cin = cin_function(tax_code)
-                if cin != tax_code[-1]:
-                    message = "fattura {}: codice fiscale {!r} non corretto: il carattere di controllo è {!r}, non {!r} come atteso".format(
+                        message = "fattura {}: codice fiscale {!r} non corretto: la lunghezza è {!r}, non {} come richiesto"
+                    message = ValidationMessage(message,
+                        self.doc_filename,
+                        tax_code,
+                        len(tax_code),
+                        tax_code_check.expected,
+                    )
+                elif tax_code_check.error == ERROR_SYMBOLS:
+                    positions = tax_code_check.positions
+                    message = ValidationMessage("fattura {}: codice fiscale {!r} non corretto: i caratteri non corretti sono {!r}",
+                        self.doc_filename,
+                        tax_code,
+                        ''.join('[{}]'.format(ch) if position in positions else ch for position, ch in enumerate(tax_code)),
+                    )
+                else:
+                    message = ValidationMessage("fattura {}: codice fiscale {!r} non corretto: il carattere di controllo è {!r}, non {!r} come atteso",
                         self.doc_filename,
                         tax_code,
                         tax_code[-1],
-                        cin,
+                        tax_code_check.expected,
                     )
-                    validation_result.add_error(
-                        invoice=self,
-                        exc_type=InvoiceMalformedTaxCodeError,
-                        message=message)
+                validation_result.add_error(
+                    invoice=self,
+                    exc_type=InvoiceMalformedTaxCodeError,
+                    message=message)
         return validation_result
 
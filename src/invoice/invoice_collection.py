@@ -19,7 +19,10 @@ __author__ = "Simone Campagna"
 __all__ = [
     'InvoiceCollection',
 ]
+import bisect
 import datetime
+import heapq
+import operator
 
 from .error import InvoiceError, \
                    InvoiceMultipleNamesError, \
@@ -29,13 +32,18 @@ from .error import InvoiceError, \
                    InvoiceUnsupportedCurrencyError
 
 from .invoice import Invoice
+from .columnar import read_columnar
 from .log import get_default_logger
 
 class InvoiceCollection(object):
+    DATE_MIN = datetime.date.min
+
     def __init__(self, init=None, logger=None):
         self._invoices = []
-        self._sorted = False
-        self._years = []
+        self._keys = []
+        self._num_sorted = 0
+        self._year_set = set()
+        self._years = ()
         if logger is None:
             logger = get_default_logger()
         self.logger = logger
@@ -52,18 +60,73 @@ class InvoiceCollection(object):
     def __getitem__(self, index):
         return self._invoices[index]
 
+    @classmethod
+    def _from_keys(cls, invoices, keys, num_sorted, logger):
+        # keys are already computed; the first num_sorted invoices are sorted
+        invoice_collection = cls(logger=logger)
+        invoice_collection._invoices = invoices
+        invoice_collection._keys = keys
+        invoice_collection._num_sorted = num_sorted
+        invoice_collection._year_set = set(key[0] for key in keys if key[0] != -1)
+        invoice_collection._years = None
+        return invoice_collection
+
+    @classmethod
+    def _from_sorted(cls, invoices, keys, logger):
+        # invoices are already sorted and keys are already computed
+        return cls._from_keys(invoices, keys, len(invoices), logger)
+
+    @classmethod
+    def from_columns(cls, columns, logger=None):
+        """from_columns(columns, logger=None) -> InvoiceCollection
+           Builds the collection from a list of values for each Invoice
+           field, as if the invoices were added one at a time; the sort
+           keys are computed column by column.
+        """
+        invoices = list(map(Invoice._make, zip(*columns)))
+        key_columns = []
+        for field_name, substitution in ('year', -1), ('number', -1), ('date', cls.DATE_MIN):
+            values = columns[Invoice._fields.index(field_name)]
+            if None in values:
+                values = [substitution if value is None else value for value in values]
+            key_columns.append(values)
+        keys = list(zip(*key_columns))
+        return cls._from_keys(invoices, keys, 0, logger=logger)
+
+    @classmethod
+    def from_columnar(cls, file, logger=None):
+        """from_columnar(file, logger=None) -> InvoiceCollection
+           Loads the invoices exported by write_columnar (the 'export'
+           command); fields missing from the file are None.
+        """
+        field_names, rows = read_columnar(file)
+        indices = [field_names.index(field_name) if field_name in field_names else None for field_name in Invoice._fields]
+        if indices == list(range(len(Invoice._fields))):
+            make_invoice = Invoice._make
+        else:
+            make_invoice = lambda row: Invoice._make(None if index is None else row[index] for index in indices)
+        return cls(map(make_invoice, rows), logger=logger)
+
     def add(self, invoice):
         if not isinstance(invoice, Invoice): # pragma: no cover
             raise TypeError("{}.add(...): oggetto {!r} di tipo {} non valido".format(self.__class__.__name__, invoice, type(invoice).__name__))
         self._invoices.append(invoice)
-        self._sorted = False
+        self._keys.append(self.sort_key(invoice))
+        if invoice.year is not None and invoice.year not in self._year_set:
+            self._year_set.add(invoice.year)
+            self._years = None
 
     def filter(self, filter_function):
         if isinstance(filter_function, str):
             filter_function = Invoice.compile_filter_function(filter_function)
-        invoice_collection = InvoiceCollection(filter(filter_function, self._invoices), logger=self.logger)
-        invoice_collection.sort()
-        return invoice_collection
+        self.sort()
+        invoices = []
+        keys = []
+        for invoice, key in zip(self._invoices, self._keys):
+            if filter_function(invoice):
+                invoices.append(invoice)
+                keys.append(key)
+        return self._from_sorted(invoices, keys, logger=self.logger)
 
     @classmethod
     def subst_None(cls, value, substitution):
@@ -72,15 +135,41 @@ class InvoiceCollection(object):
         else:
             return value
 
+    @classmethod
+    def sort_key(cls, invoice):
+        subst_None = cls.subst_None
+        return (subst_None(invoice.year, -1),
+                subst_None(invoice.number, -1),
+                subst_None(invoice.date, cls.DATE_MIN))
+
+    def is_sorted(self):
+        return self._num_sorted == len(self._invoices)
+
     def sort(self):
-        if not self._sorted:
-            date_min = datetime.date.min
-            self._invoices.sort(key=lambda invoice: self.subst_None(invoice.date, date_min))
-            self._invoices.sort(key=lambda invoice: self.subst_None(invoice.number, -1))
-            self._invoices.sort(key=lambda invoice: self.subst_None(invoice.year, -1))
-            self._years = tuple(sorted(set(invoice.year for invoice in self._invoices if invoice.year is not None)))
-            self._sorted = True
+        num_sorted = self._num_sorted
+        if num_sorted < len(self._invoices):
+            # invoices added after the last sort are sorted alone and then
+            # merged into the already sorted ones; both sort and merge are
+            # stable, so the result is the same as a full sort
+            get_key = operator.itemgetter(0)
+            added = sorted(zip(self._keys[num_sorted:], self._invoices[num_sorted:]), key=get_key)
+            if num_sorted:
+                items = list(heapq.merge(zip(self._keys[:num_sorted], self._invoices[:num_sorted]), added, key=get_key))
+            else:
+                items = added
+            self._keys = [key for key, invoice in items]
+            self._invoices = [invoice for key, invoice in items]
+            self._num_sorted = len(self._invoices)
+
+    def year_invoices(self, year):
+        # the invoices of the year are contiguous in the sorted collection
+        self.sort()
+        keys = self._keys
+        first = bisect.bisect_left(keys, (year, ))
+        last = bisect.bisect_left(keys, (year + 1, ), first)
+        return self._invoices[first:last]
 
     def years(self):
+        if self._years is None:
+            self._years = tuple(sorted(self._year_set))
         return self._years
-
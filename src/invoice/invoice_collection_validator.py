@@ -0,0 +1,622 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'YearNumbering',
+    'evaluate_user_validators',
+    'ValidationState',
+    'InvoiceCollectionValidator',
+]
+
+import collections
+import concurrent.futures
+import hashlib
+
+from .error import InvoiceDateError, \
+                   InvoiceMultipleNamesError, \
+                   InvoiceMultipleTaxCodesError, \
+                   InvoiceMultipleInvoicesPerDayError, \
+                   InvoiceWrongNumberError, \
+                   InvoiceDuplicatedNumberError, \
+                   InvoiceUserValidatorError
+from .invoice import Invoice
+from .log import get_default_logger
+from .tax_code import check_tax_codes
+from .validation_result import ValidationRecorder, ValidationMessage
+
+
+class _DuplicatedInvoices(object):
+    # the invoices with the same number, joined only when the message is
+    # rendered; the list of invoices only grows, so its current length is
+    # enough to take a snapshot
+    __slots__ = ('number', 'invoices', 'count')
+
+    def __init__(self, number, invoices):
+        self.number = number
+        self.invoices = invoices
+        self.count = len(invoices)
+
+    def __str__(self):
+        return ', '.join("{}:{}".format(self.number, invoice.doc_filename) for invoice in self.invoices[:self.count])
+
+    def __format__(self, format_spec):
+        return format(str(self), format_spec)
+
+    def __reduce__(self):
+        return str, (str(self), )
+
+
+class YearNumbering(object):
+    """YearNumbering(year, expected_number=1, prev_doc=None, prev_date=None)
+       Numbering state of a single year: the next expected number, the
+       numbers already assigned and the last validated invoice.
+    """
+    def __init__(self, year, expected_number=1, prev_doc=None, prev_date=None):
+        self.year = year
+        self.expected_number = expected_number
+        self.numbers = {}
+        self.prev_doc = prev_doc
+        self.prev_date = prev_date
+
+    def state(self):
+        return self.expected_number, self.prev_doc, self.prev_date
+
+    def check(self, validation_result, invoice, user_validators=(), failed_validators=None):
+        year = self.year
+        numbers = self.numbers
+        expected_number = self.expected_number
+        failed = False
+        if invoice.number != expected_number:
+            if invoice.number in numbers:
+                validation_result.add_error(invoice, InvoiceDuplicatedNumberError,
+                    ValidationMessage("fattura {i}: il numero {y}/{n} è duplicato [presente anche in {l}]",
+                        i=invoice.doc_filename,
+                        y=year,
+                        n=invoice.number,
+                        l=_DuplicatedInvoices(invoice.number, numbers[invoice.number])))
+                failed = True
+            else:
+                validation_result.add_error(invoice, InvoiceWrongNumberError,
+                    ValidationMessage("fattura {i}: il numero {y}/{n} non è valido (il numero atteso è {e})",
+                        i=invoice.doc_filename,
+                        y=year,
+                        n=invoice.number,
+                        e=expected_number))
+                failed = True
+        if self.prev_date is not None:
+            if invoice.date is not None and invoice.date < self.prev_date:
+                validation_result.add_error(invoice, InvoiceDateError, ValidationMessage("fattura {}: la data {} precede quella della precedente fattura {} ({})", invoice.doc_filename, invoice.date, self.prev_doc, self.prev_date))
+                failed = True
+        if failed_validators is None:
+            failed_validators = evaluate_user_validators([invoice], user_validators)[0]
+        for validator in failed_validators:
+            validation_result.add_error(invoice, InvoiceUserValidatorError, ValidationMessage("fattura {}: {}", invoice.doc_filename, validator.message))
+            failed = True
+        if not failed:
+            self.expected_number += 1
+            numbers.setdefault(invoice.number, []).append(invoice)
+            self.prev_doc, self.prev_date = invoice.doc_filename, invoice.date
+        return not failed
+
+
+def evaluate_user_validators(invoices, user_validators):
+    """evaluate_user_validators(invoices, user_validators) -> list
+       Applies all the user validators to the invoices in a single pass;
+       returns, for each invoice, the list of the validators whose check
+       function fails. The filter namespace of each invoice is built once
+       and shared by all the filter and check functions.
+    """
+    functions = []
+    for validator, compiled_validator in user_validators:
+        functions.append((validator,
+                          getattr(compiled_validator.filter_function, 'function_code', None),
+                          getattr(compiled_validator.check_function, 'function_code', None),
+                          compiled_validator))
+    result = []
+    if not functions:
+        return [[] for invoice in invoices]
+    eval_filter_code = Invoice.eval_filter_code
+    for invoice in invoices:
+        namespace = None
+        failed_validators = []
+        for validator, filter_code, check_code, compiled_validator in functions:
+            if filter_code is None or check_code is None:
+                # not compiled by Invoice.compile_filter_function
+                if compiled_validator.filter_function(invoice) and not compiled_validator.check_function(invoice):
+                    failed_validators.append(validator)
+                continue
+            if namespace is None:
+                namespace = invoice.filter_namespace()
+            if eval_filter_code(filter_code, namespace) and not eval_filter_code(check_code, namespace):
+                failed_validators.append(validator)
+        result.append(failed_validators)
+    return result
+
+
+ValidatorSource = collections.namedtuple('ValidatorSource', ('filter_function', 'check_function', 'message'))
+
+
+def _tax_code_checks(invoices):
+    # the distinct tax codes are checked in a single batch
+    tax_codes = list(set(invoice.tax_code for invoice in invoices if invoice.tax_code))
+    return dict(zip(tax_codes, check_tax_codes(tax_codes)))
+
+
+def _validate_invoices(invoices):
+    # worker: per-invoice checks
+    entries_list = []
+    tax_code_checks = _tax_code_checks(invoices)
+    for invoice in invoices:
+        recorder = ValidationRecorder()
+        invoice.validate(validation_result=recorder, tax_code_check=tax_code_checks.get(invoice.tax_code))
+        entries_list.append(recorder.entries)
+    return entries_list
+
+
+def _check_year(year, invoices, failing_indices, validator_sources):
+    # worker: numbering, dates and user validators of a single year
+    user_validators = []
+    for filter_source, check_source, message in validator_sources:
+        user_validators.append((ValidatorSource(filter_source, check_source, message),
+                                ValidatorSource(Invoice.compile_filter_function(filter_source),
+                                                Invoice.compile_filter_function(check_source),
+                                                message)))
+    year_numbering = YearNumbering(year)
+    entries = []
+    indices = [index for index in range(len(invoices)) if index not in failing_indices]
+    failed_validators_list = evaluate_user_validators([invoices[index] for index in indices], user_validators)
+    for index, failed_validators in zip(indices, failed_validators_list):
+        recorder = ValidationRecorder()
+        year_numbering.check(recorder, invoices[index], failed_validators=failed_validators)
+        entries.extend((index, kind, exc_type, message) for kind, exc_type, message in recorder.entries)
+    return year_numbering.state(), entries
+
+
+class ValidationState(object):
+    """ValidationState(fingerprint, invoice_count=0)
+       Derived validation state of the stored invoices: the numbering state
+       of each year, the number of invoices for each (tax_code, name) and
+       for each (tax_code, date), and the name and same-day warnings of each
+       invoice, as (source, exc_type, message) entries. The fingerprint
+       identifies the validation rules the state has been computed with.
+       When changes are tracked, the changed (tax_code, name) and
+       (tax_code, date) keys are recorded, so that only these have to be
+       stored.
+    """
+    SOURCE_NAMES = 'names'
+    SOURCE_DAYS = 'days'
+
+    def __init__(self, fingerprint, invoice_count=0):
+        self.fingerprint = fingerprint
+        self.invoice_count = invoice_count
+        self.years = {}
+        self.client_names = {}
+        self.client_days = {}
+        self.warnings = {}
+        self.changed_client_names = None
+        self.changed_client_days = None
+
+    @classmethod
+    def make_fingerprint(cls, validation_result, user_validators=()):
+        rules = (
+            Invoice.VALIDATION_RULES_VERSION,
+            tuple(validation_result.warning_mode),
+            tuple(validation_result.error_mode),
+            tuple(sorted(validation_result.changed_tax_codes)),
+            tuple(tuple(validator) for validator, compiled_validator in user_validators),
+        )
+        return hashlib.sha1(repr(rules).encode('utf-8')).hexdigest()
+
+    def track_changes(self):
+        self.changed_client_names = set()
+        self.changed_client_days = set()
+
+    def add(self, invoice):
+        name_key = (invoice.tax_code, invoice.name)
+        self.client_names[name_key] = self.client_names.get(name_key, 0) + 1
+        day_key = (invoice.tax_code, invoice.date)
+        self.client_days[day_key] = self.client_days.get(day_key, 0) + 1
+        if self.changed_client_names is not None:
+            self.changed_client_names.add(name_key)
+            self.changed_client_days.add(day_key)
+
+    def name_maps(self):
+        tax_code_names = {}
+        name_tax_codes = {}
+        for (tax_code, name), count in self.client_names.items():
+            tax_code_names.setdefault(tax_code, {})[name] = count
+            name_tax_codes.setdefault(name, {})[tax_code] = count
+        return tax_code_names, name_tax_codes
+
+
+class InvoiceCollectionValidator(object):
+    """InvoiceCollectionValidator(validation_result, user_validators=(), logger=None, validation_cache=None, jobs=1)
+       Validates an invoice collection with a single pass over the sorted
+       invoices; during the pass the per-invoice checks are applied, and
+       the name/tax_code associations, the per-(client, day) invoices and
+       the per-year invoices are collected. The same-day and numbering
+       checks are then applied to the collected groups.
+       The incremental validation uses the ValidationState of the stored
+       invoices to recheck only the years and the clients touched by the
+       added, modified or removed invoices; the warnings of the other
+       invoices are replayed from the ValidationState.
+       If a ValidationCache is given, the per-invoice checks of unchanged
+       invoices are replayed from the cache; the tax codes of the validated
+       invoices are checked in a single batch, once per distinct tax code.
+       With jobs > 1 the full validation runs the per-invoice checks and
+       the per-year checks on a pool of worker processes, sharded by year;
+       the entries returned by the workers are replayed in the same order
+       of the serial validation, so the result (and the first raised
+       error) does not change.
+    """
+    def __init__(self, validation_result, user_validators=(), logger=None, validation_cache=None, jobs=1):
+        if logger is None:
+            logger = get_default_logger()
+        self.logger = logger
+        self.validation_result = validation_result
+        self.user_validators = user_validators
+        self.validation_cache = validation_cache
+        if jobs is None:
+            jobs = 1
+        self.jobs = jobs
+        self.tax_code_names = {}
+        self.name_tax_codes = {}
+        self.client_days = collections.OrderedDict()
+        self.year_invoices = collections.OrderedDict()
+        self.year_numberings = {}
+        self.warning_entries = collections.OrderedDict()
+        self.tax_code_checks = {}
+        self._invoice_collection = None
+        self._base_state = None
+        self._touched_invoices = None
+        self._appended = False
+
+    def validate_invoice(self, invoice):
+        tax_code_check = self.tax_code_checks.get(invoice.tax_code)
+        if self.validation_cache is None:
+            invoice.validate(validation_result=self.validation_result, tax_code_check=tax_code_check)
+        else:
+            self.validation_cache.validate(invoice, self.validation_result, tax_code_check=tax_code_check)
+
+    def add(self, invoice):
+        self.validate_invoice(invoice)
+        self.check_names(invoice)
+        self.client_days.setdefault((invoice.tax_code, invoice.date), []).append(invoice)
+        if invoice.year is not None:
+            self.year_invoices.setdefault(invoice.year, []).append(invoice)
+
+    def add_warning(self, source, invoice, exc_type, message):
+        self.warning_entries.setdefault(invoice.doc_filename, []).append((source, exc_type, message))
+        self.validation_result.add_warning(invoice, exc_type, message)
+
+    def replay_warnings(self, source, invoice, warnings):
+        for w_source, exc_type, message in warnings.get(invoice.doc_filename, ()):
+            if w_source == source:
+                self.add_warning(source, invoice, exc_type, message)
+
+    def check_names(self, invoice, emit=True):
+        # verify first/last name exchange:
+        validation_result = self.validation_result
+        tnd = self.tax_code_names
+        ntd = self.name_tax_codes
+        if emit and invoice.tax_code in tnd:
+            nd = tnd[invoice.tax_code]
+            for i_name, i_count in nd.items():
+                if i_name != invoice.name:
+                    if validation_result.changed_tax_codes is None or invoice.tax_code not in validation_result.changed_tax_codes:
+                        message = ValidationMessage("fattura {f}: il codice_fiscale {t!r} è associato al nome {n!r}, mentre è stato associato ad un altro nome {pn!r} in #{c} fatture",
+                            f=invoice.doc_filename,
+                            t=invoice.tax_code,
+                            n=invoice.name,
+                            pn=i_name,
+                            c=i_count,
+                        )
+                        self.add_warning(ValidationState.SOURCE_NAMES, invoice, InvoiceMultipleNamesError, message)
+        nd = tnd.setdefault(invoice.tax_code, {})
+        nd[invoice.name] = nd.get(invoice.name, 0) + 1
+        if emit and invoice.name in ntd:
+            td = ntd[invoice.name]
+            for i_tax_code, i_count in td.items():
+                if i_tax_code != invoice.tax_code:
+                    message = ValidationMessage("fattura {f}: il nome {n!r} è associato al codice_fiscale {t!r}, mentre è stato associato ad un altro codice_fiscale {pt!r} in #{c} fatture",
+                        f=invoice.doc_filename,
+                        t=invoice.tax_code,
+                        n=invoice.name,
+                        pt=i_tax_code,
+                        c=i_count,
+                    )
+                    self.add_warning(ValidationState.SOURCE_NAMES, invoice, InvoiceMultipleTaxCodesError, message)
+        td = ntd.setdefault(invoice.name, {})
+        td[invoice.tax_code] = td.get(invoice.tax_code, 0) + 1
+
+    def check_client_days(self):
+        # verify multiple invoices in same day
+        for (tax_code, date), invoices in self.client_days.items():
+            if len(invoices) > 1:
+                for invoice in invoices:
+                    message = ValidationMessage("fattura {f}: sono state emesse {c} fatture nello stesso giorno",
+                        f=invoice.doc_filename,
+                        c=len(invoices),
+                    )
+                    self.add_warning(ValidationState.SOURCE_DAYS, invoice, InvoiceMultipleInvoicesPerDayError, message)
+
+    def check_year(self, year, invoices, year_numbering=None):
+        # verify numbering and dates
+        validation_result = self.validation_result
+        failing_invoices = validation_result.failing_invoices()
+        if year_numbering is None:
+            year_numbering = YearNumbering(year)
+        invoices = [invoice for invoice in invoices if invoice.doc_filename not in failing_invoices]
+        failed_validators_list = evaluate_user_validators(invoices, self.user_validators)
+        for invoice, failed_validators in zip(invoices, failed_validators_list):
+            year_numbering.check(validation_result, invoice, failed_validators=failed_validators)
+        self.year_numberings[year] = year_numbering
+        return year_numbering
+
+    def validate(self, invoice_collection):
+        validation_result = self.validation_result
+        self.logger.debug("validation of {} invoices...".format(len(invoice_collection)))
+        invoice_collection.sort()
+        self._invoice_collection = invoice_collection
+        if self.jobs > 1 and len(invoice_collection.years()) > 1:
+            self.validate_parallel(invoice_collection)
+        else:
+            self.tax_code_checks = _tax_code_checks(invoice_collection)
+            for invoice in invoice_collection:
+                self.add(invoice)
+            self.check_client_days()
+            for year, invoices in self.year_invoices.items():
+                self.check_year(year, invoices)
+        self.logger.debug("validazione di {} fatture completata con {} errori e {} warning".format(
+            len(invoice_collection),
+            validation_result.num_errors(),
+            validation_result.num_warnings()))
+        return validation_result
+
+    def validate_parallel(self, invoice_collection):
+        validation_result = self.validation_result
+        validation_cache = self.validation_cache
+        self.logger.debug("validazione parallela su {} processi...".format(self.jobs))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            futures = []
+            try:
+                # per-invoice checks, sharded by year
+                invoice_entries = [None for invoice in invoice_collection]
+                shards = collections.OrderedDict()
+                for index, invoice in enumerate(invoice_collection):
+                    if validation_cache is not None:
+                        invoice_entries[index] = validation_cache.lookup(invoice)
+                    if invoice_entries[index] is None:
+                        shards.setdefault(invoice.year, []).append(index)
+                for indices in shards.values():
+                    futures.append(executor.submit(_validate_invoices, [invoice_collection[index] for index in indices]))
+                for indices, future in zip(shards.values(), futures):
+                    for index, entries in zip(indices, future.result()):
+                        invoice_entries[index] = entries
+                        if validation_cache is not None:
+                            validation_cache.record(invoice_collection[index], entries)
+                for invoice, entries in zip(invoice_collection, invoice_entries):
+                    validation_result.replay(invoice, entries)
+                    self.check_names(invoice)
+                    self.client_days.setdefault((invoice.tax_code, invoice.date), []).append(invoice)
+                    if invoice.year is not None:
+                        self.year_invoices.setdefault(invoice.year, []).append(invoice)
+                self.check_client_days()
+
+                # numbering, dates and user validators, sharded by year
+                failing_invoices = validation_result.failing_invoices()
+                validator_sources = [tuple(validator) for validator, compiled_validator in self.user_validators]
+                futures = []
+                for year, invoices in self.year_invoices.items():
+                    failing_indices = set(index for index, invoice in enumerate(invoices) if invoice.doc_filename in failing_invoices)
+                    futures.append(executor.submit(_check_year, year, invoices, failing_indices, validator_sources))
+                for (year, invoices), future in zip(self.year_invoices.items(), futures):
+                    state, entries = future.result()
+                    for index, kind, exc_type, message in entries:
+                        validation_result.replay(invoices[index], [(kind, exc_type, message)])
+                    self.year_numberings[year] = YearNumbering(year, *state)
+            finally:
+                # on errors, pending shards are not needed anymore
+                for future in futures:
+                    future.cancel()
+        return validation_result
+
+    def revalidate_user_validators(self, invoice_collection, changed_validators):
+        """revalidate_user_validators(invoice_collection, changed_validators)
+           Targeted validation of the stored (valid) invoices when the user
+           validators have changed: only the changed validators are
+           evaluated on the invoices, and only the years containing an
+           invoice failing them are rechecked, with all the validators.
+           Returns the rechecked years.
+        """
+        self.logger.debug("validazione mirata di {} fatture con {} validatori modificati...".format(len(invoice_collection), len(changed_validators)))
+        invoice_collection.sort()
+        self._invoice_collection = invoice_collection
+        years = set()
+        if changed_validators:
+            for invoice, failed_validators in zip(invoice_collection, evaluate_user_validators(invoice_collection, changed_validators)):
+                if failed_validators:
+                    years.add(invoice.year)
+        years.discard(None)
+        for year in sorted(years):
+            self.check_year(year, invoice_collection.year_invoices(year))
+        return years
+
+    def validate_incremental(self, invoice_collection, validation_state, touched_invoices, replaced_invoices=()):
+        """validate_incremental(invoice_collection, validation_state, touched_invoices, replaced_invoices=())
+           Validates the invoice collection, given the ValidationState of the
+           stored invoices; touched_invoices are the added or modified
+           invoices (contained in invoice_collection), replaced_invoices the
+           stored invoices that have been modified or removed.
+           The result is the same of a full validation: the name and
+           same-day warnings are checked again for the touched clients and
+           days, and replayed from the validation state for the others.
+        """
+        validation_result = self.validation_result
+        self.logger.debug("validazione incrementale di {} fatture su {}...".format(len(touched_invoices), len(invoice_collection)))
+        invoice_collection.sort()
+        self._invoice_collection = invoice_collection
+        self._base_state = validation_state
+        sort_key = invoice_collection.sort_key
+        touched_doc_filenames = set(invoice.doc_filename for invoice in touched_invoices)
+        touched = []
+        untouched = []
+        for invoice in invoice_collection:
+            if invoice.doc_filename in touched_doc_filenames:
+                touched.append(invoice)
+            else:
+                untouched.append(invoice)
+        self._touched_invoices = touched
+        self.tax_code_checks = _tax_code_checks(touched)
+        changed = touched + list(replaced_invoices)
+        tax_codes = set(invoice.tax_code for invoice in changed)
+        names = set(invoice.name for invoice in changed)
+        appended = not replaced_invoices and \
+                   (not untouched or not touched or sort_key(untouched[-1]) < sort_key(touched[0]))
+
+        # per-invoice checks and names: when the touched invoices follow all
+        # the stored ones the name/tax_code associations are taken from the
+        # validation state, otherwise they are rebuilt from the collection
+        self._appended = appended
+        stored_warnings = validation_state.warnings
+        if appended:
+            self.tax_code_names, self.name_tax_codes = validation_state.name_maps()
+            for invoice in untouched:
+                self.replay_warnings(ValidationState.SOURCE_NAMES, invoice, stored_warnings)
+            for invoice in touched:
+                self.validate_invoice(invoice)
+                self.check_names(invoice)
+        else:
+            for invoice in invoice_collection:
+                emit = invoice.tax_code in tax_codes or invoice.name in names
+                if invoice.doc_filename in touched_doc_filenames:
+                    self.validate_invoice(invoice)
+                elif not emit:
+                    self.replay_warnings(ValidationState.SOURCE_NAMES, invoice, stored_warnings)
+                self.check_names(invoice, emit=emit)
+
+        # same-day check on the touched (tax_code, date) groups
+        day_counts = collections.Counter((invoice.tax_code, invoice.date) for invoice in touched)
+        if appended:
+            state_days = validation_state.client_days
+            day_keys = set(key for key, count in day_counts.items() if count + state_days.get(key, 0) > 1)
+            if any(key in state_days for key in day_keys):
+                day_invoices = invoice_collection
+            else:
+                day_invoices = touched
+        else:
+            day_keys = set(day_counts)
+            day_keys.update((invoice.tax_code, invoice.date) for invoice in replaced_invoices)
+            day_invoices = invoice_collection
+        if day_keys:
+            for invoice in day_invoices:
+                key = (invoice.tax_code, invoice.date)
+                if key in day_keys:
+                    self.client_days.setdefault(key, []).append(invoice)
+            self.check_client_days()
+        for invoice in untouched:
+            if (invoice.tax_code, invoice.date) not in day_keys:
+                self.replay_warnings(ValidationState.SOURCE_DAYS, invoice, stored_warnings)
+
+        # numbering: the touched years are rechecked; when the touched
+        # invoices follow the stored ones the numbering state of the year
+        # is taken from the validation state
+        failing_invoices = validation_result.failing_invoices()
+        replaced_years = set(invoice.year for invoice in replaced_invoices)
+        failing_years = set(invoice.year for doc_filename, invoice in failing_invoices.items() if doc_filename not in touched_doc_filenames)
+        year_touched = collections.OrderedDict()
+        for invoice in touched:
+            year_touched.setdefault(invoice.year, []).append(invoice)
+        years = set(year_touched).union(replaced_years, failing_years)
+        years.discard(None)
+        for year in sorted(years):
+            invoices = invoice_collection.year_invoices(year)
+            t_invoices = year_touched.get(year, [])
+            year_numbering = None
+            if t_invoices and year not in replaced_years and year not in failing_years:
+                num_untouched = len(invoices) - len(t_invoices)
+                if num_untouched == 0:
+                    invoices = t_invoices
+                elif year in validation_state.years and \
+                     all(a is b for a, b in zip(invoices[num_untouched:], t_invoices)):
+                    expected_number, prev_doc, prev_date = validation_state.years[year]
+                    if min(invoice.number for invoice in t_invoices) >= expected_number:
+                        year_numbering = YearNumbering(year, expected_number=expected_number, prev_doc=prev_doc, prev_date=prev_date)
+                        invoices = t_invoices
+            self.check_year(year, invoices, year_numbering=year_numbering)
+        self.logger.debug("validazione incrementale di {} fatture completata con {} errori e {} warning".format(
+            len(touched),
+            validation_result.num_errors(),
+            validation_result.num_warnings()))
+        return validation_result
+
+    def validated_warnings(self, failing_invoices):
+        """validated_warnings(failing_invoices) -> dict
+           The name and same-day warnings of the validated invoices, as
+           they are emitted when the failing invoices are not present.
+        """
+        recorder = ValidationRecorder()
+        recorder.changed_tax_codes = self.validation_result.changed_tax_codes
+        validator = InvoiceCollectionValidator(recorder, logger=self.logger)
+        for invoice in self._invoice_collection:
+            if invoice.doc_filename not in failing_invoices:
+                validator.check_names(invoice)
+                validator.client_days.setdefault((invoice.tax_code, invoice.date), []).append(invoice)
+        validator.check_client_days()
+        return dict(validator.warning_entries)
+
+    def make_validation_state(self, fingerprint, invoice_count=0):
+        """make_validation_state(fingerprint, invoice_count=0)
+           Returns the ValidationState of the validated invoices, failing
+           invoices excluded.
+        """
+        failing_invoices = self.validation_result.failing_invoices()
+        invoice_collection = self._invoice_collection
+        base_state = self._base_state
+        if base_state is not None and self._appended:
+            touched_doc_filenames = set(invoice.doc_filename for invoice in self._touched_invoices)
+            if any(doc_filename not in touched_doc_filenames for doc_filename in failing_invoices):
+                base_state = None
+        if base_state is not None and self._appended:
+            # only the touched invoices have to be added
+            validation_state = base_state
+            validation_state.fingerprint = fingerprint
+            validation_state.invoice_count = invoice_count
+            validation_state.track_changes()
+            for invoice in self._touched_invoices:
+                if invoice.doc_filename not in failing_invoices:
+                    validation_state.add(invoice)
+        else:
+            validation_state = ValidationState(fingerprint, invoice_count=invoice_count)
+            for invoice in invoice_collection:
+                if invoice.doc_filename not in failing_invoices:
+                    validation_state.add(invoice)
+            if self._base_state is not None:
+                validation_state.years.update(self._base_state.years)
+        if failing_invoices:
+            validation_state.warnings = self.validated_warnings(failing_invoices)
+        else:
+            validation_state.warnings = {doc_filename: list(entries) for doc_filename, entries in self.warning_entries.items()}
+        years = validation_state.years
+        for year, year_numbering in self.year_numberings.items():
+            years[year] = year_numbering.state()
+        collection_years = set(invoice_collection.years())
+        for year in list(years):
+            if year not in collection_years:
+                del years[year]
+        return validation_state
@@ -23,13 +23,19 @@ __all__ = [
 import collections
 import configparser
 import datetime
+import os
 import sqlite3
+import uuid
 
 from . import conf
-from .error import InvoiceError, InvoiceVersionError
+from .error import InvoiceError, InvoiceVersionError, InvoiceArgumentError
 from .version import Version, VERSION
 from .invoice import Invoice
 from .invoice_collection import InvoiceCollection
+from .calendar_table import Calendar, CalendarDay
+from .snapshot import SNAPSHOT_SUFFIX, write_snapshot, read_snapshot
+from .invoice_collection_validator import ValidationState
+from .validation_cache import ValidationCache
 from .database.db import Db, DbError
 from .database.db_table import DbTable
 from .database.db_types import Str, Int, Float, Date, DateTime, Path, Bool, StrTuple, \
@@ -87,6 +93,48 @@ class InvoiceDb(Db):
         spy_delay=conf.DEFAULT_SPY_DELAY,
         progressbar=conf.DEFAULT_PROGRESSBAR,
     )
+    ValidationStateInfo = collections.namedtuple('ValidationStateInfo', ('fingerprint', 'invoice_count'))
+    ValidationYear = collections.namedtuple('ValidationYear', ('year', 'expected_number', 'prev_doc', 'prev_date'))
+    ValidationClientName = collections.namedtuple('ValidationClientName', ('tax_code', 'name', 'invoice_count'))
+    ValidationClientDay = collections.namedtuple('ValidationClientDay', ('tax_code', 'date', 'invoice_count'))
+    ValidationWarning = collections.namedtuple('ValidationWarning', ('doc_filename', 'source', 'exc_code', 'message'))
+    ValidationCacheInfo = collections.namedtuple('ValidationCacheInfo', ('fingerprint',))
+    ValidationCacheEntry = collections.namedtuple('ValidationCacheEntry', ('content_hash', 'entries'))
+    VALIDATION_CACHE_TABLES = ('validation_cache_info', 'validation_cache')
+    VALIDATION_STATE_TABLES = ('validation_state', 'validation_years', 'validation_client_names', 'validation_client_days', 'validation_warnings')
+    ValidatorsGeneration = collections.namedtuple('ValidatorsGeneration', ('generation', 'validated_generation'))
+    VALIDATORS_GENERATION_TABLES = ('validators_generation', 'validated_validators')
+    # every change to the validators table bumps the generation
+    VALIDATORS_TRIGGERS = collections.OrderedDict((
+        (trigger_name, """CREATE TRIGGER {} BEFORE {} ON validators
+BEGIN
+UPDATE validators_generation SET generation = generation + 1;
+END""".format(trigger_name, event))
+        for trigger_name, event in (('insert_on_validators', 'INSERT'),
+                                    ('update_on_validators', 'UPDATE'),
+                                    ('delete_on_validators', 'DELETE'))
+    ))
+    # db_id is random, so that a recreated db does not match the old snapshot
+    InvoicesGeneration = collections.namedtuple('InvoicesGeneration', ('generation', 'db_id'))
+    # every change to the invoices table bumps the generation
+    INVOICES_GENERATION_TRIGGERS = collections.OrderedDict((
+        (trigger_name, """CREATE TRIGGER {} AFTER {} ON invoices
+BEGIN
+UPDATE invoices_generation SET generation = generation + 1;
+END""".format(trigger_name, event))
+        for trigger_name, event in (('generation_insert_on_invoices', 'INSERT'),
+                                    ('generation_update_on_invoices', 'UPDATE'),
+                                    ('generation_delete_on_invoices', 'DELETE'))
+    ))
+    # the InvoiceCollection sort key; the rowid (ID) is implicitly part of
+    # the index, so the default list order is read straight from it
+    INVOICES_SORT_KEY = ('year', 'number', 'date', 'ID')
+    INVOICES_INDEXES = collections.OrderedDict((
+        ('invoices_sort_key', """CREATE INDEX invoices_sort_key ON invoices (year, number, date);"""),
+    ))
+    ReportCacheEntry = collections.namedtuple('ReportCacheEntry', ('key', 'generation', 'last_used', 'size', 'contents'))
+    ClientDate = collections.namedtuple('ClientDate', ('tax_code', 'date'))
+    CalendarDay = CalendarDay
     InternalOptions = collections.namedtuple('InternalOptions', ('needs_refresh',))
     DEFAULT_INTERNAL_OPTIONS = InternalOptions(
         needs_refresh=False,
@@ -182,6 +230,42 @@ class InvoiceDb(Db):
             dict_type=Validator,
             singleton=False,
         ),
+        'validators_generation': DbTable(
+            fields=(
+                ('generation', Int()),
+                ('validated_generation', Int()),
+            ),
+            dict_type=ValidatorsGeneration,
+            singleton=True,
+        ),
+        'invoices_generation': DbTable(
+            fields=(
+                ('generation', Int()),
+                ('db_id', Str()),
+            ),
+            dict_type=InvoicesGeneration,
+            singleton=True,
+        ),
+        'report_cache': DbTable(
+            fields=(
+                ('key', Str('UNIQUE')),
+                ('generation', Int()),
+                ('last_used', Int()),
+                ('size', Int()),
+                ('contents', Str()),
+            ),
+            dict_type=ReportCacheEntry,
+            singleton=False,
+        ),
+        'validated_validators': DbTable(
+            fields=(
+                ('filter_function', Str()),
+                ('check_function', Str()),
+                ('message', Str()),
+            ),
+            dict_type=Validator,
+            singleton=False,
+        ),
         'scan_date_times': DbTable(
             fields=(
                 ('doc_filename', Str('UNIQUE')),
@@ -190,6 +274,80 @@ class InvoiceDb(Db):
             dict_type=ScanDateTime,
             singleton=False,
         ),
+        'validation_state': DbTable(
+            fields=(
+                ('fingerprint', Str()),
+                ('invoice_count', Int()),
+            ),
+            dict_type=ValidationStateInfo,
+            singleton=True,
+        ),
+        'validation_years': DbTable(
+            fields=(
+                ('year', Int('UNIQUE')),
+                ('expected_number', Int()),
+                ('prev_doc', Str()),
+                ('prev_date', Date()),
+            ),
+            dict_type=ValidationYear,
+            singleton=False,
+        ),
+        'validation_client_names': DbTable(
+            fields=(
+                ('tax_code', Str()),
+                ('name', Str()),
+                ('invoice_count', Int()),
+            ),
+            dict_type=ValidationClientName,
+            singleton=False,
+        ),
+        'validation_client_days': DbTable(
+            fields=(
+                ('tax_code', Str()),
+                ('date', Date()),
+                ('invoice_count', Int()),
+            ),
+            dict_type=ValidationClientDay,
+            singleton=False,
+        ),
+        'validation_warnings': DbTable(
+            fields=(
+                ('doc_filename', Str()),
+                ('source', Str()),
+                ('exc_code', Str()),
+                ('message', Str()),
+            ),
+            dict_type=ValidationWarning,
+            singleton=False,
+        ),
+        'validation_cache_info': DbTable(
+            fields=(
+                ('fingerprint', Str()),
+            ),
+            dict_type=ValidationCacheInfo,
+            singleton=True,
+        ),
+        'validation_cache': DbTable(
+            fields=(
+                ('content_hash', Str('UNIQUE')),
+                ('entries', Str()),
+            ),
+            dict_type=ValidationCacheEntry,
+            singleton=False,
+        ),
+        'calendar': DbTable(
+            fields=(
+                ('date', Date('PRIMARY KEY')),
+                ('year', Int()),
+                ('month', Int()),
+                ('week_number', Int()),
+                ('week_first', Date()),
+                ('week_last', Date()),
+                ('weekday', Int()),
+            ),
+            dict_type=CalendarDay,
+            singleton=False,
+        ),
     }
     def __init__(self, *p_args, **n_args):
         super().__init__(*p_args, **n_args)
@@ -232,21 +390,18 @@ DELETE FROM scan_date_times WHERE doc_filename == old.doc_filename;
 END"""
             self.execute(cursor, sql)
             # validators triggers
-            sql = """CREATE TRIGGER insert_on_validators BEFORE INSERT ON validators
-BEGIN
-UPDATE internal_options SET needs_refresh = 1 WHERE NOT needs_refresh;
-END"""
-            self.execute(cursor, sql)
-            sql = """CREATE TRIGGER update_on_validators BEFORE UPDATE ON validators
-BEGIN
-UPDATE internal_options SET needs_refresh = 1 WHERE NOT needs_refresh;
-END"""
-            self.execute(cursor, sql)
-            sql = """CREATE TRIGGER delete_on_validators BEFORE DELETE ON validators
-BEGIN
-UPDATE internal_options SET needs_refresh = 1 WHERE NOT needs_refresh;
-END"""
-            self.execute(cursor, sql)
+            for sql in self.VALIDATORS_TRIGGERS.values():
+                self.execute(cursor, sql)
+            self.write('validators_generation', [self.ValidatorsGeneration(generation=0, validated_generation=0)], connection=connection)
+            # invoices generation triggers
+            for sql in self.INVOICES_GENERATION_TRIGGERS.values():
+                self.execute(cursor, sql)
+            self.write('invoices_generation', [self.make_invoices_generation(generation=0)], connection=connection)
+            # a snapshot of a previous db with the same name
+            self.remove_snapshot()
+            # invoices indexes
+            for sql in self.INVOICES_INDEXES.values():
+                self.execute(cursor, sql)
             # internal_options table
             self.store_internal_options(self.DEFAULT_INTERNAL_OPTIONS, connection=connection)
             # version table
@@ -372,12 +527,243 @@ END"""
             self.clear('version')
             self.write('version', [version])
         
-    def load_invoice_collection(self, connection=None):
-        invoice_collection = InvoiceCollection()
+    def load_invoice_collection(self, where=None, connection=None):
         with self.connect(connection) as connection:
-            for invoice in self.read('invoices', connection=connection):
+            if where is None:
+                invoice_collection = self.load_snapshot(connection=connection)
+                if invoice_collection is not None:
+                    return invoice_collection
+            invoice_collection = InvoiceCollection()
+            for invoice in self.read('invoices', where=where, connection=connection):
                 invoice_collection.add(invoice)
         return invoice_collection
+
+    def _create_invoices_generation(self, connection):
+        # databases created before the invoices generation
+        self.create_table('invoices_generation', self.TABLES['invoices_generation'].fields, connection=connection)
+        cursor = connection.cursor()
+        for trigger_name, sql in self.INVOICES_GENERATION_TRIGGERS.items():
+            self.execute(cursor, "DROP TRIGGER IF EXISTS {};".format(trigger_name))
+            self.execute(cursor, sql)
+        self.write('invoices_generation', [self.make_invoices_generation(generation=1)], connection=connection)
+
+    @classmethod
+    def make_invoices_generation(cls, generation):
+        return cls.InvoicesGeneration(generation=generation, db_id=uuid.uuid4().hex)
+
+    def _load_invoices_generation(self, connection):
+        if 'invoices_generation' not in self.get_table_names(connection=connection):
+            self._create_invoices_generation(connection)
+        return self.read('invoices_generation', connection=connection)[-1]
+
+    def load_invoices_generation(self, connection=None):
+        """load_invoices_generation(connection=None) -> int
+           The generation of the invoices table, bumped by triggers on
+           every change.
+        """
+        with self.connect(connection) as connection:
+            return self._load_invoices_generation(connection).generation
+
+    def _create_report_cache(self, connection):
+        # databases created before the report cache
+        if 'report_cache' not in self.get_table_names(connection=connection):
+            self.create_table('report_cache', self.TABLES['report_cache'].fields, connection=connection)
+
+    def load_report(self, key, connection=None):
+        """load_report(key, connection=None) -> str or None
+           The dumped contents of a cached report (see report_cache); a hit
+           makes the entry the most recently used one. A hit on the most
+           recently used entry does not write to the db, so that repeated
+           reports do not take the write lock.
+        """
+        with self.connect(connection) as connection:
+            self._create_report_cache(connection)
+            cursor = connection.cursor()
+            row = self.execute(cursor, "SELECT contents, last_used, (SELECT MAX(last_used) FROM report_cache) FROM report_cache WHERE key == ?;", [key]).fetchone()
+            if row is None:
+                return None
+            contents, last_used, max_last_used = row
+            self.logger.debug("cache dei report: trovato [{}]".format(key))
+            if last_used < max_last_used:
+                self.execute(cursor, "UPDATE report_cache SET last_used = ? WHERE key == ?;", [max_last_used + 1, key])
+            return contents
+
+    def store_report(self, key, generation, contents, max_size, connection=None):
+        """store_report(key, generation, contents, max_size, connection=None) -> bool
+           Stores the dumped contents of a report; the entries of the other
+           invoices generations are dropped, and then the least recently
+           used ones, until the cache fits in max_size bytes. Returns False
+           if the report alone does not fit.
+        """
+        size = len(contents.encode('utf-8'))
+        with self.connect(connection) as connection:
+            self._create_report_cache(connection)
+            cursor = connection.cursor()
+            self.execute(cursor, "DELETE FROM report_cache WHERE generation != ? OR key == ?;", [generation, key])
+            if size > max_size:
+                return False
+            last_used = self.execute(cursor, "SELECT MAX(last_used) FROM report_cache;").fetchone()[0] or 0
+            entry = self.ReportCacheEntry(key=key, generation=generation, last_used=last_used + 1, size=size, contents=contents)
+            self.write('report_cache', [entry], connection=connection)
+            total_size = 0
+            evicted_keys = []
+            for entry_key, entry_size in self.execute(cursor, "SELECT key, size FROM report_cache ORDER BY last_used DESC;").fetchall():
+                total_size += entry_size
+                if total_size > max_size:
+                    evicted_keys.append(entry_key)
+            for entry_key in evicted_keys:
+                self.execute(cursor, "DELETE FROM report_cache WHERE key == ?;", [entry_key])
+            if evicted_keys:
+                self.logger.debug("cache dei report: {} report rimossi".format(len(evicted_keys)))
+        return True
+
+    def get_snapshot_filename(self):
+        return self.db_filename + SNAPSHOT_SUFFIX
+
+    def store_snapshot(self, connection=None):
+        """store_snapshot(connection=None)
+           Rewrites the invoices snapshot (see load_snapshot); the
+           generation is read before the invoices, so that a concurrent
+           change makes the snapshot stale.
+        """
+        with self.connect(connection) as connection:
+            invoices_generation = self._load_invoices_generation(connection)
+            generation = invoices_generation.generation
+            field_names = Invoice._fields
+            columns = [[] for field_name in field_names]
+            appenders = [column.append for column in columns]
+            for invoice in self.read('invoices', connection=connection):
+                for append, value in zip(appenders, invoice):
+                    append(value)
+        write_snapshot(self.get_snapshot_filename(), generation, field_names, columns, db_id=invoices_generation.db_id)
+        self.logger.debug("snapshot delle fatture salvato (generazione {})".format(generation))
+
+    def remove_snapshot(self):
+        snapshot_filename = self.get_snapshot_filename()
+        if os.path.exists(snapshot_filename):
+            os.remove(snapshot_filename)
+
+    def load_snapshot(self, connection=None):
+        """load_snapshot(connection=None) -> InvoiceCollection or None
+           The invoices from the memory mapped snapshot, if it is current
+           (same db id and generation); None otherwise.
+        """
+        snapshot_filename = self.get_snapshot_filename()
+        if not os.path.exists(snapshot_filename):
+            return None
+        with self.connect(connection) as connection:
+            invoices_generation = self._load_invoices_generation(connection)
+        generation = invoices_generation.generation
+        snapshot = read_snapshot(snapshot_filename, generation=generation, db_id=invoices_generation.db_id)
+        if snapshot is None or tuple(snapshot[0]) != Invoice._fields:
+            self.logger.debug("snapshot delle fatture non aggiornato (generazione {})".format(generation))
+            return None
+        return InvoiceCollection.from_columns(snapshot[1])
+
+    def ensure_invoices_indexes(self, connection=None):
+        """ensure_invoices_indexes(connection=None)
+           Creates the invoices indexes missing from databases created
+           before them.
+        """
+        with self.connect(connection) as connection:
+            index_names = self.get_index_names(connection=connection)
+            cursor = connection.cursor()
+            for index_name, sql in self.INVOICES_INDEXES.items():
+                if index_name not in index_names:
+                    self.logger.info("creazione dell'indice {!r}...".format(index_name))
+                    self.execute(cursor, sql)
+
+    def _invoice_date_where(self, date_from, date_to):
+        where = []
+        values = []
+        if date_from is not None:
+            where.append("date >= ?")
+            values.append(Date.db_to(date_from))
+        if date_to is not None:
+            where.append("date <= ?")
+            values.append(Date.db_to(date_to))
+        return where, values
+
+    def count_invoices(self, date_from=None, date_to=None, connection=None):
+        """count_invoices(date_from=None, date_to=None, connection=None) -> number of invoices
+           The number of stored invoices in the date range.
+        """
+        where, values = self._invoice_date_where(date_from, date_to)
+        sql = """SELECT COUNT(*) FROM invoices{};""".format(
+            " WHERE " + " AND ".join(where) if where else "")
+        with self.connect(connection) as connection:
+            cursor = connection.cursor()
+            return self.execute(cursor, sql, values).fetchone()[0]
+
+    def iter_invoice_values(self, field_names, date_from=None, date_to=None, order_field_names=None, limit=None, offset=None, last=None, connection=None):
+        """iter_invoice_values(field_names, date_from=None, date_to=None, order_field_names=None, limit=None, offset=None, last=None, connection=None) -> iterator
+           Yields the raw db values of the given invoice fields, ordered by
+           the (reverse, field_name) order fields and then by the
+           InvoiceCollection sort order; dates are ISO strings.
+           The page is selected by limit and offset, or by the last
+           'last' invoices before the final 'offset' ones: they are read
+           in reverse order with a LIMIT, so that the last page does not
+           depend on the number of invoices.
+        """
+        if last is not None and limit is not None:
+            raise InvoiceArgumentError("le opzioni last e limit sono incompatibili")
+        where, values = self._invoice_date_where(date_from, date_to)
+        # NULLs come first, as in InvoiceCollection.sort_key; ID keeps the
+        # insertion order of equal keys
+        order = []
+        if order_field_names:
+            order.extend(order_field_names)
+        order.extend((False, field_name) for field_name in self.INVOICES_SORT_KEY)
+        if last is not None:
+            # reversing all the directions reverses the whole order,
+            # NULLs included
+            order = [(not reverse, field_name) for reverse, field_name in order]
+            limit = last
+        order_by = ["{} DESC".format(field_name) if reverse else field_name for reverse, field_name in order]
+        self.ensure_invoices_indexes(connection=connection)
+        invoice_values = self.iter_values('invoices', field_names=field_names, where=where, values=values,
+                                          order_by=order_by, limit=limit, offset=offset, connection=connection)
+        if last is not None:
+            return reversed(list(invoice_values))
+        return invoice_values
+
+    def load_invoice_page(self, date_from=None, date_to=None, order_field_names=None, limit=None, offset=None, last=None, connection=None):
+        """load_invoice_page(date_from=None, date_to=None, order_field_names=None, limit=None, offset=None, last=None, connection=None) -> list of Invoice
+           The invoices of a page, sorted and selected by the db (see
+           iter_invoice_values).
+        """
+        field_names = self.TABLES['invoices'].field_names
+        return [self.make_record('invoices', values) for values in self.iter_invoice_values(
+                    field_names, date_from=date_from, date_to=date_to, order_field_names=order_field_names,
+                    limit=limit, offset=offset, last=last, connection=connection)]
+
+    def load_client_dates(self, connection=None):
+        """load_client_dates(connection=None) -> list of ClientDate
+           Loads only the (tax_code, date) pairs of the stored invoices.
+        """
+        with self.connect(connection) as connection:
+            cursor = connection.cursor()
+            return [self.ClientDate(tax_code=tax_code, date=Date.db_from(date)) \
+                    for tax_code, date in self.execute(cursor, "SELECT tax_code, date FROM invoices;")]
+
+
+    def ensure_calendar(self, connection=None):
+        """ensure_calendar(connection=None) -> list of added years
+           The calendar table is generated once for each year of the
+           stored invoice dates.
+        """
+        with self.connect(connection) as connection:
+            if 'calendar' not in self.get_table_names(connection=connection):
+                self.create_table('calendar', self.TABLES['calendar'].fields, connection=connection)
+            cursor = connection.cursor()
+            sql = """SELECT DISTINCT CAST(strftime('%Y', date) AS INTEGER) FROM invoices WHERE date NOT IN (SELECT date FROM calendar);"""
+            years = sorted(year for year, in self.execute(cursor, sql))
+            if years:
+                self.logger.debug("calendario: generazione degli anni {}".format(', '.join(str(year) for year in years)))
+                calendar = Calendar()
+                for year in years:
+                    self.write('calendar', calendar.year_days(year), connection=connection)
+        return years
                 
     def reset_config_cache(self):
         self._configuration = None
@@ -430,3 +816,174 @@ END"""
             record = dict_type(**d)
             records.append(record)
         self.write(table_name, records, connection=connection)
+
+    def load_validation_state(self, connection=None):
+        with self.connect(connection) as connection:
+            table_names = self.get_table_names(connection=connection)
+            for table_name in self.VALIDATION_STATE_TABLES:
+                if table_name not in table_names:
+                    return None
+            infos = list(self.read('validation_state', connection=connection))
+            if len(infos) == 0:
+                return None
+            info = infos[-1]
+            validation_state = ValidationState(fingerprint=info.fingerprint, invoice_count=info.invoice_count)
+            for record in self.read('validation_years', connection=connection):
+                validation_state.years[record.year] = (record.expected_number, record.prev_doc, record.prev_date)
+            for record in self.read('validation_client_names', connection=connection):
+                validation_state.client_names[(record.tax_code, record.name)] = record.invoice_count
+            for record in self.read('validation_client_days', connection=connection):
+                validation_state.client_days[(record.tax_code, record.date)] = record.invoice_count
+            exc_types = ValidationResult.exc_types()
+            for record in self.read('validation_warnings', connection=connection):
+                validation_state.warnings.setdefault(record.doc_filename, []).append(
+                    (record.source, exc_types[record.exc_code], record.message))
+        return validation_state
+
+    def store_validation_state(self, validation_state, connection=None):
+        with self.connect(connection) as connection:
+            table_names = self.get_table_names(connection=connection)
+            for table_name in self.VALIDATION_STATE_TABLES:
+                if table_name not in table_names:
+                    self.create_table(table_name, self.TABLES[table_name].fields, connection=connection)
+            self.delete('validation_state', connection=connection)
+            self.delete('validation_years', connection=connection)
+            self.write('validation_years',
+                [self.ValidationYear(year, *state) for year, state in sorted(validation_state.years.items())],
+                connection=connection)
+            self._store_validation_counts('validation_client_names', self.ValidationClientName, ('tax_code', 'name'),
+                validation_state.client_names, validation_state.changed_client_names, connection=connection)
+            self._store_validation_counts('validation_client_days', self.ValidationClientDay, ('tax_code', 'date'),
+                validation_state.client_days, validation_state.changed_client_days, connection=connection)
+            self.delete('validation_warnings', connection=connection)
+            self.write('validation_warnings',
+                [self.ValidationWarning(doc_filename, source, exc_type.exc_code(), str(message)) \
+                     for doc_filename, entries in validation_state.warnings.items() for source, exc_type, message in entries],
+                connection=connection)
+            self.write('validation_state',
+                [self.ValidationStateInfo(fingerprint=validation_state.fingerprint, invoice_count=validation_state.invoice_count)],
+                connection=connection)
+
+    def _store_validation_counts(self, table_name, record_type, key_names, counts, changed_keys, connection):
+        # all the records are rewritten, unless only some keys have changed
+        if changed_keys is None:
+            self.delete(table_name, connection=connection)
+            keys = counts
+        else:
+            fields = self.TABLES[table_name].fields
+            sql = """DELETE FROM {table_name} WHERE {where};""".format(
+                table_name=table_name,
+                where=' AND '.join("{} IS ?".format(key_name) for key_name in key_names),
+            )
+            cursor = connection.cursor()
+            for key in changed_keys:
+                self.execute(cursor, sql, [fields[key_name].db_to(value) for key_name, value in zip(key_names, key)])
+            keys = changed_keys
+        records = [record_type(*(key + (counts[key], ))) for key in keys if counts.get(key, 0) > 0]
+        if records:
+            self.write(table_name, records, connection=connection)
+
+    def _create_validators_generation(self, connection):
+        # databases created before the validators generation: the
+        # needs_refresh triggers are replaced, and a pending needs_refresh
+        # is cleared: all the validators are evaluated once on the stored
+        # invoices (validated_generation is 0)
+        for table_name in self.VALIDATORS_GENERATION_TABLES:
+            self.create_table(table_name, self.TABLES[table_name].fields, connection=connection)
+        cursor = connection.cursor()
+        for trigger_name, sql in self.VALIDATORS_TRIGGERS.items():
+            self.execute(cursor, "DROP TRIGGER IF EXISTS {};".format(trigger_name))
+            self.execute(cursor, sql)
+        self.write('validators_generation', [self.ValidatorsGeneration(generation=1, validated_generation=0)], connection=connection)
+        self.store_internal_options(self.DEFAULT_INTERNAL_OPTIONS, connection=connection)
+
+    def load_validators_generation(self, connection=None):
+        with self.connect(connection) as connection:
+            table_names = self.get_table_names(connection=connection)
+            if any(table_name not in table_names for table_name in self.VALIDATORS_GENERATION_TABLES):
+                self._create_validators_generation(connection)
+            return list(self.read('validators_generation', connection=connection))[-1]
+
+    def load_validated_validators(self, connection=None):
+        with self.connect(connection) as connection:
+            self.load_validators_generation(connection=connection)
+            return list(self.read('validated_validators', connection=connection))
+
+    def store_validated_validators(self, validators, connection=None):
+        """store_validated_validators(validators, connection=None)
+           Records the validators the stored invoices have been validated
+           with, at the current validators generation.
+        """
+        with self.connect(connection) as connection:
+            validators_generation = self.load_validators_generation(connection=connection)
+            self.delete('validated_validators', connection=connection)
+            self.write('validated_validators', [self.Validator(*validator) for validator in validators], connection=connection)
+            self.delete('validators_generation', connection=connection)
+            self.write('validators_generation',
+                [validators_generation._replace(validated_generation=validators_generation.generation)],
+                connection=connection)
+
+    def update_validation_state_fingerprint(self, fingerprint, new_fingerprint, connection=None):
+        with self.connect(connection) as connection:
+            table_names = self.get_table_names(connection=connection)
+            if 'validation_state' in table_names:
+                infos = list(self.read('validation_state', connection=connection))
+                if infos and infos[-1].fingerprint == fingerprint:
+                    self.delete('validation_state', connection=connection)
+                    self.write('validation_state', [infos[-1]._replace(fingerprint=new_fingerprint)], connection=connection)
+
+    def clear_validation_state(self, connection=None):
+        with self.connect(connection) as connection:
+            table_names = self.get_table_names(connection=connection)
+            if 'validation_state' in table_names:
+                self.delete('validation_state', connection=connection)
+
+    def _load_validation_cache_fingerprint(self, connection):
+        table_names = self.get_table_names(connection=connection)
+        for table_name in self.VALIDATION_CACHE_TABLES:
+            if table_name not in table_names:
+                return None
+        infos = list(self.read('validation_cache_info', connection=connection))
+        if len(infos) == 0:
+            return None
+        return infos[-1].fingerprint
+
+    def load_validation_cache(self, fingerprint, content_hashes=None, connection=None):
+        validation_cache = ValidationCache(fingerprint=fingerprint)
+        with self.connect(connection) as connection:
+            if self._load_validation_cache_fingerprint(connection) == fingerprint:
+                if content_hashes is None:
+                    records = self.read('validation_cache', connection=connection)
+                else:
+                    records = []
+                    content_hashes = list(content_hashes)
+                    chunk_size = 500
+                    for index in range(0, len(content_hashes), chunk_size):
+                        chunk = content_hashes[index:index + chunk_size]
+                        sql = """SELECT content_hash, entries FROM validation_cache WHERE content_hash IN ({});""".format(
+                            ', '.join('?' for content_hash in chunk))
+                        cursor = connection.cursor()
+                        records.extend(self.ValidationCacheEntry(*values) for values in self.execute(cursor, sql, chunk))
+                for record in records:
+                    validation_cache.entries[record.content_hash] = ValidationCache.load_entries(record.entries)
+        return validation_cache
+
+    def store_validation_cache(self, validation_cache, prune=False, connection=None):
+        with self.connect(connection) as connection:
+            table_names = self.get_table_names(connection=connection)
+            for table_name in self.VALIDATION_CACHE_TABLES:
+                if table_name not in table_names:
+                    self.create_table(table_name, self.TABLES[table_name].fields, connection=connection)
+            if self._load_validation_cache_fingerprint(connection) != validation_cache.fingerprint:
+                self.delete('validation_cache', connection=connection)
+                self.delete('validation_cache_info', connection=connection)
+                self.write('validation_cache_info', [self.ValidationCacheInfo(fingerprint=validation_cache.fingerprint)], connection=connection)
+            if prune:
+                cursor = connection.cursor()
+                for content_hash in validation_cache.unused_keys():
+                    self.execute(cursor, "DELETE FROM validation_cache WHERE content_hash == ?;", [content_hash])
+            records = [self.ValidationCacheEntry(content_hash=content_hash, entries=ValidationCache.dump_entries(entries))
+                       for content_hash, entries in validation_cache.new_entries.items()]
+            if records:
+                self.write('validation_cache', records, connection=connection)
+            validation_cache.new_entries.clear()
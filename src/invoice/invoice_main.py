@@ -30,6 +30,9 @@ import traceback
 from .database.filecopy import tempcopy, nocopy
 from .error import InvoiceSyntaxError, InvoiceVersionError, InvoiceValidationError
 from . import conf
+from .aggregation import parse_group, group_kind_names
+from .document.text_csv import WIDTH_EXACT, WIDTH_SAMPLE, DEFAULT_SAMPLE_SIZE
+from .document import parse_output
 from .log import get_default_logger, set_verbose_level
 from .invoice import Invoice
 from .validation_result import ValidationResult
@@ -83,6 +86,47 @@ def invoice_main(printer=StreamPrinter(sys.stdout), logger=None, args=None):
             filter_source = 'year in {{{}}}'.format(', '.join(str(year) for year in years))
         return filter_source
 
+    def type_years_range(s):
+        years = set()
+        for item in s.split(','):
+            if '-' in item:
+                first_year, last_year = (int(y.strip()) for y in item.split('-', 1))
+                if first_year > last_year:
+                    raise ValueError("intervallo di anni {!r} non valido".format(item))
+                years.update(range(first_year, last_year + 1))
+            else:
+                years.add(int(item.strip()))
+        return tuple(sorted(years))
+
+    def type_text_width(s):
+        if s in {WIDTH_EXACT, WIDTH_SAMPLE}:
+            return s
+        width = int(s)
+        if width < 0:
+            raise ValueError("larghezza {!r} non valida".format(s))
+        return width
+
+    def type_count(s):
+        count = int(s)
+        if count < 0:
+            raise ValueError("numero {!r} non valido".format(s))
+        return count
+
+    def type_window(s):
+        units = {'d': 1, 'w': 7}
+        if s and s[-1] in units:
+            days = int(s[:-1]) * units[s[-1]]
+        else:
+            days = int(s)
+        if days <= 0:
+            raise ValueError("finestra {!r} non valida".format(s))
+        return datetime.timedelta(days=days)
+
+    def type_output(s):
+        if not s:
+            raise ValueError("file di output {!r} non valido".format(s))
+        return parse_output(s)
+
     DATE_FORMAT = "%Y-%m-%d"
 
     def type_date(s):
@@ -127,6 +171,7 @@ def invoice_main(printer=StreamPrinter(sys.stdout), logger=None, args=None):
         'rc_dir': None,
         'db_file': None,
         'trace': type_onoff(os.environ.get("INVOICE_TRACE", "off")),
+        'report_cache_size': None,
     }
     top_level_parser_name = 'main'
     default_validate = True
@@ -195,6 +240,14 @@ def invoice_main(printer=StreamPrinter(sys.stdout), logger=None, args=None):
         nargs='?',
         help="abilita/disabilita il traceback in caso di errori (per debug)")
 
+    common_parser.add_argument("--report-cache-size",
+        metavar="B",
+        dest="report_cache_size",
+        type=type_count,
+        default=defaults["report_cache_size"],
+        help="dimensione massima in byte della cache dei report di stats, summary e yreport; 0 disabilita la cache [{}]".format(
+            conf.DEFAULT_REPORT_CACHE_SIZE))
+
     top_level_parser = argparse.ArgumentParser(
         description="""\
 %(prog)s {version} - legge e processa una collezione di file DOC
@@ -575,9 +628,10 @@ Questa rimozione di fatture già scansionate può avvenire in due casi:
     )
     scan_parser.set_defaults(
         function_name="program_scan",
-        function_arguments=('warning_mode', 'error_mode', 'changed_tax_codes', 'force_refresh',
+        function_arguments=('warning_mode', 'error_mode', 'changed_tax_codes',
                             'remove_orphaned', 'partial_update', 'show_scan_report',
-                            'table_mode', 'output_filename', 'progressbar', 'changed_tax_codes'),
+                            'table_mode', 'output_filename', 'progressbar', 'changed_tax_codes',
+                            'full_validate', 'jobs'),
     )
 
     ### clear_parser ###
@@ -607,7 +661,7 @@ Esegue una validazione del contenuto del database.
     )
     validate_parser.set_defaults(
         function_name="program_validate",
-        function_arguments=('warning_mode', 'error_mode', 'changed_tax_codes'),
+        function_arguments=('warning_mode', 'error_mode', 'changed_tax_codes', 'jobs'),
     )
 
     ### list_parser ###
@@ -619,12 +673,14 @@ Esegue una validazione del contenuto del database.
         description="""\
 Mostra una lista delle fatture contenute nel database.
 È possibile filtrare ed ordinare le fatture. È anche possibile
-selezionare i campi da mostrare.
+selezionare i campi da mostrare, e mostrare una sola pagina
+della lista (--limit, --offset, --last).
 """,
     )
     list_parser.set_defaults(
         function_name="program_list",
-        function_arguments=('filters', 'date_from', 'date_to', 'list_field_names', 'header', 'order_field_names', 'table_mode', 'output_filename'),
+        function_arguments=('filters', 'date_from', 'date_to', 'list_field_names', 'header', 'order_field_names', 'table_mode', 'output_filename',
+                            'text_width', 'limit', 'offset', 'last'),
     )
 
     ### dump_parser ###
@@ -669,7 +725,7 @@ Per ciascun anno, vengono mostrate le seguenti informazioni:
     )
     report_parser.set_defaults(
         function_name="program_report",
-        function_arguments=('filters', ),
+        function_arguments=('filters', 'stats_backend'),
     )
 
     ### summary_parser ###
@@ -682,6 +738,9 @@ Per ciascun anno, vengono mostrate le seguenti informazioni:
 Mostra un report per anno.
 
 Se il formato è XLSX, viene generato un documento con un foglio di calcolo per ciascun mese.
+Con più anni (ad esempio '--year 2014-2016') i mesi di tutti gli anni sono
+mostrati nello stesso documento; con '--years 2014-2016 --output summary_{{year}}.xlsx'
+viene generato un file per ciascun anno, in parallelo.
 Se summary_prologue e/o summary_epilogue sono definiti nel file di informazioni
 
   {infofile}
@@ -691,7 +750,7 @@ verranno mostrati rispettivamente all'inizio ed alla fine di ogni foglio.
     )
     summary_parser.set_defaults(
         function_name="program_summary",
-        function_arguments=('year', 'output_filename', 'table_mode'),
+        function_arguments=('year', 'years', 'jobs', 'output_filename', 'table_mode'),
     )
 
     ### yreport_parser ###
@@ -763,7 +822,31 @@ Per il raggruppamento città vengono mostrati:
     )
     stats_parser.set_defaults(
         function_name="program_stats",
-        function_arguments=('filters', 'date_from', 'date_to', 'stats_group', 'total', 'stats_mode', 'header'),
+        function_arguments=('filters', 'date_from', 'date_to', 'stats_group', 'total', 'stats_mode', 'header', 'stats_backend',
+                            'table_mode', 'output_filename', 'stats_window'),
+    )
+
+    ### export_parser ###
+    export_parser = add_subparser(subparsers,
+        "export",
+        parents=(common_parser, ),
+        add_help=False,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="""\
+Esporta le fatture contenute nel database in un file binario a colonne,
+per l'analisi con pandas/numpy:
+ * {arrow}: stream Arrow IPC (richiede pyarrow);
+ * {npz}: archivio NumPy .npz, con un array per ciascun campo;
+ * {auto}: {arrow} se pyarrow è disponibile, altrimenti {npz}.
+
+Le date sono esportate come date, gli importi come numeri; i campi
+categorici (nome, codice fiscale, città, ...) sono codificati con un
+dizionario.
+""".format(arrow=conf.EXPORT_FORMAT_ARROW, npz=conf.EXPORT_FORMAT_NPZ, auto=conf.EXPORT_FORMAT_AUTO),
+    )
+    export_parser.set_defaults(
+        function_name="program_export",
+        function_arguments=('output_filename', 'filters', 'date_from', 'date_to', 'export_format'),
     )
 
     ### legacy_parser ###
@@ -837,12 +920,21 @@ e validati.
             default=default_list_field_names,
             help="selezione manuale dei campi, ad esempio 'anno,codice_fiscale,città' [{}]".format('|'.join(all_field_names)))
 
-    for parser in init_parser, config_parser, list_parser, scan_parser, summary_parser, yreport_parser:
+    for parser in init_parser, config_parser, list_parser, scan_parser, summary_parser, yreport_parser, stats_parser:
         parser.add_argument("--table-mode", "-m",
             dest="table_mode",
             choices=conf.TABLE_MODES,
             default=default_table_mode,
-            help="modalità di stampa delle tabelle: {} -> testo, {} -> comma-separated-value".format(conf.TABLE_MODE_TEXT, conf.TABLE_MODE_CSV))
+            help="modalità di stampa delle tabelle: {} -> testo, {} -> comma-separated-value, {} -> un oggetto JSON per riga".format(
+                conf.TABLE_MODE_TEXT, conf.TABLE_MODE_CSV, conf.TABLE_MODE_NDJSON))
+
+    list_parser.add_argument("--text-width",
+        metavar="W",
+        dest="text_width",
+        type=type_text_width,
+        default=None,
+        help="larghezza delle colonne in modalità testo: '{}' (la più lunga, default), '{}' (la più lunga delle prime {} righe) o un numero fisso di caratteri".format(
+            WIDTH_EXACT, WIDTH_SAMPLE, DEFAULT_SAMPLE_SIZE))
 
     for parser in init_parser, config_parser:
         parser.add_argument("--max-interruption-days", "-I",
@@ -852,12 +944,15 @@ e validati.
             default=default_max_interruption_days,
             help="numero di giorni massimo di interruzione di un incarico")
 
-    for parser in list_parser, scan_parser, summary_parser, yreport_parser:
+    for parser in list_parser, scan_parser, summary_parser, yreport_parser, stats_parser:
         parser.add_argument("--output",
+            metavar="FILE[:MODE]",
             dest="output_filename",
-            type=str,
+            action="append",
+            type=type_output,
             default=None,
-            help="nome del file di output")
+            help="file di output, eventualmente seguito dalla modalità di stampa ('-' è il terminale); può essere ripetuto per produrre più formati in un solo passaggio, ad esempio '--output a.txt:{} --output a.xlsx:{}'".format(
+                conf.TABLE_MODE_TEXT, conf.TABLE_MODE_XLSX))
      
     for parser in stats_parser, :
         stats_argument_group = parser.add_mutually_exclusive_group()
@@ -881,9 +976,23 @@ e validati.
             const=conf.STATS_MODE_FULL,
             default=default_stats_mode,
             help="output completo")
+
+        stats_argument_group.add_argument("--mode",
+            dest="stats_mode",
+            choices=conf.STATS_MODES,
+            default=default_stats_mode,
+            help="modalità di output; '{}' mostra i totali mobili su una finestra di giorni (--window), per ogni data e per ogni gruppo".format(
+                conf.STATS_MODE_ROLLING))
+
+        parser.add_argument("--window",
+            metavar="W",
+            dest="stats_window",
+            type=type_window,
+            default=None,
+            help="finestra dei totali mobili in giorni ('30', '30d') o settimane ('4w') [{}d]".format(conf.DEFAULT_STATS_WINDOW_DAYS))
     
     ### year filter option
-    for parser in list_parser, dump_parser, legacy_parser, report_parser, stats_parser:
+    for parser in list_parser, dump_parser, legacy_parser, report_parser, stats_parser, export_parser:
         parser.add_argument("--year", "-y",
             metavar="Y",
             dest="filters",
@@ -892,16 +1001,35 @@ e validati.
             default=default_filters,
             help="filtra le fatture in base all'anno")
 
-    for parser in summary_parser, yreport_parser:
-        parser.add_argument("--year", "-y",
-            metavar="Y",
-            dest="year",
-            type=int,
-            default=None,
-            help="filtra le fatture in base all'anno")
+    summary_parser.add_argument("--year", "-y",
+        metavar="Y",
+        dest="year",
+        type=type_years_range,
+        default=None,
+        help="filtra le fatture in base all'anno; è possibile indicare più anni o intervalli, ad esempio '2014,2016-2018'")
+
+    summary_parser.add_argument("--years",
+        metavar="Y",
+        dest="years",
+        type=type_years_range,
+        default=None,
+        help="genera un file separato per ciascun anno (ad esempio '--years 2010-2025 --output summary_{year}.xlsx')")
+
+    summary_parser.add_argument("--jobs", "-j",
+        metavar="N",
+        type=int,
+        default=None,
+        help="numero di processi per la generazione dei file annuali (default: numero di CPU)")
+
+    yreport_parser.add_argument("--year", "-y",
+        metavar="Y",
+        dest="year",
+        type=int,
+        default=None,
+        help="filtra le fatture in base all'anno")
 
     ### filter options
-    for parser in list_parser, dump_parser, legacy_parser, stats_parser:
+    for parser in list_parser, dump_parser, legacy_parser, stats_parser, export_parser:
         parser.add_argument("--start", "-S",
             metavar="S",
             dest="date_from",
@@ -932,6 +1060,16 @@ e validati.
             default=default_filters,
             help="aggiunge un filtro sul codice fiscale del cliente")
 
+    export_parser.add_argument("output_filename",
+        metavar="FILE",
+        help="nome del file di output")
+
+    export_parser.add_argument("--format",
+        dest="export_format",
+        choices=conf.EXPORT_FORMATS,
+        default=conf.DEFAULT_EXPORT_FORMAT,
+        help="formato del file (default: {})".format(conf.DEFAULT_EXPORT_FORMAT))
+
     ### order options
     for parser in list_parser, :
         parser.add_argument("--order", "-O",
@@ -941,13 +1079,48 @@ e validati.
             default=default_order_field_names,
             help="ordina il risultato rispetto a uno o più campi; è possibile invertire l'ordinamento rispetto ad un campo aggiungendo il carattere '!' davanti al campo: ad esempio, '--order tax_code,!date'")
 
-    for parser in init_parser, config_parser, stats_parser:
+    ### page options
+    for parser in list_parser, :
+        page_argument_group = parser.add_mutually_exclusive_group()
+        page_argument_group.add_argument("--limit",
+            metavar="N",
+            dest="limit",
+            type=type_count,
+            default=None,
+            help="mostra al più N fatture")
+        page_argument_group.add_argument("--last",
+            metavar="N",
+            dest="last",
+            type=type_count,
+            default=None,
+            help="mostra le ultime N fatture")
+        parser.add_argument("--offset",
+            metavar="N",
+            dest="offset",
+            type=type_count,
+            default=None,
+            help="salta le prime N fatture (le ultime N con --last)")
+
+    for parser in init_parser, config_parser:
         parser.add_argument("--group", "-g",
             dest="stats_group",
             choices=conf.STATS_GROUPS,
             default=default_stats_group,
             help="raggruppa le fatture per anno/mese/settimana/giorno/tutto il periodo")
 
+    stats_parser.add_argument("--group", "-g",
+        dest="stats_group",
+        type=parse_group,
+        default=default_stats_group,
+        help="raggruppa le fatture per anno/mese/settimana/giorno/tutto il periodo; è possibile combinare più raggruppamenti, ad esempio '--group year,client' (valori: {})".format(', '.join(group_kind_names())))
+
+    for parser in stats_parser, report_parser:
+        parser.add_argument("--backend",
+            dest="stats_backend",
+            choices=conf.STATS_BACKENDS,
+            default=None,
+            help="motore di calcolo delle statistiche: 'sql' esegue il raggruppamento nel database, 'python' in memoria; 'auto' usa 'sql' se tutti i filtri sono traducibili in SQL (default: {})".format(conf.DEFAULT_STATS_BACKEND))
+
     for parser in init_parser, config_parser, stats_parser:
         parser.add_argument("--total", "-T",
             dest="total",
@@ -1020,10 +1193,17 @@ e validati.
             nargs='?',
             help="abilita/disabilita la stampa dell'ultima fattura per ciascun anno")
 
-    scan_parser.add_argument("--force-refresh",
+    scan_parser.add_argument("--full-validate",
         action="store_true",
         default=False,
-        help="forza un refresh di tutte le fatture")
+        help="forza la validazione completa di tutte le fatture (senza usare lo stato della validazione precedente)")
+
+    for parser in scan_parser, validate_parser:
+        parser.add_argument("--jobs", "-j",
+            metavar="N",
+            type=int,
+            default=1,
+            help="numero di processi per la validazione completa (le fatture sono suddivise per anno)")
 
     for parser in init_parser, config_parser, scan_parser:
         parser.add_argument("--progressbar", "-P",
@@ -1149,6 +1329,7 @@ e validati.
             logger=logger,
             printer=printer,
             trace=args.trace,
+            report_cache_size=args.report_cache_size,
         )
     
         if not hasattr(args, 'function_name'):
@@ -20,11 +20,13 @@ __all__ = [
     'InvoiceProgram'
 ]
 
-import calendar
 import collections
+import concurrent.futures
+import contextlib
 import datetime
 import fnmatch
 import glob
+import io
 import math
 import os
 import subprocess
@@ -45,9 +47,18 @@ from .error import InvoiceSyntaxError, \
                    InvoiceArgumentError
 
 from .import_excel import read_clients, read_invoices, create_documents
+from .aggregation import GROUP_SEPARATOR, aggregate, get_group_kind, group_kind_names, group_label, group_value, \
+                          parse_group
+from .date_index import ClientDateIndex, IncomeIndex
+from .sql_aggregation import sql_aggregate, sql_filters, sql_group_supported, sql_totals
+from .columnar import get_columnar_format, write_columnar
+from .report_cache import make_report_key, dump_report_contents, load_report_contents
 from .info import load_info
 from .invoice_collection import InvoiceCollection
 from .invoice_collection_reader import InvoiceCollectionReader
+from .invoice_collection_validator import InvoiceCollectionValidator, ValidationState
+from .validation_cache import ValidationCache
+from .validator_cache import ValidatorCache
 from .invoice_reader import InvoiceReader
 from .invoice_db import InvoiceDb
 from .invoice import Invoice
@@ -56,9 +67,9 @@ from .spy import observe
 from .spy import notify_osd
 from .spy.spy_function import spy_function
 from .validation_result import ValidationResult
-from .week import WeekManager
+from .calendar_table import Calendar
 from .database.db_types import Path
-from .document import document, item_getter, Formats, Formula
+from .document import document, documents, parse_output, DocumentOutput, item_getter, Formats, Formula
 from . import conf
 from .scanner import load_scanner
 from .parser import load_parser
@@ -66,7 +77,13 @@ from .version import VERSION
 from .ee import snow
 
 
-MReport = collections.namedtuple("MReport", ["number", "fee", "refunds", "cpa", "taxable_income", "vat", "empty", "deduction", "taxes", "income"])
+MReport = collections.namedtuple("MReport", ["number", "date", "tax_code", "name", "fee", "refunds", "cpa", "taxable_income", "vat", "empty", "deduction", "taxes", "income"])
+SummaryYearResult = collections.namedtuple("SummaryYearResult", ["year", "invoice_count", "output_filename", "elapsed", "error"])
+# the groups of the report queries
+REPORT_GROUP_NAMES = (conf.STATS_GROUP_YEAR, conf.STATS_GROUP_CLIENT, conf.STATS_GROUP_TASK, conf.STATS_GROUP_WEEK, conf.STATS_GROUP_DAY)
+ReportClient = collections.namedtuple("ReportClient", ["tax_code", "names", "invoice_count", "income", "weeks"])
+ReportWeek = collections.namedtuple("ReportWeek", ["week", "invoice_count", "income", "day_counts"])
+ReportYear = collections.namedtuple("ReportYear", ["year", "invoice_count", "income", "clients", "weeks"])
 YReport = collections.namedtuple("YReport", ["document_type", "document_date", "document_num", "payment_date", "tax_code", "cost_type",
                                              "cost_type_flag", "income", "refund_document_date", "refund_document_num"])
 
@@ -82,6 +99,140 @@ class FileDateTimes(object):
                 self._date_times[filename] = datetime.datetime.now()
         return self._date_times[filename]
 
+def render_summary(outputs, month_invoices, summary_prologue=None, summary_epilogue=None, year_titles=False, logger=None):
+    """render_summary(outputs, month_invoices, summary_prologue=None, summary_epilogue=None, year_titles=False, logger=None)
+       Renders a page for each (year, month) bucket to all the (file, mode)
+       outputs; the month rows are computed once. Module level, so that it
+       can run in a worker process.
+    """
+    all_field_names = MReport._fields
+    #"number", "fee", "cpa", "taxable_income", "vat", "empty", "deduction", "income"
+    header = ["N.DOC.", "DATA", "CODICE FISCALE", "NOME", "COMPENSO", "RIMBORSI", "C.P.A.", "IMPONIBILE IVA", "IVA 22%", "ES.IVA ART.10", "R.A.", "BOLLI", "TOTALE"]
+    total_keys = 'fee', 'refunds', 'cpa', 'taxable_income', 'vat', 'deduction', 'taxes', 'income'
+
+    number_fields = {"fee", "refunds", "cpa", "taxable_income", "vat", "deduction", "taxes", "income"}
+    number_cols = []
+    date_fields = {"date"}
+    date_cols = []
+    for c, field in enumerate(MReport._fields):
+        if field in number_fields:
+            number_cols.append(c)
+        elif field in date_fields:
+            date_cols.append(c)
+
+    align = conf.ALIGN.copy()
+    for key in total_keys:
+        align[key] = ">"
+
+    with contextlib.ExitStack() as stack:
+        docs = []
+        for file, table_mode in outputs:
+            doc = stack.enter_context(document(file=file, mode=table_mode, logger=logger))
+            doc.define_format("bold", {"bold": True})
+            doc.define_format("bold_yellow", {"bold": True, "bg_color": "yellow"})
+            doc.define_format("date_value", {"align": "right", "num_format": "dd/mm/yyyy"})
+            doc.define_format("money_value", {"align": "right", "num_format": "0.00"})
+            doc.define_format("money_value_total", {"align": "right", "num_format": "0.00", "bold": True, "bg_color": "yellow"})
+            page_template = doc.create_page_template(field_names=all_field_names, header=header, align=align, cents=total_keys)
+            docs.append((doc, page_template, table_mode))
+        vat_keys = conf.DERIVATIVES['vat']
+        for (year, month), invoices in month_invoices.items():
+            month_name = conf.MONTH_TRANSLATION[month - 1]
+            if year_titles:
+                month_name = "{} {}".format(month_name, year)
+            # the month rows and totals do not depend on the table mode
+            mreports = []
+            total = {}
+            for key in total_keys:
+                total[key] = 0.0
+            for invoice in invoices:
+                mreport = MReport(
+                    number=invoice.number,
+                    date=invoice.date,
+                    tax_code=invoice.tax_code,
+                    name=invoice.name,
+                    fee=invoice.fee,
+                    refunds=invoice.refunds,
+                    taxes=invoice.taxes,
+                    cpa=invoice.cpa,
+                    taxable_income=sum(getattr(invoice, skey) for skey in vat_keys),
+                    vat=invoice.vat,
+                    empty="",
+                    deduction=invoice.deduction,
+                    income=invoice.income,
+                )
+                mreports.append(mreport)
+                for key in total_keys:
+                    val = getattr(mreport, key)
+                    if val is not None:
+                        total[key] += val
+            total["number"] = "TOTALE"
+            total["empty"] = ""
+            total["date"] = ""
+            total["tax_code"] = ""
+            total["name"] = ""
+            for doc, page_template, table_mode in docs:
+                rows = list(mreports)
+                prologue = None
+                epilogue = None
+                row_offset = 0
+                doc_formats = Formats()
+                if table_mode == conf.TABLE_MODE_XLSX:
+                    prologue = []
+                    if summary_prologue:
+                        for line in summary_prologue.split('\n'):
+                            prologue.append((line,))
+                            doc_formats.add_format("bold", row=len(prologue) - 1, col=None)
+                        #prologue.append(('',))
+                    prologue.append(('mese:', month_name))
+                    doc_formats.add_format("bold_yellow", row=len(prologue) - 1, col=None)
+                    prologue.append(('',))
+                    row_offset += len(prologue)
+                # column formats: the header and total rows have row formats
+                for col in number_cols:
+                    doc_formats.add_format("money_value", col=col)
+                for col in date_cols:
+                    doc_formats.add_format("date_value", col=col)
+                row_end = row_offset + len(rows)
+                row_begin = row_offset
+                if header:
+                    nh = 1
+                else:
+                    nh = 0
+                doc_total = total.copy()
+                for key in total_keys:
+                    col = MReport._fields.index(key)
+                    doc_total[key] = Formula("SUM", col, row_begin + nh, row_end, value=round(total[key], 2))
+                if table_mode == conf.TABLE_MODE_XLSX:
+                    separator = {key: "" for key in MReport._fields}
+                    rows.append(MReport(**separator))
+                rows.append(MReport(**doc_total))
+                for col in number_cols:
+                    doc_formats.add_format("money_value_total", row=row_offset + len(rows), col=col)
+                num_rows = row_offset + len(rows)
+                doc_formats.add_format("bold", row=0 + row_offset, col=None)
+                doc_formats.add_format("bold", row=None, col=0)
+                if header:
+                    num_rows += 1
+                doc_formats.add_format("bold_yellow", row=num_rows - 1, col=None)
+                if table_mode == conf.TABLE_MODE_XLSX:
+                    if summary_epilogue:
+                        epilogue = []
+                        #epilogue.insert(0, ('',))
+                        for line in summary_epilogue.split('\n'):
+                            epilogue.append((line,))
+                            doc_formats.add_format("bold", row=num_rows + len(epilogue) - 1, col=None)
+                doc.add_page(page_template=page_template, data=rows, title=month_name, formats=doc_formats, prologue=prologue, epilogue=epilogue)
+
+
+def _render_summary_year(outputs, month_invoices, summary_prologue, summary_epilogue, logger):
+    # worker: the summary of a single year
+    t0 = time.time()
+    render_summary(outputs, month_invoices,
+                   summary_prologue=summary_prologue, summary_epilogue=summary_epilogue, logger=logger)
+    return time.time() - t0
+
+
 class InvoiceProgram(object):
     if observe.available():
         SPY_DAEMON_ACTIONS = tuple(observe.DocObserver.ACTIONS)
@@ -91,19 +242,22 @@ class InvoiceProgram(object):
     SPY_ACTION_LOG = 'log'
     SPY_NON_DAEMON_ACTIONS = (SPY_ACTION_RUN, SPY_ACTION_LOG)
     SPY_ACTIONS = SPY_NON_DAEMON_ACTIONS + SPY_DAEMON_ACTIONS
-    def __init__(self, db_filename, logger, printer=print, trace=False):
+    def __init__(self, db_filename, logger, printer=print, trace=False, report_cache_size=None):
         self.db_filename = db_filename
         self.logger = logger
         self.printer = printer
         self.trace = trace
+        if report_cache_size is None:
+            report_cache_size = conf.DEFAULT_REPORT_CACHE_SIZE
+        self.report_cache_size = report_cache_size
         self.db = InvoiceDb(self.db_filename, self.logger)
-        self._week_manager = WeekManager()
+        self._calendar = Calendar()
 
     def get_week_number(self, day):
-        return self._week_manager.week_number(day)
+        return self._calendar.week_number(day)
 
     def get_week_range(self, year, week_number):
-        return self._week_manager.week_range(year=year, week_number=week_number)
+        return self._calendar.week_range(year=year, week_number=week_number)
 
     def create_validation_result(self, warning_mode=None, error_mode=None, changed_tax_codes=None):
         return ValidationResult(
@@ -238,13 +392,15 @@ class InvoiceProgram(object):
         self.impl_spy(action=action, spy_notify_level=spy_notify_level, spy_delay=spy_delay)
         return 0
 
-    def program_scan(self, *, warning_mode, error_mode, changed_tax_codes, force_refresh=None, progressbar=None,
-                              partial_update=True, remove_orphaned=True, show_scan_report=True, table_mode=None, output_filename=None):
+    def program_scan(self, *, warning_mode, error_mode, changed_tax_codes, progressbar=None,
+                              partial_update=True, remove_orphaned=True, show_scan_report=True, table_mode=None, output_filename=None,
+                              full_validate=False, jobs=None):
         validation_result, scan_events, invoice_collection = self.impl_scan(
             warning_mode=warning_mode,
             error_mode=error_mode,
             changed_tax_codes=changed_tax_codes,
-            force_refresh=force_refresh,
+            full_validate=full_validate,
+            jobs=jobs,
             partial_update=partial_update,
             remove_orphaned=remove_orphaned,
             show_scan_report=show_scan_report,
@@ -258,37 +414,60 @@ class InvoiceProgram(object):
         self.impl_clear()
         return 0
 
-    def program_validate(self, *, warning_mode, error_mode, changed_tax_codes):
-        self.impl_validate(warning_mode=warning_mode, error_mode=error_mode, changed_tax_codes=changed_tax_codes)
+    def program_validate(self, *, warning_mode, error_mode, changed_tax_codes, jobs=None):
+        self.impl_validate(warning_mode=warning_mode, error_mode=error_mode, changed_tax_codes=changed_tax_codes, jobs=jobs)
         return 0
 
-    def program_list(self, *, list_field_names=None, header=None, filters=None, date_from=None, date_to=None, order_field_names=None, table_mode=None, output_filename=None):
+    def program_list(self, *, list_field_names=None, header=None, filters=None, date_from=None, date_to=None, order_field_names=None, table_mode=None, output_filename=None,
+                     text_width=None, limit=None, offset=None, last=None):
         self.impl_list(list_field_names=list_field_names, header=header,
             filters=filters, date_from=date_from, date_to=date_to,
             order_field_names=order_field_names,
             table_mode=table_mode,
-            output_filename=output_filename)
+            output_filename=output_filename,
+            text_width=text_width,
+            limit=limit, offset=offset, last=last)
         return 0
 
     def program_dump(self, *, filters=None, date_from=None, date_to=None):
         self.impl_dump(filters=filters, date_from=date_from, date_to=date_to)
         return 0
 
-    def program_report(self, *, filters=None):
-        self.impl_report(filters=filters)
+    def program_report(self, *, filters=None, stats_backend=None):
+        self.impl_report(filters=filters, stats_backend=stats_backend)
         return 0
 
-    def program_summary(self, *, year=None, table_mode=None, output_filename=None, header=None):
-        self.impl_summary(year=year, table_mode=table_mode, output_filename=output_filename, header=header)
+    def program_summary(self, *, year=None, years=None, jobs=None, table_mode=None, output_filename=None, header=None):
+        if years is not None:
+            results = self.impl_summary_years(years=years, jobs=jobs, table_mode=table_mode, output_filename=output_filename)
+            if any(result.error is not None for result in results):
+                return 1
+            return 0
+        self.render_report('summary', dict(year=self.get_summary_years(year), header=header, info=load_info()['general']),
+            output_filename=output_filename, table_mode=table_mode,
+            render=lambda outputs: self.impl_summary(year=year, table_mode=table_mode, output_filename=outputs, header=header))
         return 0
 
     def program_yreport(self, *, year=None, table_mode=None, output_filename=None, header=None):
-        self.impl_yreport(year=year, table_mode=table_mode, output_filename=output_filename, header=header)
+        if year is None:
+            year = datetime.datetime.now().year
+        self.render_report('yreport', dict(year=year, header=header),
+            output_filename=output_filename, table_mode=table_mode,
+            render=lambda outputs: self.impl_yreport(year=year, table_mode=table_mode, output_filename=outputs, header=header))
         return 0
 
-    def program_stats(self, *, filters=None, date_from=None, date_to=None, stats_group=None, total=None, stats_mode=None, header=None, table_mode=None, output_filename=None):
-        self.impl_stats(filters=filters, date_from=date_from, date_to=date_to, stats_group=stats_group, total=total, stats_mode=stats_mode, header=header, table_mode=table_mode,
-            output_filename=output_filename)
+    def program_export(self, *, output_filename, filters=None, date_from=None, date_to=None, export_format=None):
+        self.impl_export(output_filename=output_filename, filters=filters, date_from=date_from, date_to=date_to, export_format=export_format)
+        return 0
+
+    def program_stats(self, *, filters=None, date_from=None, date_to=None, stats_group=None, total=None, stats_mode=None, header=None, table_mode=None, output_filename=None,
+                      stats_backend=None, stats_window=None):
+        arguments = dict(filters=tuple(filters or ()), date_from=date_from, date_to=date_to, stats_group=stats_group, total=total, stats_mode=stats_mode,
+                         header=header, stats_backend=stats_backend, stats_window=stats_window)
+        self.render_report('stats', arguments,
+            output_filename=output_filename, table_mode=table_mode,
+            render=lambda outputs: self.impl_stats(filters=filters, date_from=date_from, date_to=date_to, stats_group=stats_group, total=total, stats_mode=stats_mode,
+                header=header, table_mode=table_mode, output_filename=outputs, stats_backend=stats_backend, stats_window=stats_window))
         return 0
 
     def legacy(self, patterns, filters, date_from, date_to, validate, list, report, warning_mode, error_mode, changed_tax_codes):
@@ -378,6 +557,9 @@ class InvoiceProgram(object):
             if os.path.exists(self.db_filename):
                 self.logger.info("cancellazione del db {!r}...".format(self.db_filename))
                 os.remove(self.db_filename)
+            validator_cache_filename = self.get_validator_cache_filename()
+            if os.path.exists(validator_cache_filename):
+                os.remove(validator_cache_filename)
             if os.path.exists(scanner_config_file):
                 self.logger.info("cancellazione dello scanner config file {!r}...".format(scanner_config_file))
                 self.backup_and_remove(self.logger, scanner_config_file)
@@ -538,9 +720,11 @@ class InvoiceProgram(object):
 
     def impl_clear(self):
         self.db.check()
-        self.db.delete('invoices')
+        with self.db.connect() as connection:
+            self.db.clear_validation_state(connection=connection)
+            self.db.delete('invoices', connection=connection)
 
-    def impl_validate(self, *, warning_mode, error_mode, changed_tax_codes):
+    def impl_validate(self, *, warning_mode, error_mode, changed_tax_codes, jobs=None):
         self.db.check()
         warning_mode = self.db.get_config_option('warning_mode', warning_mode)
         error_mode = self.db.get_config_option('error_mode', error_mode)
@@ -549,29 +733,80 @@ class InvoiceProgram(object):
         validation_result = self.create_validation_result(warning_mode=warning_mode, error_mode=error_mode, changed_tax_codes=changed_tax_codes)
         with self.db.connect() as connection:
             user_validators = self.compile_user_validators(connection)
-            self.validate_invoice_collection(validation_result, invoice_collection, user_validators=user_validators)
+            self.db.clear_validation_state(connection=connection)
+            validation_cache = self.load_validation_cache(validation_result, connection=connection)
+            invoice_collection_validator = self.create_invoice_collection_validator(validation_result, user_validators=user_validators,
+                validation_cache=validation_cache, jobs=jobs)
+            try:
+                invoice_collection_validator.validate(invoice_collection)
+            finally:
+                self.store_validation_cache(validation_cache, prune=True, connection=connection)
             self.delete_failing_invoices(validation_result, connection=connection)
+            self.store_validation_state(invoice_collection_validator, validation_result, user_validators, connection=connection)
+            self.db.store_validated_validators([validator for validator, compiled_validator in user_validators], connection=connection)
         return validation_result.num_errors()
 
-    def impl_list(self, *, list_field_names=None, header=None, filters=None, date_from=None, date_to=None, order_field_names=None, table_mode=None, output_filename=None):
+    def impl_list(self, *, list_field_names=None, header=None, filters=None, date_from=None, date_to=None, order_field_names=None, table_mode=None, output_filename=None,
+                  text_width=None, limit=None, offset=None, last=None):
         self.db.check()
         if filters is None: # pragma: no cover
             filters = ()
+        if last is not None and limit is not None:
+            raise InvoiceArgumentError("le opzioni --last e --limit sono incompatibili")
+        table_mode = self.db.get_config_option('table_mode', table_mode)
+        outputs = self.get_doc_outputs(output_filename, table_mode)
+        # without python filters the order and the page (limit/offset, or the
+        # last invoices) are applied by the db
+        if not filters:
+            if len(outputs) == 1 and outputs[0].mode == conf.TABLE_MODE_NDJSON:
+                self.stream_invoice_values(list_field_names=list_field_names, date_from=date_from, date_to=date_to,
+                    order_field_names=order_field_names, limit=limit, offset=offset, last=last, output_filename=outputs[0].file)
+                return
+            if limit is not None or offset is not None or last is not None:
+                invoices = self.db.load_invoice_page(date_from=date_from, date_to=date_to, order_field_names=order_field_names,
+                                                     limit=limit, offset=offset, last=last)
+                self.list_invoices(invoices, header=header, list_field_names=list_field_names, table_mode=table_mode,
+                    output_filename=output_filename, text_width=text_width,
+                    invoice_count=self.db.count_invoices(date_from=date_from, date_to=date_to))
+                return
         invoice_collection = self.filter_invoice_collection(self.db.load_invoice_collection(), filters=filters, date_from=date_from, date_to=date_to)
         self.list_invoice_collection(invoice_collection, header=header, list_field_names=list_field_names, order_field_names=order_field_names, table_mode=table_mode,
-            output_filename=output_filename)
+            output_filename=output_filename, text_width=text_width, limit=limit, offset=offset, last=last)
 
     def impl_dump(self, *, filters=None, date_from=None, date_to=None):
         self.db.check()
         invoice_collection = self.filter_invoice_collection(self.db.load_invoice_collection(), filters=filters, date_from=date_from, date_to=date_to)
         self.dump_invoice_collection(invoice_collection)
 
-    def impl_report(self, *, filters=None):
+    def impl_report(self, *, filters=None, stats_backend=None):
         self.db.check()
         if filters is None:
             filters = ()
-        invoice_collection = self.filter_invoice_collection(self.db.load_invoice_collection(), filters=filters)
-        self.report_invoice_collection(invoice_collection)
+        stats_backend, sql_conditions = self.get_stats_backend(stats_backend, filters=filters, stats_group_names=REPORT_GROUP_NAMES)
+        self.logger.debug("report: backend {}".format(stats_backend))
+        if stats_backend == conf.STATS_BACKEND_SQL:
+            self.print_report(self.sql_report_years(sql_conditions))
+        else:
+            invoice_collection = self.filter_invoice_collection(self.db.load_invoice_collection(), filters=filters)
+            self.report_invoice_collection(invoice_collection)
+
+    def impl_export(self, *, output_filename, filters=None, date_from=None, date_to=None, export_format=None):
+        """impl_export(*, output_filename, filters=None, date_from=None, date_to=None, export_format=None) -> number of invoices
+           Exports the invoices in a columnar file; without python filters
+           the values are streamed from the db cursor.
+        """
+        self.db.check()
+        export_format = get_columnar_format(export_format)
+        field_names = Invoice._fields
+        if filters:
+            invoice_collection = self.filter_invoice_collection(self.db.load_invoice_collection(), filters=filters, date_from=date_from, date_to=date_to)
+            invoice_collection.sort()
+            rows = invoice_collection
+        else:
+            rows = self.db.iter_invoice_values(field_names, date_from=date_from, date_to=date_to)
+        num_rows = write_columnar(output_filename, rows, columnar_format=export_format)
+        self.printer("esportate {} fatture in {} (formato {})".format(num_rows, output_filename, export_format))
+        return num_rows
 
     def impl_yreport(self, *, year=None, table_mode=None, output_filename=None, header=None):
         table_mode = self.db.get_config_option('table_mode', table_mode)
@@ -587,7 +822,7 @@ class InvoiceProgram(object):
 
         header = ["TipoDocumento", "DataDocumento", "NumDocumento", "DataPagamento", "CodiceFiscale",
                   "TipoSpesa", "FlagTipoSpesa", "Importo", "DataDocumentoRimborso", "NumDocumentoRimborso"]
-        with document(file=self.get_doc_file(output_filename), mode=table_mode, logger=self.logger) as doc:
+        with documents(self.get_doc_outputs(output_filename, table_mode), logger=self.logger) as doc:
             page_template = doc.create_page_template(field_names=all_field_names, header=header, align=align)
             doc_formats = Formats()
             rows = []
@@ -611,222 +846,143 @@ class InvoiceProgram(object):
             doc.add_page(page_template=page_template, data=rows, title=None, formats=doc_formats, prologue=None, epilogue=None)
 
         
+    def get_summary_years(self, year):
+        """get_summary_years(year) -> tuple of years
+           year can be None (current year), a year or a sequence of years.
+        """
+        if year is None:
+            year = datetime.datetime.now().year
+        if isinstance(year, int):
+            return (year, )
+        return tuple(sorted(set(year)))
+
+    def bucket_by_month(self, invoice_collection, years):
+        """bucket_by_month(invoice_collection, years) -> OrderedDict
+           Distributes the sorted invoices of the given years to the
+           (year, month) buckets with a single pass; all the months of the
+           years are present, possibly empty.
+        """
+        month_invoices = collections.OrderedDict(((year, month), []) for year in years for month in range(1, 12 + 1))
+        invoice_collection.sort()
+        for invoice in invoice_collection:
+            invoices = month_invoices.get((invoice.year, invoice.date.month), None)
+            if invoices is not None:
+                invoices.append(invoice)
+        return month_invoices
+
     def impl_summary(self, *, year=None, table_mode=None, output_filename=None, header=None):
         table_mode = self.db.get_config_option('table_mode', table_mode)
-        header = self.db.get_config_option('header', table_mode)
         self.db.check()
-        filters = []
-        if year is None:
-            year = datetime.datetime.now().year
-        filters.append(lambda i: i.year == year)
-        invoice_collection = self.filter_invoice_collection(self.db.load_invoice_collection(), filters=filters)
+        years = self.get_summary_years(year)
+        invoice_collection = self.db.load_invoice_collection(
+            where="year IN ({})".format(', '.join(str(year) for year in years)))
+        month_invoices = self.bucket_by_month(invoice_collection, years)
         
-        all_field_names = MReport._fields
-
-        #"number", "fee", "cpa", "taxable_income", "vat", "empty", "deduction", "income"
-        header = ["N.DOC.", "DATA", "CODICE FISCALE", "NOME", "COMPENSO", "RIMBORSI", "C.P.A.", "IMPONIBILE IVA", "IVA 22%", "ES.IVA ART.10", "R.A.", "BOLLI", "TOTALE"]
-        total_keys = 'fee', 'refunds', 'cpa', 'taxable_income', 'vat', 'deduction', 'taxes', 'income'
-
+        general_info = load_info()['general']
+        render_summary(self.get_doc_outputs(output_filename, table_mode), month_invoices,
+                       summary_prologue=general_info['summary_prologue'],
+                       summary_epilogue=general_info['summary_epilogue'],
+                       year_titles=len(years) > 1,
+                       logger=self.logger)
+
+    def impl_summary_years(self, *, years, jobs=None, table_mode=None, output_filename=None):
+        """impl_summary_years(*, years, jobs=None, table_mode=None, output_filename=None) -> list of SummaryYearResult
+           Renders a summary file for each year; the output filenames must
+           contain '{year}'. The invoices are loaded once, the files are
+           rendered by 'jobs' worker processes; a failing year does not stop
+           the other ones.
+        """
+        table_mode = self.db.get_config_option('table_mode', table_mode)
+        outputs = self.get_doc_outputs(output_filename, table_mode)
+        for output in outputs:
+            if not isinstance(output.file, str) or '{year}' not in output.file:
+                raise InvoiceArgumentError("il nome del file di output deve contenere '{year}'")
+        self.db.check()
+        years = self.get_summary_years(years)
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        jobs = max(1, min(jobs, len(years)))
+        invoice_collection = self.db.load_invoice_collection(
+            where="year IN ({})".format(', '.join(str(year) for year in years)))
+        month_invoices = self.bucket_by_month(invoice_collection, years)
         general_info = load_info()['general']
         summary_prologue = general_info['summary_prologue']
         summary_epilogue = general_info['summary_epilogue']
-        number_fields = {"fee", "refunds", "cpa", "taxable_income", "vat", "deduction", "taxes", "income"}
-        number_cols = []
-        date_fields = {"date"}
-        date_cols = []
-        for c, field in enumerate(MReport._fields):
-            if field in number_fields:
-                number_cols.append(c)
-            elif field in date_fields:
-                date_cols.append(c)
-
-        align = conf.ALIGN.copy()
-        for key in total_keys:
-            align[key] = ">"
-
-        with document(file=self.get_doc_file(output_filename), mode=table_mode, logger=self.logger) as doc:
-            doc.define_format("bold", {"bold": True})
-            doc.define_format("bold_yellow", {"bold": True, "bg_color": "yellow"})
-            doc.define_format("date_value", {"align": "right", "num_format": "dd/mm/yyyy"})
-            doc.define_format("money_value", {"align": "right", "num_format": "0.00"})
-            doc.define_format("money_value_total", {"align": "right", "num_format": "0.00", "bold": True, "bg_color": "yellow"})
-            page_template = doc.create_page_template(field_names=all_field_names, header=header, align=align)
-            for month in range(1, 12 + 1):
-                m_filter = lambda i: i.date.month == month
-                invoices = self.filter_invoice_collection(invoice_collection, filters=[m_filter])
-                rows = []
-                month_name = conf.MONTH_TRANSLATION[month - 1]
-                prologue = None
-                epilogue = None
-                row_offset = 0
-                doc_formats = Formats()
-                if table_mode == conf.TABLE_MODE_XLSX:
-                    prologue = []
-                    if summary_prologue:
-                        for line in summary_prologue.split('\n'):
-                            prologue.append((line,))
-                            doc_formats.add_format("bold", row=len(prologue) - 1, col=None)
-                        #prologue.append(('',))
-                    prologue.append(('mese:', month_name))
-                    doc_formats.add_format("bold_yellow", row=len(prologue) - 1, col=None)
-                    prologue.append(('',))
-                    row_offset += len(prologue)
-                total = {}
-                for key in total_keys:
-                    total[key] = 0.0
-                row_begin = row_offset
-                for invoice in invoices:
-                    mreport = MReport(
-                        number=invoice.number,
-                        date=invoice.date,
-                        tax_code=invoice.tax_code,
-                        name=invoice.name,
-                        fee=invoice.fee,
-                        refunds=invoice.refunds,
-                        taxes=invoice.taxes,
-                        cpa=invoice.cpa,
-                        taxable_income=sum(getattr(invoice, skey) for skey in conf.DERIVATIVES['vat']),
-                        vat=invoice.vat,
-                        empty="",
-                        deduction=invoice.deduction,
-                        income=invoice.income,
-                    )
-                    rows.append(mreport)
-                    for col in number_cols:
-                        doc_formats.add_format("money_value", row=row_offset + len(rows), col=col)
-                    for col in date_cols:
-                        doc_formats.add_format("date_value", row=row_offset + len(rows), col=col)
-                    for key in total_keys:
-                        val = getattr(mreport, key)
-                        if val is not None:
-                            total[key] += val
-                row_end = row_offset + len(rows)
-                total["number"] = "TOTALE"
-                total["empty"] = ""
-                total["date"] = ""
-                total["tax_code"] = ""
-                total["name"] = ""
-                row_begin = row_offset
-                if header:
-                    nh = 1
-                else:
-                    nh = 0
-                for key in total_keys:
-                    col = MReport._fields.index(key)
-                    total[key] = Formula("SUM", col, row_begin + nh, row_end, value=round(total[key], 2))
-                if table_mode == conf.TABLE_MODE_XLSX:
-                    separator = {key: "" for key in MReport._fields}
-                    rows.append(MReport(**separator))
-#                    for key in total_keys:
-#                        col = MReport._fields.index(key)
-#                        total[key] = "=SUM({l}{rb}:{l}{re})".format(l=letters[col], rb=row_begin + 3, re=row_end + 2)
-#                        print(key, col, total[key])
-                rows.append(MReport(**total))
-                for col in number_cols:
-                    doc_formats.add_format("money_value_total", row=row_offset + len(rows), col=col)
-                num_rows = row_offset + len(rows)
-                doc_formats.add_format("bold", row=0 + row_offset, col=None)
-                doc_formats.add_format("bold", row=None, col=0)
-                if header:
-                    num_rows += 1
-                doc_formats.add_format("bold_yellow", row=num_rows - 1, col=None)
-                if table_mode == conf.TABLE_MODE_XLSX:
-                    if summary_epilogue:
-                        epilogue = []
-                        #epilogue.insert(0, ('',))
-                        for line in summary_epilogue.split('\n'):
-                            epilogue.append((line,))
-                            doc_formats.add_format("bold", row=num_rows + len(epilogue) - 1, col=None)
-                doc.add_page(page_template=page_template, data=rows, title=month_name, formats=doc_formats, prologue=prologue, epilogue=epilogue)
+        year_args = collections.OrderedDict()
+        for year in years:
+            year_month_invoices = collections.OrderedDict(
+                ((year, month), month_invoices[(year, month)]) for month in range(1, 12 + 1))
+            # only '{year}' is substituted here, '{mode}' is left to document()
+            year_outputs = [DocumentOutput(file=output.file.replace('{year}', str(year)), mode=output.mode) for output in outputs]
+            year_args[year] = (year_outputs, year_month_invoices,
+                               summary_prologue, summary_epilogue, self.logger)
+
+        self.logger.debug("summary di {} anni su {} processi...".format(len(years), jobs))
+        outcomes = collections.OrderedDict()
+        if jobs == 1:
+            for year, args in year_args.items():
+                try:
+                    outcomes[year] = (_render_summary_year(*args), None)
+                except Exception as err:
+                    outcomes[year] = (None, err)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = collections.OrderedDict(
+                    (year, executor.submit(_render_summary_year, *args)) for year, args in year_args.items())
+                for year, future in futures.items():
+                    try:
+                        outcomes[year] = (future.result(), None)
+                    except Exception as err:
+                        outcomes[year] = (None, err)
+
+        results = []
+        for year, (elapsed, error) in outcomes.items():
+            invoice_count = sum(len(invoices) for invoices in year_args[year][1].values())
+            year_filenames = ', '.join(output.file.replace('{mode}', str(output.mode)) for output in year_args[year][0])
+            result = SummaryYearResult(year=year, invoice_count=invoice_count, output_filename=year_filenames,
+                                       elapsed=elapsed, error=error)
+            if error is None:
+                self.printer("{}: {} fatture -> {} [{:.3f}s]".format(year, invoice_count, result.output_filename, elapsed))
+            else:
+                self.printer("{}: {} fatture -> {} ERRORE: {}: {}".format(year, invoice_count, result.output_filename, type(error).__name__, error))
+                self.logger.error("summary {}: {}".format(year, error))
+            results.append(result)
+        return results
+
+    def group_by(self, invoices, stats_group, keep_invoices=False):
+        """group_by(invoices, stats_group, keep_invoices=False) -> list
+           Returns the list of ((values, date_from, date_to), aggregate) for
+           the groups of a simple or composite stats group.
+        """
+        return [(group_value(stats_group, key, group_aggregate), group_aggregate) \
+                for key, group_aggregate in aggregate(invoices, stats_group, keep_invoices=keep_invoices)]
+
+    def get_stats_backend(self, stats_backend, filters, stats_group_names):
+        """get_stats_backend(stats_backend, filters, stats_group_names) -> (backend, sql_conditions)
+           The SQL backend applies the filters translated to SQL conditions;
+           with the 'auto' backend it is used when all the filters can be
+           translated and the groups are supported.
+        """
+        if stats_backend is None:
+            stats_backend = conf.DEFAULT_STATS_BACKEND
+        sql_conditions, python_filters = sql_filters(self.db, filters)
+        sql_applicable = not python_filters and sql_group_supported(stats_group_names)
+        if stats_backend == conf.STATS_BACKEND_AUTO:
+            if sql_applicable:
+                stats_backend = conf.STATS_BACKEND_SQL
+            else:
+                stats_backend = conf.STATS_BACKEND_PYTHON
+        elif stats_backend == conf.STATS_BACKEND_SQL and not sql_applicable:
+            if python_filters:
+                raise InvoiceArgumentError("backend {!r}: i filtri {} non sono supportati".format(
+                    stats_backend, ', '.join(repr(filter_source) for filter_source in python_filters)))
+            else:
+                raise InvoiceArgumentError("backend {!r}: i raggruppamenti {} non sono supportati".format(
+                    stats_backend, GROUP_SEPARATOR.join(stats_group_names)))
+        return stats_backend, sql_conditions
 
-    def _get_year_group_value(self, invoices, year):
-        return (year,
-                datetime.date(year, 1, 1),
-                datetime.date(year, 12, 31))
-
-    def _get_month_group_value(self, invoices, year, month):
-        date_from = datetime.date(year, month, 1)
-        date_to = datetime.date(year, month, calendar.monthrange(year, month)[1])
-        return (date_from.strftime("%Y-%m"),
-                date_from,
-                date_to)
-
-    def _get_week_group_value(self, invoices, year, week_number):
-        date_from, date_to = self.get_week_range(year, week_number)
-        return ("{:4d}:{:02d}".format(year, week_number),
-                date_from,
-                date_to)
-
-    def _get_day_group_value(self, invoices, date):
-        return (date,
-                date,
-                date)
-
-    def _get_weekday_group_value(self, invoices, weekday):
-        return (conf.WEEKDAY_TRANSLATION[weekday],
-                invoices[0].date,
-                invoices[-1].date)
-
-    def _get_group_value(self, invoices, value):
-        return (value,
-                invoices[0].date,
-                invoices[-1].date)
-
-    def _get_task_group_value(self, invoices, tax_code, name, service):
-        return ((tax_code, name, service),
-                invoices[0].date,
-                invoices[-1].date)
-
-    def group_by(self, invoice_collection, stats_group):
-        invoice_collection.sort()
-        invoices = invoice_collection
-        if stats_group == conf.STATS_GROUP_YEAR:
-            group_function = lambda invoice: (invoice.year, )
-            group_value_function = self._get_year_group_value
-        elif stats_group == conf.STATS_GROUP_MONTH:
-            group_function = lambda invoice: (invoice.year, invoice.date.month)
-            group_value_function = self._get_month_group_value
-        elif stats_group == conf.STATS_GROUP_WEEK:
-            group_function = lambda invoice: (invoice.year, self.get_week_number(invoice.date))
-            group_value_function = self._get_week_group_value
-        elif stats_group == conf.STATS_GROUP_DAY:
-            group_function = lambda invoice: (invoice.date, )
-            group_value_function = self._get_day_group_value
-        elif stats_group == conf.STATS_GROUP_WEEKDAY:
-            invoices = sorted(invoice_collection, key=lambda invoice: invoice.date.weekday())
-            group_function = lambda invoice: (invoice.date.weekday(), )
-            group_value_function = self._get_weekday_group_value
-        elif stats_group == conf.STATS_GROUP_SERVICE:
-            invoices = sorted(invoice_collection, key=lambda invoice: invoice.service)
-            group_function = lambda invoice: (invoice.service, )
-            group_value_function = self._get_group_value
-        elif stats_group == conf.STATS_GROUP_TASK:
-            invoices = sorted(invoice_collection, key=lambda invoice: (invoice.tax_code, invoice.name, invoice.service))
-            group_function = lambda invoice: (invoice.tax_code, invoice.name, invoice.service, )
-            group_value_function = self._get_task_group_value
-        elif stats_group == conf.STATS_GROUP_CLIENT:
-            invoices = sorted(invoice_collection, key=lambda invoice: invoice.tax_code)
-            group_function = lambda invoice: (invoice.tax_code, )
-            group_value_function = self._get_group_value
-        elif stats_group == conf.STATS_GROUP_CITY:
-            invoices = sorted(invoice_collection, key=lambda invoice: invoice.city)
-            group_function = lambda invoice: (invoice.city, )
-            group_value_function = self._get_group_value
-        group_value = None
-        group = []
-        for invoice in invoices:
-            value = group_function(invoice)
-            if group_value is None:
-                group_value = value
-            if value != group_value:
-                yield group_value_function(group, *group_value), tuple(group)
-                del group[:]
-                group_value = value
-            group.append(invoice)
-        if group:
-            yield group_value_function(group, *group_value), group
-   
-    def impl_stats(self, *, filters=None, date_from=None, date_to=None, stats_group=None, total=None, stats_mode=None, header=None, table_mode=None, output_filename=None):
+    def impl_stats(self, *, filters=None, date_from=None, date_to=None, stats_group=None, total=None, stats_mode=None, header=None, table_mode=None, output_filename=None,
+                   stats_backend=None, stats_window=None):
         total = self.db.get_config_option('total', total)
         header = self.db.get_config_option('header', header)
         table_mode = self.db.get_config_option('table_mode', table_mode)
@@ -834,30 +990,46 @@ class InvoiceProgram(object):
         if filters is None: # pragma: no cover
             filters = ()
 
+        if stats_mode == conf.STATS_MODE_ROLLING:
+            self.rolling_stats(filters=filters, date_from=date_from, date_to=date_to, stats_group=stats_group, stats_window=stats_window,
+                               total=total, header=header, table_mode=table_mode, output_filename=output_filename)
+            return
+
         if stats_group is None:
             stats_group = conf.DEFAULT_STATS_GROUP
+        if isinstance(stats_group, str):
+            stats_group_names = parse_group(stats_group)
+        else:
+            stats_group_names = tuple(stats_group)
+        stats_group = GROUP_SEPARATOR.join(stats_group_names)
 
         if stats_mode is None:
             stats_mode = conf.DEFAULT_STATS_MODE
 
-        global_invoice_collection = self.db.load_invoice_collection()
-        invoice_collection = self.filter_invoice_collection(global_invoice_collection, filters=filters, date_from=date_from, date_to=date_to)
-        invoice_collection.sort()
-        if invoice_collection:
-            group_translation = {
-                conf.STATS_GROUP_YEAR:		'anno',
-                conf.STATS_GROUP_MONTH:		'mese',
-                conf.STATS_GROUP_WEEK:		'settimana',
-                conf.STATS_GROUP_DAY:		'giorno',
-                conf.STATS_GROUP_WEEKDAY:	'giorno',
-                conf.STATS_GROUP_CLIENT:	Invoice.get_field_translation('tax_code'),
-                conf.STATS_GROUP_SERVICE:	Invoice.get_field_translation('service'),
-                conf.STATS_GROUP_TASK:		'incarico',
+        stats_backend, sql_conditions = self.get_stats_backend(stats_backend, filters=filters, stats_group_names=stats_group_names)
+        self.logger.debug("stats: backend {}".format(stats_backend))
+        if stats_backend == conf.STATS_BACKEND_SQL:
+            groups = sql_aggregate(self.db, stats_group_names, date_from=date_from, date_to=date_to, filters=sql_conditions,
+                                   hydrate_first=(stats_group == conf.STATS_GROUP_CLIENT))
+            total_invoice_count, total_income, total_client_count = sql_totals(self.db, date_from=date_from, date_to=date_to,
+                                                                               filters=sql_conditions)
+            make_client_date_index = lambda: ClientDateIndex(self.db.load_client_dates())
+        else:
+            global_invoice_collection = self.db.load_invoice_collection()
+            invoice_collection = self.filter_invoice_collection(global_invoice_collection, filters=filters, date_from=date_from, date_to=date_to)
+            invoice_collection.sort()
+            groups = aggregate(invoice_collection, stats_group_names)
+            total_income = sum(invoice.income for invoice in invoice_collection)
+            total_invoice_count = len(invoice_collection)
+            total_client_count = len(set(invoice.tax_code for invoice in invoice_collection))
+            make_client_date_index = lambda: ClientDateIndex(global_invoice_collection)
+        if groups:
+            group_translation = {name: get_group_kind(name).label for name in group_kind_names()}
+            group_translation.update({
                 'name':                         Invoice.get_field_translation('name'),
-                conf.STATS_GROUP_CITY:		Invoice.get_field_translation('city'),
                 'from':				'da:',
                 'to':				'a:',
-            }
+            })
             convert = {
                 'income': lambda income: '{:.2f}'.format(income),
                 'income_percentage': lambda income_percentage: '{:.2%}'.format(income_percentage),
@@ -902,10 +1074,12 @@ class InvoiceProgram(object):
                 field_names = (cc_field_name, 'continuation')
             else:
                 field_names = (cc_field_name, )
-            if stats_group == conf.STATS_GROUP_TASK:
-                stats_group_fields = ('client', 'name', 'service')
-            else:
-                stats_group_fields = (stats_group, )
+            stats_group_fields = ()
+            for name in stats_group_names:
+                if name == conf.STATS_GROUP_TASK:
+                    stats_group_fields += ('client', 'name', 'service')
+                else:
+                    stats_group_fields += (name, )
             if stats_mode == conf.STATS_MODE_SHORT:
                 group_field_names = stats_group_fields
                 field_names += ('invoice_count', 'income', 'income_percentage')
@@ -922,12 +1096,6 @@ class InvoiceProgram(object):
                 group_header = tuple(group_translation[field_name] for field_name in group_field_names)
                 header = group_header + field_header
             all_field_names = group_field_names + field_names
-            first_invoice = invoice_collection[0]
-            last_invoice = invoice_collection[-1]
-            first_date = first_invoice.date
-            last_date = last_invoice.date
-            total_income = sum(invoice.income for invoice in invoice_collection)
-            total_invoice_count = len(invoice_collection)
             def bar(value, max_value, length=10, block='#', empty=' '):
                 if max_value == 0: 
                     block_length, empty_length = 0, length
@@ -939,19 +1107,15 @@ class InvoiceProgram(object):
             if total:
                 total_row = {field_name: 0 for field_name in cum_field_names}
                 total_s = "TOTALE"
-                if stats_group == conf.STATS_GROUP_TASK:
-                    total_row['client'] = total_s
-                    total_row['name'] = ""
-                    total_row['service'] = ""
-                else:
-                    total_row[stats_group] = total_s
+                for field_name in stats_group_fields:
+                    total_row[field_name] = ""
+                total_row[stats_group_fields[0]] = total_s
                 total_row['continuation'] = "--"
                 total_row[cc_field_name] = cc_total
                 total_row['from'] = ""
                 total_row['to'] = ""
                 total_row['income_bar'] = "--"
                 total_row['invoice_count_bar'] = "--"
-            total_client_count = len(set(invoice.tax_code for invoice in invoice_collection))
             configuration = self.db.load_configuration()
             year = datetime.timedelta(days=configuration.max_interruption_days)
             pre_post_symbol = {
@@ -964,54 +1128,46 @@ class InvoiceProgram(object):
                          False: '[---]',
                        },
             }
-            for (group_value, group_date_from, group_date_to), group in self.group_by(invoice_collection, stats_group):
+            if stats_group == conf.STATS_GROUP_CLIENT:
+                client_date_index = make_client_date_index()
+            for key, group_aggregate in groups:
+                group_values, group_date_from, group_date_to = group_value(stats_group_names, key, group_aggregate)
                 if date_from is not None and group_date_from is not None:
                     group_date_from = max(group_date_from, date_from)
                 if date_to is not None and group_date_to is not None:
                     group_date_to = min(group_date_to, date_to)
-                income = sum(invoice.income for invoice in group)
+                income = group_aggregate.income
                 if total_income != 0.0:
                     income_percentage = income / total_income
                 else:
                     income_percentage = 0.0
-                clients = set(invoice.tax_code for invoice in group)
                 data = {
-                    'stats_group':		group_translation[stats_group],
-                    'invoice_count':		len(group),
-                    'client_count':		len(clients),
+                    'stats_group':		group_label(stats_group_names),
+                    'invoice_count':		group_aggregate.count,
+                    'client_count':		group_aggregate.client_count,
                     'income':			income,
                     'income_percentage':	income_percentage,
                     'income_bar':		None,
                     'invoice_count_bar':	None,
-                    stats_group:		group_value,
                     'from':			group_date_from,
                     'to':			group_date_to,
                 }
+                for name, value in zip(stats_group_names, group_values):
+                    if name == conf.STATS_GROUP_TASK:
+                        data['client'], data['name'], data['service'] = value
+                    else:
+                        data[name] = value
                 if stats_group == conf.STATS_GROUP_CLIENT:
-                    continuation = None
-                    pre_filters = [
-                        lambda i: (i.tax_code == group_value) and (i.date < group_date_from and i.date >= group_date_from - year),
-                    ]
-                    pre_collection = self.filter_invoice_collection(global_invoice_collection, filters=pre_filters)
-                    pre = len(pre_collection) > 0
-                        
-                    post_filters = [
-                        lambda i: (i.tax_code == group_value) and (i.date > group_date_to and i.date <= group_date_to + year),
-                    ]
-                    post_collection = self.filter_invoice_collection(global_invoice_collection, filters=post_filters)
-                    post = len(post_collection) > 0
-
+                    tax_code = group_values[0]
+                    pre = client_date_index.any_before(tax_code, group_date_from, year)
+                    post = client_date_index.any_after(tax_code, group_date_to, year)
                     data['continuation'] = pre_post_symbol[pre][post]
                 if total:
                     for field_name in cum_field_names:
                         total_row[field_name] += data[field_name]
                     total_row['client_count'] = total_client_count
                 if stats_group == conf.STATS_GROUP_CLIENT:
-                    data[cc_field_name] = group[0].name
-                elif stats_group == conf.STATS_GROUP_TASK:
-                    data['client'] = group[0].tax_code
-                    data['name'] = group[0].name
-                    data['service'] = group[0].service
+                    data[cc_field_name] = group_aggregate.first.name
                 rows.append(data)
             #bars
             max_income = max(row['income'] for row in rows)
@@ -1022,7 +1178,7 @@ class InvoiceProgram(object):
                 row['invoice_count_bar'] = bar(row['invoice_count'], max_invoice_count)
             if total:
                 rows.append(total_row)
-            with document(file=self.get_doc_file(output_filename), mode=table_mode, logger=self.logger) as doc:
+            with documents(self.get_doc_outputs(output_filename, table_mode), logger=self.logger) as doc:
                 page_template = doc.create_page_template(
                     field_names=all_field_names,
                     header=header,
@@ -1031,6 +1187,84 @@ class InvoiceProgram(object):
                     getter=item_getter)
                 doc.add_page(page_template, rows)
 
+    def rolling_stats(self, *, filters=None, date_from=None, date_to=None, stats_group=None, stats_window=None, total=None, header=None, table_mode=None,
+                      output_filename=None):
+        """rolling_stats(*, filters=None, date_from=None, date_to=None, stats_group=None, stats_window=None, total=None, header=None, table_mode=None, output_filename=None)
+           The moving totals of the invoices in the window of days ending at
+           each invoice date: a series for each group, or a single series
+           without a stats group. Each series is a linear pass on an
+           IncomeIndex; the date range is answered by the index itself, so
+           the collection is filtered only for the user filters.
+        """
+        if stats_window is None:
+            stats_window = datetime.timedelta(days=conf.DEFAULT_STATS_WINDOW_DAYS)
+        invoice_collection = self.db.load_invoice_collection()
+        if filters:
+            invoice_collection = self.filter_invoice_collection(invoice_collection, filters=filters)
+        invoice_collection.sort()
+        income_index = IncomeIndex(invoice_collection)
+        if stats_group is None:
+            stats_group_names = ()
+            series = [((), income_index)]
+        else:
+            if isinstance(stats_group, str):
+                stats_group_names = parse_group(stats_group)
+            else:
+                stats_group_names = tuple(stats_group)
+            series = [(group_values, IncomeIndex(group_aggregate.invoices)) \
+                      for (group_values, group_date_from, group_date_to), group_aggregate in self.group_by(invoice_collection, stats_group_names, keep_invoices=True)]
+        stats_group_fields = ()
+        for name in stats_group_names:
+            if name == conf.STATS_GROUP_TASK:
+                stats_group_fields += ('client', 'name', 'service')
+            else:
+                stats_group_fields += (name, )
+        all_field_names = stats_group_fields + ('from', 'to', 'invoice_count', 'income')
+        rows = []
+        for group_values, group_index in series:
+            group_data = {}
+            for name, value in zip(stats_group_names, group_values):
+                if name == conf.STATS_GROUP_TASK:
+                    group_data['client'], group_data['name'], group_data['service'] = value
+                else:
+                    group_data[name] = value
+            for window_from, window_to, invoice_count, income in group_index.rolling(stats_window, date_from=date_from, date_to=date_to):
+                data = group_data.copy()
+                data['from'] = window_from
+                data['to'] = window_to
+                data['invoice_count'] = invoice_count
+                data['income'] = income
+                rows.append(data)
+        if not rows:
+            return
+        if total:
+            total_row = {field_name: "" for field_name in stats_group_fields}
+            total_row['from'], total_row['to'] = income_index.bounds(date_from, date_to)
+            total_row['invoice_count'], total_row['income'] = income_index.totals(date_from, date_to)
+            if stats_group_fields:
+                total_row[stats_group_fields[0]] = "TOTALE"
+            else:
+                total_row['from'] = "TOTALE"
+            rows.append(total_row)
+        if header:
+            header_d = {name: get_group_kind(name).label for name in group_kind_names()}
+            header_d.update({
+                'name':                         Invoice.get_field_translation('name'),
+                'from':                         'da:',
+                'to':                           'a:',
+                'invoice_count':                'fatture',
+                'income':                       'incasso',
+            })
+            header = tuple(header_d.get(field_name, field_name) for field_name in all_field_names)
+        with documents(self.get_doc_outputs(output_filename, table_mode), logger=self.logger) as doc:
+            page_template = doc.create_page_template(
+                field_names=all_field_names,
+                header=header,
+                align=conf.ALIGN,
+                convert={'income': lambda income: '{:.2f}'.format(income)},
+                getter=item_getter)
+            doc.add_page(page_template, rows)
+
     def impl_legacy(self, patterns, filters, date_from, date_to, validate, list, report, warning_mode, error_mode, changed_tax_codes):
         invoice_collection_reader = InvoiceCollectionReader(trace=self.trace, logger=self.logger)
 
@@ -1064,16 +1298,13 @@ class InvoiceProgram(object):
                 traceback.print_exc()
             self.logger.error("{}: {}\n".format(type(err).__name__, err))
 
+    def get_validator_cache_filename(self):
+        return self.db_filename + '.validators'
+
     def compile_user_validators(self, connection=None):
-        user_validators = []
-        with self.db.connect() as connection:
-            # validators
-            for validator in self.db.load_validators(connection=connection):
-                user_validators.append((validator, self.db.Validator(
-                    Invoice.compile_filter_function(validator.filter_function),
-                    Invoice.compile_filter_function(validator.check_function),
-                    validator.message)))
-        return user_validators
+        validators = self.db.load_validators(connection=connection)
+        validator_cache = ValidatorCache(self.get_validator_cache_filename(), logger=self.logger)
+        return validator_cache.compile(validators)
     
     def impl_spy(self, *, action=None, spy_notify_level=None, spy_delay=None): # pragma: no cover
         if not observe.available():
@@ -1102,21 +1333,22 @@ class InvoiceProgram(object):
             result = doc_observer.apply_action(action)
             self.printer("spy {} -> {}".format(action, result))
         
-    def impl_scan(self, warning_mode=None, error_mode=None, changed_tax_codes=None, force_refresh=None, progressbar=None,
-                        partial_update=None, remove_orphaned=None, show_scan_report=None, table_mode=None, output_filename=None):
+    def impl_scan(self, warning_mode=None, error_mode=None, changed_tax_codes=None, progressbar=None,
+                        partial_update=None, remove_orphaned=None, show_scan_report=None, table_mode=None, output_filename=None,
+                        full_validate=False, jobs=None):
         self.db.check()
         warning_mode = self.db.get_config_option('warning_mode', warning_mode)
         error_mode = self.db.get_config_option('error_mode', error_mode)
         changed_tax_codes = self.db.get_config_option('changed_tax_codes', changed_tax_codes)
         show_scan_report = self.db.get_config_option('show_scan_report', show_scan_report)
         progressbar = self.db.get_config_option('progressbar', progressbar)
-        internal_options = self.db.load_internal_options()
-        force_refresh = force_refresh or internal_options.needs_refresh
         found_doc_filenames = set()
         db = self.db
         file_date_times = FileDateTimes()
         updated_invoice_collection = InvoiceCollection()
         removed_invoices = []
+        replaced_invoices = []
+        validation_state = None
         validation_result = self.create_validation_result(warning_mode=warning_mode, error_mode=error_mode, changed_tax_codes=changed_tax_codes)
         scan_events = {'removed': 0, 'added': 0, 'modified': 0}
         docs_pattern = os.path.join(conf.TMP_DOCS_DIR, "*.doc")
@@ -1129,6 +1361,7 @@ class InvoiceProgram(object):
             configuration = db.load_configuration(connection)
             clients = read_clients(configuration.clients)
             user_validators = self.compile_user_validators(connection)
+            revalidated_doc_filenames = self.revalidate_user_validators(validation_result, user_validators, connection=connection)
             if remove_orphaned is None:
                 remove_orphaned = configuration.remove_orphaned
             if partial_update is None:
@@ -1158,7 +1391,8 @@ class InvoiceProgram(object):
                 doc_filename_d[scan_date_time.doc_filename] = scan_date_time.scan_date_time
 
             existing_doc_filenames = collections.OrderedDict()
-            scanned_doc_filenames = set()
+            # invoices just removed by the validators are not read again
+            scanned_doc_filenames = set(revalidated_doc_filenames)
 
             # update scanned invoices
             invoice_collection = db.load_invoice_collection(connection=connection)
@@ -1177,11 +1411,22 @@ class InvoiceProgram(object):
                     to_update = False
                 if to_remove:
                     removed_invoices.append(invoice)
+                    replaced_invoices.append(invoice)
                 else:
                     if to_update:
                         existing_doc_filenames[invoice.doc_filename] = True
+                        replaced_invoices.append(invoice)
                     else:
                         updated_invoice_collection.add(invoice)
+
+            if removed_invoices or existing_doc_filenames or not found_doc_filenames.issubset(scanned_doc_filenames):
+                # the validation state is valid only if the stored invoices
+                # have not been changed since it was computed
+                if not full_validate:
+                    validation_state = db.load_validation_state(connection=connection)
+                    if validation_state is not None and validation_state.invoice_count != len(invoice_collection):
+                        validation_state = None
+                db.clear_validation_state(connection=connection)
           
             if removed_invoices:
                 discarded_doc_filenames = set()
@@ -1208,6 +1453,7 @@ class InvoiceProgram(object):
                     min_number = year_min_number.get(invoice.year, None)
                     return min_number is None or invoice.number < min_number
 
+                replaced_invoices.extend(invoice for invoice in updated_invoice_collection if not _del_invoices(invoice))
                 invoice_collection = invoice_collection.filter(_del_invoices)
                 updated_invoice_collection = updated_invoice_collection.filter(_del_invoices)
                 scan_events['removed'] += len(discarded_doc_filenames)
@@ -1244,7 +1490,24 @@ class InvoiceProgram(object):
                         scan_date_time=file_date_times[invoice.doc_filename])
                     if progressbar:
                         pbar.tick()
-                self.validate_invoice_collection(validation_result, updated_invoice_collection, user_validators=user_validators)
+                touched_invoices = new_invoices + old_invoices
+                incremental = validation_state is not None and \
+                              validation_state.fingerprint == ValidationState.make_fingerprint(validation_result, user_validators)
+                if incremental:
+                    validation_cache = self.load_validation_cache(validation_result, invoices=touched_invoices, connection=connection)
+                else:
+                    validation_cache = self.load_validation_cache(validation_result, connection=connection)
+                invoice_collection_validator = self.create_invoice_collection_validator(validation_result, user_validators=user_validators,
+                    validation_cache=validation_cache, jobs=jobs)
+                try:
+                    if incremental:
+                        invoice_collection_validator.validate_incremental(updated_invoice_collection, validation_state,
+                            touched_invoices=touched_invoices,
+                            replaced_invoices=replaced_invoices)
+                    else:
+                        invoice_collection_validator.validate(updated_invoice_collection)
+                finally:
+                    self.store_validation_cache(validation_cache, prune=not incremental, connection=connection)
                 if validation_result.num_errors():
                     message = "validazione fallita - {} errori".format(validation_result.num_errors())
                     if not partial_update:
@@ -1267,6 +1530,8 @@ class InvoiceProgram(object):
             if progressbar and pbar:
                 pbar.complete()
             self.delete_failing_invoices(validation_result, connection=connection)
+            if existing_doc_filenames:
+                self.store_validation_state(invoice_collection_validator, validation_result, user_validators, connection=connection)
                     
             if validation_result.num_errors():
                 failing_invoices = InvoiceCollection(validation_result.failing_invoices().values())
@@ -1303,19 +1568,58 @@ class InvoiceProgram(object):
                 self.list_invoice_collection(InvoiceCollection(last_invoice_of_the_year.values()), list_field_names=None, header=None, order_field_names=None,
                     table_mode=table_mode, output_filename=output_filename)
 
-        if internal_options.needs_refresh and force_refresh:
-            self.db.store_internal_options(self.db.DEFAULT_INTERNAL_OPTIONS)
+        db.store_snapshot()
         return validation_result, scan_events, updated_invoice_collection
 
+    def revalidate_user_validators(self, validation_result, user_validators, connection=None):
+        """revalidate_user_validators(validation_result, user_validators, connection=None) -> set
+           If the validators table has changed since the stored invoices have
+           been validated, only the new or changed validators are evaluated
+           on the stored invoices; the invoices whose outcome flips are
+           removed from the db. Returns their doc filenames.
+        """
+        db = self.db
+        with db.connect(connection) as connection:
+            validators_generation = db.load_validators_generation(connection=connection)
+            if validators_generation.generation == validators_generation.validated_generation:
+                return set()
+            validated_validators = db.load_validated_validators(connection=connection)
+            validated_validator_set = set(validated_validators)
+            changed_validators = [(validator, compiled_validator) for validator, compiled_validator in user_validators \
+                                  if validator not in validated_validator_set]
+            failing_doc_filenames = set()
+            if changed_validators:
+                invoice_collection_validator = self.create_invoice_collection_validator(validation_result, user_validators=user_validators)
+                invoice_collection_validator.revalidate_user_validators(db.load_invoice_collection(connection=connection), changed_validators)
+                failing_doc_filenames.update(validation_result.failing_invoices())
+            if failing_doc_filenames:
+                self.delete_failing_invoices(validation_result, connection=connection)
+                db.clear_validation_state(connection=connection)
+            else:
+                # the validation state is still valid for the new validators
+                db.update_validation_state_fingerprint(
+                    ValidationState.make_fingerprint(validation_result, [(validator, None) for validator in validated_validators]),
+                    ValidationState.make_fingerprint(validation_result, user_validators),
+                    connection=connection)
+            db.store_validated_validators([validator for validator, compiled_validator in user_validators], connection=connection)
+        return failing_doc_filenames
+
     def delete_failing_invoices(self, validation_result, connection=None):
         db = self.db
         with db.connect(connection) as connection:
-            year_numbers = {}
-            for invoice in validation_result.failing_invoices().values():
-                year_numbers.setdefault(invoice.year, []).append(invoice.number)
-            for year, numbers in year_numbers.items():
-                where = ['year == {}'.format(invoice.year), 'number in ({})'.format(', '.join(str(number) for number in numbers))]
-                db.delete('invoices', where=where, connection=connection)
+            doc_filenames = [Path.db_to(doc_filename) for doc_filename in validation_result.failing_invoices()]
+            if doc_filenames:
+                cursor = connection.cursor()
+                for doc_filename in doc_filenames:
+                    db.execute(cursor, "DELETE FROM invoices WHERE doc_filename == ?;", [doc_filename])
+
+    def store_validation_state(self, invoice_collection_validator, validation_result, user_validators, connection=None):
+        db = self.db
+        with db.connect(connection) as connection:
+            validation_state = invoice_collection_validator.make_validation_state(
+                fingerprint=ValidationState.make_fingerprint(validation_result, user_validators),
+                invoice_count=db.count('invoices', connection=connection))
+            db.store_validation_state(validation_state, connection=connection)
                     
     ## functions
     def filter_invoice_collection(self, invoice_collection, filters, date_from=None, date_to=None):
@@ -1334,105 +1638,30 @@ class InvoiceProgram(object):
                 invoice_collection = invoice_collection.filter(filter_source)
         return invoice_collection
 
-    def validate_invoice_collection(self, validation_result, invoice_collection, user_validators=()):
-        self.logger.debug("validation of {} invoices...".format(len(invoice_collection)))
-        invoice_collection.sort()
+    def create_invoice_collection_validator(self, validation_result, user_validators=(), validation_cache=None, jobs=None):
+        return InvoiceCollectionValidator(
+            validation_result=validation_result,
+            user_validators=user_validators,
+            logger=self.logger,
+            validation_cache=validation_cache,
+            jobs=jobs,
+        )
 
-        # verify fields definition:
-        for invoice in invoice_collection:
-            invoice.validate(validation_result=validation_result)
+    def load_validation_cache(self, validation_result, invoices=None, connection=None):
+        if invoices is None:
+            content_hashes = None
+        else:
+            content_hashes = [ValidationCache.content_hash(invoice) for invoice in invoices]
+        return self.db.load_validation_cache(ValidationCache.make_fingerprint(validation_result),
+            content_hashes=content_hashes, connection=connection)
 
-        # verify first/last name exchange:
-        tnd = {}
-        ntd = {}
-        for invoice in invoice_collection:
-            if invoice.tax_code in tnd:
-                nd = tnd[invoice.tax_code]
-                for i_name, i_doc_filenames in nd.items():
-                    if i_name != invoice.name:
-                        if validation_result.changed_tax_codes is None or invoice.tax_code not in validation_result.changed_tax_codes:
-                            message = "fattura {f}: il codice_fiscale {t!r} è associato al nome {n!r}, mentre è stato associato ad un altro nome {pn!r} in #{c} fatture".format(
-                                f=invoice.doc_filename,
-                                t=invoice.tax_code,
-                                n=invoice.name,
-                                pn=i_name,
-                                c=len(i_doc_filenames),
-                            )
-                            validation_result.add_warning(invoice, InvoiceMultipleNamesError, message)
-            tnd.setdefault(invoice.tax_code, {}).setdefault(invoice.name, []).append(invoice.doc_filename)
-            if invoice.name in ntd:
-                td = ntd[invoice.name]
-                for i_tax_code, i_doc_filenames in td.items():
-                    if i_tax_code != invoice.tax_code:
-                        message = "fattura {f}: il nome {n!r} è associato al codice_fiscale {t!r}, mentre è stato associato ad un altro codice_fiscale {pt!r} in #{c} fatture".format(
-                            f=invoice.doc_filename,
-                            t=invoice.tax_code,
-                            n=invoice.name,
-                            pt=i_tax_code,
-                            c=len(i_doc_filenames),
-                        )
-                        validation_result.add_warning(invoice, InvoiceMultipleTaxCodesError, message)
-            ntd.setdefault(invoice.name, {}).setdefault(invoice.tax_code, []).append(invoice.doc_filename)
-
-        # verify multiple invoices in same day
-        cd = {}
-        for invoice in invoice_collection:
-            cd.setdefault((invoice.tax_code, invoice.date), []).append(invoice.doc_filename)
-        for (tax_code, date), doc_filenames in cd.items():
-            if len(doc_filenames) > 1:
-                for doc_filename in doc_filenames:
-                    message = "fattura {f}: sono state emesse {c} fatture nello stesso giorno".format(
-                        f=doc_filename,
-                        c=len(doc_filenames),
-                    )
-                    validation_result.add_warning(invoice, InvoiceMultipleInvoicesPerDayError, message)
-        # verify numbering and dates per year
-        for year in invoice_collection.years():
-            invoices = validation_result.filter_validated_invoices(invoice_collection.filter(lambda invoice: invoice.year == year))
-            numbers = {}
-            expected_number = 1
-            prev_doc, prev_date = None, None
-            for invoice in invoices:
-                failed = False
-                if invoice.number != expected_number:
-                    if invoice.number in numbers:
-                        validation_result.add_error(invoice, InvoiceDuplicatedNumberError,
-                            "fattura {i}: il numero {y}/{n} è duplicato [presente anche in {l}]".format(
-                                i=invoice.doc_filename,
-                                y=year,
-                                n=invoice.number,
-                                l=', '.join("{}:{}".format(invoice.number, invoice.doc_filename) for invoice in numbers[invoice.number])))
-                        failed = True
-                    else:
-                        validation_result.add_error(invoice, InvoiceWrongNumberError,
-                            "fattura {i}: il numero {y}/{n} non è valido (il numero atteso è {e})".format(
-                                i=invoice.doc_filename,
-                                y=year,
-                                n=invoice.number,
-                                e=expected_number))
-                        failed = True
-                if prev_date is not None:
-                    if invoice.date is not None and invoice.date < prev_date:
-                        validation_result.add_error(invoice, InvoiceDateError, "fattura {}: la data {} precede quella della precedente fattura {} ({})".format(invoice.doc_filename, invoice.date, prev_doc, prev_date))
-                        failed = True
-                for validator, compiled_validator in user_validators:
-                    if compiled_validator.filter_function(invoice):
-                        if not compiled_validator.check_function(invoice):
-                            validation_result.add_error(invoice, InvoiceUserValidatorError, "fattura {}: {}".format(invoice.doc_filename, validator.message))
-                            failed = True
-                            
-                      
-                if not failed:
-                    expected_number += 1
-                    numbers.setdefault(invoice.number, []).append(invoice)
-                    prev_doc, prev_date = invoice.doc_filename, invoice.date
-                
-
-        self.logger.debug("validazione di {} fatture completata con {} errori e {} warning".format(
-            len(invoice_collection),
-            validation_result.num_errors(),
-            validation_result.num_warnings()))
-        return validation_result
+    def store_validation_cache(self, validation_cache, prune=False, connection=None):
+        self.logger.debug("cache di validazione: {} hit, {} miss".format(validation_cache.hits, validation_cache.misses))
+        self.db.store_validation_cache(validation_cache, prune=prune, connection=connection)
+
+    def validate_invoice_collection(self, validation_result, invoice_collection, user_validators=()):
+        invoice_collection_validator = self.create_invoice_collection_validator(validation_result, user_validators=user_validators)
+        return invoice_collection_validator.validate(invoice_collection)
 
     def get_doc_file(self, output_filename):
         if output_filename is None:
@@ -1440,21 +1669,119 @@ class InvoiceProgram(object):
         else:
             return output_filename
 
-    def list_invoice_collection(self, invoice_collection, list_field_names=None, header=None, order_field_names=None, table_mode=None, output_filename=None):
-        list_field_names = self.db.get_config_option('list_field_names', list_field_names)
-        header = self.db.get_config_option('header', header)
+    def render_report(self, subcommand, arguments, *, output_filename, table_mode, render):
+        """render_report(subcommand, arguments, *, output_filename, table_mode, render)
+           Renders a report with render(outputs) through the report cache:
+           the rendered outputs are stored by subcommand, arguments, outputs,
+           configuration and invoices generation, and replayed on a hit.
+           The terminal outputs are captured in memory, the files are read
+           back after rendering.
+        """
         table_mode = self.db.get_config_option('table_mode', table_mode)
+        outputs = self.get_doc_outputs(output_filename, table_mode)
+        if self.report_cache_size <= 0:
+            render(outputs)
+            return
+        self.db.check()
+        key_arguments = dict(arguments)
+        key_arguments['outputs'] = tuple((output.file if isinstance(output.file, str) else None, output.mode) for output in outputs)
+        key_arguments['configuration'] = tuple(self.db.load_configuration())
+        generation = self.db.load_invoices_generation()
+        key = make_report_key(subcommand, key_arguments, generation)
+        contents_s = self.db.load_report(key)
+        if contents_s is not None:
+            contents = load_report_contents(contents_s)
+        else:
+            self.logger.debug("cache dei report: {} non trovato [{}]".format(subcommand, key))
+            render_outputs = [output if isinstance(output.file, str) else DocumentOutput(file=io.StringIO(), mode=output.mode) \
+                              for output in outputs]
+            render(render_outputs)
+            contents = []
+            for output in render_outputs:
+                if isinstance(output.file, str):
+                    with open(output.file.format(mode=output.mode), "rb") as f_in:
+                        contents.append(f_in.read())
+                else:
+                    contents.append(output.file.getvalue())
+            # a report rendered during a concurrent change is not cached
+            if self.db.load_invoices_generation() == generation:
+                self.db.store_report(key, generation, dump_report_contents(contents), self.report_cache_size)
+        for output, content in zip(outputs, contents):
+            if isinstance(output.file, str):
+                if contents_s is not None:
+                    with open(output.file.format(mode=output.mode), "wb") as f_out:
+                        f_out.write(content)
+            else:
+                output.file.write(content)
+
+    def get_doc_outputs(self, output_filename, table_mode):
+        """get_doc_outputs(output_filename, table_mode) -> list of DocumentOutput
+           output_filename can be None (the printer stream), a 'FILE[:MODE]'
+           string or a sequence of them (or of DocumentOutput); '-' is the
+           printer stream, and the outputs without a mode use table_mode.
+        """
+        if output_filename is None or isinstance(output_filename, str):
+            output_filename = [output_filename]
+        outputs = []
+        for output in output_filename:
+            if output is None:
+                output = DocumentOutput(file=None, mode=None)
+            elif isinstance(output, str):
+                output = parse_output(output)
+            file, mode = output
+            if file is None or file == '-':
+                file = self.printer.stream
+            if mode is None:
+                mode = table_mode
+            outputs.append(DocumentOutput(file=file, mode=mode))
+        return outputs
+
+    def get_page_slice(self, num_invoices, limit=None, offset=None, last=None):
+        """get_page_slice(num_invoices, limit=None, offset=None, last=None) -> slice
+           The page of the sorted invoices, as selected by the db (see
+           InvoiceDb.iter_invoice_values).
+        """
+        if offset is None:
+            offset = 0
+        if last is not None:
+            stop = max(0, num_invoices - offset)
+            return slice(max(0, stop - last), stop)
+        elif limit is not None:
+            return slice(offset, offset + limit)
+        else:
+            return slice(offset, None)
+
+    def list_invoice_collection(self, invoice_collection, list_field_names=None, header=None, order_field_names=None, table_mode=None, output_filename=None,
+                                text_width=None, limit=None, offset=None, last=None):
         invoice_collection.sort()
         invoices = list(invoice_collection)
+        invoice_count = len(invoices)
         if order_field_names:
             for reverse, field_name in reversed(order_field_names):
                 invoices.sort(key=lambda invoice: getattr(invoice, field_name), reverse=reverse)
+        if limit is not None or offset is not None or last is not None:
+            invoices = invoices[self.get_page_slice(invoice_count, limit=limit, offset=offset, last=last)]
+        self.list_invoices(invoices, list_field_names=list_field_names, header=header, table_mode=table_mode,
+                           output_filename=output_filename, text_width=text_width, invoice_count=invoice_count)
+
+    def list_invoices(self, invoices, list_field_names=None, header=None, table_mode=None, output_filename=None, text_width=None, invoice_count=None):
+        """list_invoices(invoices, list_field_names=None, header=None, table_mode=None, output_filename=None, text_width=None, invoice_count=None)
+           Lists a page of invoices; the width of the numbers depends on
+           invoice_count, the number of invoices of the whole listing, so
+           that all the pages have the same format.
+        """
+        list_field_names = self.db.get_config_option('list_field_names', list_field_names)
+        header = self.db.get_config_option('header', header)
+        table_mode = self.db.get_config_option('table_mode', table_mode)
         if list_field_names is None:
             list_field_names = Invoice._fields
         if header:
             header = [Invoice.get_field_translation(field_name) for field_name in list_field_names]
-        digits = 1 + int(math.log10(max(1, len(invoices))))
-        with document(file=self.get_doc_file(output_filename), mode=table_mode, logger=self.logger) as doc:
+        if invoice_count is None:
+            invoice_count = len(invoices)
+        digits = 1 + int(math.log10(max(1, invoice_count)))
+        with documents(self.get_doc_outputs(output_filename, table_mode), logger=self.logger,
+                       page_options={'width': text_width}) as doc:
             page_template = doc.create_page_template(
                 field_names=list_field_names,
                 header=header,
@@ -1479,6 +1806,22 @@ class InvoiceProgram(object):
             )
             doc.add_page(page_template, invoices)
 
+    def stream_invoice_values(self, list_field_names=None, date_from=None, date_to=None, order_field_names=None, limit=None, offset=None, last=None,
+                              output_filename=None):
+        """stream_invoice_values(list_field_names=None, date_from=None, date_to=None, order_field_names=None, limit=None, offset=None, last=None, output_filename=None)
+           Lists the invoices in ndjson mode straight from the db cursor:
+           only the listed fields are queried, and no Invoice is built.
+        """
+        list_field_names = self.db.get_config_option('list_field_names', list_field_names)
+        if list_field_names is None:
+            list_field_names = Invoice._fields
+        values_type = collections.namedtuple('InvoiceValues', list_field_names)
+        invoice_values = self.db.iter_invoice_values(list_field_names, date_from=date_from, date_to=date_to,
+            order_field_names=order_field_names, limit=limit, offset=offset, last=last)
+        with document(file=self.get_doc_file(output_filename), mode=conf.TABLE_MODE_NDJSON, logger=self.logger) as doc:
+            page_template = doc.create_page_template(field_names=list_field_names)
+            doc.add_page(page_template, map(values_type._make, invoice_values))
+
     def dump_invoice_collection(self, invoice_collection):
         invoice_collection.sort()
         digits = 1 + int(math.log10(max(1, len(invoice_collection))))
@@ -1492,14 +1835,103 @@ fattura:                   {doc_filename!r}
   incasso:                 {income:.2f} [{currency}]""".format(digits=digits, **invoice._asdict()))
 
     def report_invoice_collection(self, invoice_collection):
+        self.print_report(self.report_years(invoice_collection))
+
+    def report_years(self, invoice_collection):
+        """report_years(invoice_collection) -> list of ReportYear
+           The report data of the invoices.
+        """
         invoice_collection.sort()
-        for year in invoice_collection.years():
-            year_invoices = invoice_collection.filter(lambda invoice: invoice.year == year)
+        year_invoices = collections.OrderedDict()
+        for invoice in invoice_collection:
+            year_invoices.setdefault(invoice.year, []).append(invoice)
+        report_years = []
+        for year, invoices in year_invoices.items():
             td = collections.OrderedDict()
             wd = collections.OrderedDict()
-            for invoice in year_invoices:
+            for invoice in invoices:
                 td.setdefault(invoice.tax_code, []).append(invoice)
                 wd.setdefault(self.get_week_number(invoice.date), []).append(invoice)
+            clients = []
+            for tax_code, t_invoices in td.items():
+                clients.append(ReportClient(
+                    tax_code=tax_code,
+                    names=tuple(sorted(set(invoice.name for invoice in t_invoices))),
+                    invoice_count=len(t_invoices),
+                    income=sum(invoice.income for invoice in t_invoices),
+                    weeks=tuple(sorted(set(self.get_week_number(invoice.date) for invoice in t_invoices)))))
+            weeks = []
+            for week in sorted(wd.keys()):
+                w_invoices = wd[week]
+                counter = collections.Counter()
+                for invoice in w_invoices:
+                    counter[invoice.date] += 1
+                weeks.append(ReportWeek(
+                    week=week,
+                    invoice_count=len(w_invoices),
+                    income=sum(invoice.income for invoice in w_invoices),
+                    day_counts=tuple(sorted(counter.items()))))
+            report_years.append(ReportYear(
+                year=year,
+                invoice_count=len(invoices),
+                income=sum(invoice.income for invoice in invoices),
+                clients=tuple(clients),
+                weeks=tuple(weeks)))
+        return report_years
+
+    def sql_report_years(self, sql_conditions=()):
+        """sql_report_years(sql_conditions=()) -> list of ReportYear
+           The report data computed by GROUP BY queries on the stored
+           invoices; the clients are ordered by their first invoice, as in
+           report_years().
+        """
+        def group(*names, hydrate_first=False):
+            return sql_aggregate(self.db, names, filters=sql_conditions, hydrate_first=hydrate_first)
+
+        year_clients = collections.OrderedDict()
+        client_groups = group(conf.STATS_GROUP_YEAR, conf.STATS_GROUP_CLIENT, hydrate_first=True)
+        client_groups.sort(key=lambda item: InvoiceCollection.sort_key(item[1].first))
+        for (year, tax_code), client_aggregate in client_groups:
+            year_clients.setdefault(year, collections.OrderedDict())[tax_code] = client_aggregate
+        client_names = {}
+        for (year, (tax_code, name, service)), task_aggregate in group(conf.STATS_GROUP_YEAR, conf.STATS_GROUP_TASK):
+            client_names.setdefault((year, tax_code), set()).add(name)
+        client_weeks = {}
+        for (year, tax_code, (week_year, week)), week_aggregate in group(conf.STATS_GROUP_YEAR, conf.STATS_GROUP_CLIENT, conf.STATS_GROUP_WEEK):
+            client_weeks.setdefault((year, tax_code), []).append(week)
+        week_days = {}
+        for (year, (week_year, week), day), day_aggregate in group(conf.STATS_GROUP_YEAR, conf.STATS_GROUP_WEEK, conf.STATS_GROUP_DAY):
+            week_days.setdefault((year, week), []).append((day, day_aggregate.count))
+        year_weeks = {}
+        for (year, (week_year, week)), week_aggregate in group(conf.STATS_GROUP_YEAR, conf.STATS_GROUP_WEEK):
+            year_weeks.setdefault(year, []).append(ReportWeek(
+                week=week,
+                invoice_count=week_aggregate.count,
+                income=week_aggregate.income,
+                day_counts=tuple(week_days[(year, week)])))
+        report_years = []
+        for (year, ), year_aggregate in group(conf.STATS_GROUP_YEAR):
+            clients = []
+            for tax_code, client_aggregate in year_clients[year].items():
+                clients.append(ReportClient(
+                    tax_code=tax_code,
+                    names=tuple(sorted(client_names[(year, tax_code)])),
+                    invoice_count=client_aggregate.count,
+                    income=client_aggregate.income,
+                    weeks=tuple(client_weeks[(year, tax_code)])))
+            report_years.append(ReportYear(
+                year=year,
+                invoice_count=year_aggregate.count,
+                income=year_aggregate.income,
+                clients=tuple(clients),
+                weeks=tuple(year_weeks[year])))
+        return report_years
+
+    def print_report(self, report_years):
+        day_names = ['LU', 'MA', 'ME', 'GI', 'VE', 'SA', 'DO']
+        for report_year in report_years:
+            year = report_year.year
+            total_income = report_year.income
             self.printer("""\
 anno                       {year}
   * incasso totale:        {total_income:.2f}
@@ -1507,18 +1939,16 @@ anno                       {year}
   * numero di clienti:     {num_clients}\
 """.format(
                 year=year,
-                total_income=sum(invoice.income for invoice in year_invoices),
-                num_invoices=len(year_invoices),
-                num_clients=len(td),
+                total_income=total_income,
+                num_invoices=report_year.invoice_count,
+                num_clients=len(report_year.clients),
             ))
-            total_income = sum(invoice.income for invoice in year_invoices)
-            for tax_code, invoices in td.items():
-                client_total_income = sum(invoice.income for invoice in invoices)
+            for client in report_year.clients:
+                client_total_income = client.income
                 if total_income != 0.0:
                     client_income_percentage = client_total_income / total_income
                 else:
                     client_income_percentage = 0.0
-                client_weeks = sorted(set(self.get_week_number(invoice.date) for invoice in invoices))
                 self.printer("""\
     + cliente:             {tax_code} ({name}):
       numero di fatture:   {num_invoices}
@@ -1526,32 +1956,26 @@ anno                       {year}
       incasso percentuale: {client_income_percentage:.2%}
       settimane:           {client_weeks}
 """.format(
-                    tax_code=tax_code,
-                    name='|'.join(name for name in set(invoice.name for invoice in invoices)),
-                    num_invoices=len(invoices),
+                    tax_code=client.tax_code,
+                    name='|'.join(client.names),
+                    num_invoices=client.invoice_count,
                     total_income=total_income,
                     client_total_income=client_total_income,
                     client_income_percentage=client_income_percentage,
-                    client_weeks=', '.join(repr(week) for week in client_weeks),
+                    client_weeks=', '.join(repr(week) for week in client.weeks),
                 ))
             self.printer("""\
   * numero di settimane:   {num_weeks}\
 """.format(
-                num_weeks=len(wd),
+                num_weeks=len(report_year.weeks),
             ))
-            for week in sorted(wd.keys()):
-                invoices = wd[week]
-                counter = collections.Counter()
-                for invoice in invoices:
-                    counter[invoice.date] += 1
-                day_names = ['LU', 'MA', 'ME', 'GI', 'VE', 'SA', 'DO']
+            for report_week in report_year.weeks:
+                week = report_week.week
                 days = []
-                dates = sorted(counter.keys())
-                for date in dates:
+                for date, count in report_week.day_counts:
                     day = date.weekday()
-                    count = counter[date]
                     days.append("{} {}[{}]".format(date, day_names[day], count))
-                week_total_income = sum(invoice.income for invoice in invoices)
+                week_total_income = report_week.income
                 if total_income != 0.0:
                     week_income_percentage = week_total_income / total_income
                 else:
@@ -1565,7 +1989,7 @@ anno                       {year}
       incasso percentuale: {week_income_percentage:.2%}
 """.format(
                     week=week,
-                    num_invoices=len(invoices),
+                    num_invoices=report_week.invoice_count,
                     days=', '.join(days),
                     first_date=first_date,
                     last_date=last_date,
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'make_report_key',
+    'dump_report_contents',
+    'load_report_contents',
+]
+
+import base64
+import hashlib
+import json
+
+from .version import VERSION
+
+
+def make_report_key(subcommand, arguments, generation):
+    """make_report_key(subcommand, arguments, generation) -> str
+       The report cache key of a subcommand with the given normalized
+       arguments (a dict of values with a stable repr) on the given
+       invoices generation.
+    """
+    source = (tuple(VERSION), subcommand, tuple(sorted(arguments.items())), generation)
+    return hashlib.sha1(repr(source).encode('utf-8')).hexdigest()
+
+
+def dump_report_contents(contents):
+    """dump_report_contents(contents) -> str
+       The rendered outputs of a report: text (terminal outputs) or bytes
+       (file outputs).
+    """
+    items = []
+    for content in contents:
+        if isinstance(content, bytes):
+            items.append(('b', base64.b64encode(content).decode('ascii')))
+        else:
+            items.append(('t', content))
+    return json.dumps(items, ensure_ascii=False)
+
+
+def load_report_contents(contents_s):
+    """load_report_contents(contents_s) -> list of str or bytes
+       The inverse of dump_report_contents.
+    """
+    contents = []
+    for kind, content in json.loads(contents_s):
+        if kind == 'b':
+            contents.append(base64.b64decode(content.encode('ascii')))
+        else:
+            contents.append(content)
+    return contents
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'SNAPSHOT_SUFFIX',
+    'write_snapshot',
+    'read_snapshot_generation',
+    'read_snapshot',
+]
+
+import array
+import datetime
+import json
+import math
+import mmap
+import os
+import sys
+
+from .columnar import INVOICE_COLUMN_KINDS, KIND_INT, KIND_FLOAT, KIND_DATE
+
+
+SNAPSHOT_SUFFIX = '.snapshot'
+SNAPSHOT_MAGIC = b'INVSNAP\x01'
+SNAPSHOT_ALIGNMENT = 8
+
+_NULL_INT = -2 ** 63
+_NULL_DAYS = -2 ** 31
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def _aligned(size):
+    return size + (-size) % SNAPSHOT_ALIGNMENT
+
+
+def _encode_column(field_name, kind, values):
+    # returns (nulls, sections)
+    if kind == KIND_INT:
+        nulls = None in values
+        if nulls:
+            values = [_NULL_INT if value is None else value for value in values]
+        return nulls, [(field_name, array.array('q', values))]
+    elif kind == KIND_FLOAT:
+        nulls = None in values
+        if nulls:
+            values = [math.nan if value is None else value for value in values]
+        return nulls, [(field_name, array.array('d', values))]
+    elif kind == KIND_DATE:
+        nulls = None in values
+        days = array.array('i', [_NULL_DAYS if value is None else value.toordinal() - _EPOCH_ORDINAL for value in values])
+        return nulls, [(field_name, days)]
+    else:
+        # all the strings are dictionary encoded: -1 is None
+        codes = {None: -1}
+        strings = []
+        for value in values:
+            if value not in codes:
+                codes[value] = len(strings)
+                strings.append(value)
+        nulls = None in values
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = array.array('q', [0])
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        return nulls, [(field_name, array.array('i', [codes[value] for value in values])),
+                       (field_name + '.offsets', offsets),
+                       (field_name + '.strings', b''.join(encoded))]
+
+
+def write_snapshot(filename, generation, field_names, columns, db_id=None):
+    """write_snapshot(filename, generation, field_names, columns, db_id=None)
+       Writes the columns (lists of values, one for each field in
+       field_names) in a snapshot file tagged with the db generation and
+       the db id.
+       The file is a small JSON header followed by 8-byte aligned native
+       arrays: int64 ints, float64 floats (NaN is None), int32 days since
+       1970-01-01 for dates and int32 codes into a UTF-8 string table for
+       strings. It is replaced atomically.
+    """
+    header_columns = {}
+    sections = []
+    num_rows = 0
+    for field_name, values in zip(field_names, columns):
+        num_rows = len(values)
+        kind = INVOICE_COLUMN_KINDS[field_name]
+        nulls, column_sections = _encode_column(field_name, kind, values)
+        header_columns[field_name] = {'kind': kind, 'nulls': nulls}
+        sections.extend(column_sections)
+    section_offsets = {}
+    offset = 0
+    for section_name, data in sections:
+        data = memoryview(data).cast('B')
+        section_offsets[section_name] = (offset, len(data))
+        offset = _aligned(offset + len(data))
+    header = json.dumps({
+        'generation': generation,
+        'db_id': db_id,
+        'byteorder': sys.byteorder,
+        'num_rows': num_rows,
+        'field_names': list(field_names),
+        'columns': header_columns,
+        'sections': section_offsets,
+    }).encode('utf-8')
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f_out:
+        prefix = SNAPSHOT_MAGIC + len(header).to_bytes(4, 'little') + header
+        f_out.write(prefix.ljust(_aligned(len(prefix)), b'\0'))
+        for section_name, data in sections:
+            data = memoryview(data).cast('B')
+            f_out.write(data)
+            f_out.write(b'\0' * ((-len(data)) % SNAPSHOT_ALIGNMENT))
+    os.replace(tmp_filename, filename)
+
+
+def _read_header(f_in):
+    prefix = f_in.read(len(SNAPSHOT_MAGIC) + 4)
+    if len(prefix) < len(SNAPSHOT_MAGIC) + 4 or not prefix.startswith(SNAPSHOT_MAGIC):
+        return None, 0
+    header_len = int.from_bytes(prefix[len(SNAPSHOT_MAGIC):], 'little')
+    header = json.loads(f_in.read(header_len).decode('utf-8'))
+    if header['byteorder'] != sys.byteorder:
+        return None, 0
+    return header, _aligned(len(prefix) + header_len)
+
+
+def read_snapshot_generation(filename):
+    """read_snapshot_generation(filename) -> generation
+       The generation of the snapshot, None if missing or unreadable.
+    """
+    try:
+        with open(filename, 'rb') as f_in:
+            header, data_start = _read_header(f_in)
+    except (OSError, ValueError):
+        return None
+    if header is None:
+        return None
+    return header['generation']
+
+
+def read_snapshot(filename, generation=None, db_id=None):
+    """read_snapshot(filename, generation=None, db_id=None) -> (field_names, columns) or None
+       Maps the snapshot in memory and decodes its columns to lists of
+       python values. The numeric columns are read straight from the
+       mapped arrays; each distinct string and date is decoded once.
+       Returns None if the snapshot is missing or its generation or db id
+       is not the given one.
+    """
+    try:
+        f_in = open(filename, 'rb')
+    except OSError:
+        return None
+    with f_in:
+        header, data_start = _read_header(f_in)
+        if header is None or (generation is not None and header['generation'] != generation):
+            return None
+        if db_id is not None and header.get('db_id', None) != db_id:
+            return None
+        with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as data:
+                def section(section_name, typecode):
+                    offset, length = header['sections'][section_name]
+                    offset += data_start
+                    return data[offset:offset + length].cast(typecode)
+                columns = []
+                for field_name in header['field_names']:
+                    kind = header['columns'][field_name]['kind']
+                    nulls = header['columns'][field_name]['nulls']
+                    if kind == KIND_INT:
+                        with section(field_name, 'q') as values:
+                            values = values.tolist()
+                        if nulls:
+                            values = [None if value == _NULL_INT else value for value in values]
+                    elif kind == KIND_FLOAT:
+                        with section(field_name, 'd') as values:
+                            values = values.tolist()
+                        if nulls:
+                            values = [None if math.isnan(value) else value for value in values]
+                    elif kind == KIND_DATE:
+                        with section(field_name, 'i') as days:
+                            days = days.tolist()
+                        dates = {day: datetime.date.fromordinal(day + _EPOCH_ORDINAL) for day in set(days) if day != _NULL_DAYS}
+                        dates[_NULL_DAYS] = None
+                        values = list(map(dates.__getitem__, days))
+                    else:
+                        with section(field_name + '.offsets', 'q') as offsets:
+                            offsets = offsets.tolist()
+                        with section(field_name + '.strings', 'B') as strings:
+                            strings = strings.tobytes()
+                        strings = [strings[begin:end].decode('utf-8') for begin, end in zip(offsets, offsets[1:])]
+                        # the code -1 (None) picks the last item
+                        strings.append(None)
+                        with section(field_name, 'i') as codes:
+                            values = list(map(strings.__getitem__, codes.tolist()))
+                    columns.append(values)
+    return header['field_names'], columns
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'SqlGroupKind',
+    'register_sql_group_kind',
+    'sql_group_supported',
+    'sql_filter',
+    'sql_filters',
+    'sql_aggregate',
+    'sql_totals',
+]
+
+import ast
+import collections
+import datetime
+
+from . import conf
+from .aggregation import Aggregate, get_group_kind
+from .database.db_types import Date, Float, Int, Str
+from .invoice import Invoice
+
+
+SqlGroupKind = collections.namedtuple('SqlGroupKind', ('name', 'columns', 'make_key', 'prepare'))
+SqlGroupKind.__doc__ = """SqlGroupKind(name, columns, make_key, prepare)
+   SQL version of a stats group kind: columns are the SQL expressions the
+   invoices are grouped by, make_key(values) returns the group key (the
+   same returned by the GroupKind.key_function) from the column values;
+   prepare(db, connection), if not None, is called before the query."""
+
+_SQL_GROUP_KINDS = collections.OrderedDict()
+
+# SQL expressions reproducing the python group keys: %w is 0 on Sunday
+# while datetime.date.weekday() is 0 on Monday; the week number is read
+# from the calendar table.
+_SQL_MONTH = "CAST(strftime('%m', date) AS INTEGER)"
+_SQL_WEEKDAY = "((CAST(strftime('%w', date) AS INTEGER) + 6) % 7)"
+_SQL_WEEK = "(SELECT week_number FROM calendar WHERE calendar.date = invoices.date)"
+
+_CHUNK_SIZE = 500
+
+# filter comparisons translated to SQL: IS and IS NOT compare NULL values
+# as python compares None
+_SQL_COMPARE_OPERATORS = {
+    ast.Eq: 'IS',
+    ast.NotEq: 'IS NOT',
+    ast.Lt: '<',
+    ast.LtE: '<=',
+    ast.Gt: '>',
+    ast.GtE: '>=',
+}
+_SQL_REVERSED_OPERATORS = {
+    ast.Eq: ast.Eq,
+    ast.NotEq: ast.NotEq,
+    ast.Lt: ast.Gt,
+    ast.LtE: ast.GtE,
+    ast.Gt: ast.Lt,
+    ast.GtE: ast.LtE,
+}
+# python types of the filter constants accepted for each field type; Path
+# fields are not translated, since their values are normalized by the db
+_SQL_FILTER_TYPES = {
+    Int: (int, ),
+    Float: (int, float),
+    Str: (str, ),
+    Date: (datetime.date, ),
+}
+
+
+def register_sql_group_kind(name, columns, make_key=None, prepare=None):
+    """register_sql_group_kind(name, columns, make_key=None, prepare=None) -> SqlGroupKind
+       Registers the SQL version of the group kind 'name'; by default the
+       key is the value of the single column.
+    """
+    get_group_kind(name)
+    if make_key is None:
+        make_key = _single_key
+    sql_group_kind = SqlGroupKind(name=name, columns=tuple(columns), make_key=make_key, prepare=prepare)
+    _SQL_GROUP_KINDS[name] = sql_group_kind
+    return sql_group_kind
+
+
+def sql_group_supported(group):
+    return all(name in _SQL_GROUP_KINDS for name in group)
+
+
+class _SqlFilterError(Exception):
+    pass
+
+
+def _sql_field(db, node):
+    if not isinstance(node, ast.Name):
+        raise _SqlFilterError()
+    field_name = Invoice.get_field_name_from_translation(node.id)
+    if field_name not in Invoice._fields:
+        raise _SqlFilterError()
+    field = db.TABLES['invoices'].fields[field_name]
+    if type(field) not in _SQL_FILTER_TYPES:
+        raise _SqlFilterError()
+    return field_name, field
+
+
+def _sql_constant(field, node):
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'Date' and \
+       len(node.args) == 1 and not node.keywords and isinstance(node.args[0], ast.Constant):
+        try:
+            value = datetime.datetime.strptime(node.args[0].value, Date.DATE_FORMAT).date()
+        except (TypeError, ValueError):
+            raise _SqlFilterError()
+    elif isinstance(node, ast.Constant):
+        value = node.value
+    else:
+        raise _SqlFilterError()
+    if isinstance(value, bool) or not isinstance(value, _SQL_FILTER_TYPES[type(field)]):
+        raise _SqlFilterError()
+    return field.db_to(value)
+
+
+def _sql_expression(db, node):
+    if isinstance(node, ast.BoolOp):
+        operator = ' AND ' if isinstance(node.op, ast.And) else ' OR '
+        where = []
+        values = []
+        for value_node in node.values:
+            value_where, value_values = _sql_expression(db, value_node)
+            where.append("({})".format(value_where))
+            values.extend(value_values)
+        return operator.join(where), values
+    if not isinstance(node, ast.Compare) or len(node.ops) != 1:
+        raise _SqlFilterError()
+    op, left, right = type(node.ops[0]), node.left, node.comparators[0]
+    if op in (ast.In, ast.NotIn):
+        field_name, field = _sql_field(db, left)
+        if not isinstance(right, (ast.Set, ast.Tuple, ast.List)) or not right.elts:
+            raise _SqlFilterError()
+        values = [_sql_constant(field, element) for element in right.elts]
+        placeholders = ', '.join('?' for value in values)
+        if op is ast.In:
+            return "{} IN ({})".format(field_name, placeholders), values
+        else:
+            return "{f} IS NULL OR {f} NOT IN ({p})".format(f=field_name, p=placeholders), values
+    if op not in _SQL_COMPARE_OPERATORS:
+        raise _SqlFilterError()
+    if not isinstance(left, ast.Name):
+        left, right, op = right, left, _SQL_REVERSED_OPERATORS[op]
+    field_name, field = _sql_field(db, left)
+    value = _sql_constant(field, right)
+    return "{} {} ?".format(field_name, _SQL_COMPARE_OPERATORS[op]), [value]
+
+
+def sql_filter(db, filter_source):
+    """sql_filter(db, filter_source) -> (where, values) or None
+       Translates a filter expression into a SQL condition on the invoices
+       table; the comparisons of a field with constants (Date('...') for
+       dates), and their and/or combinations, are translated. Returns None
+       for the filters that cannot be expressed in SQL.
+    """
+    if not isinstance(filter_source, str):
+        return None
+    try:
+        tree = ast.parse(filter_source.strip(), mode='eval')
+        return _sql_expression(db, tree.body)
+    except (SyntaxError, _SqlFilterError):
+        return None
+
+
+def sql_filters(db, filters):
+    """sql_filters(db, filters) -> (sql_filters, python_filters)
+       Splits the filters into the translated (where, values) conditions
+       and the filters that have to be applied in python.
+    """
+    translated = []
+    python_filters = []
+    for filter_source in filters:
+        sql_condition = sql_filter(db, filter_source)
+        if sql_condition is None:
+            python_filters.append(filter_source)
+        else:
+            translated.append(sql_condition)
+    return translated, python_filters
+
+
+def _where(date_from, date_to, filters=()):
+    where = []
+    values = []
+    for filter_where, filter_values in filters:
+        where.append("({})".format(filter_where))
+        values.extend(filter_values)
+    if date_from is not None:
+        where.append("date >= ?")
+        values.append(Date.db_to(date_from))
+    if date_to is not None:
+        where.append("date <= ?")
+        values.append(Date.db_to(date_to))
+    if where:
+        return " WHERE " + " AND ".join(where), values
+    else:
+        return "", values
+
+
+def sql_aggregate(db, group, date_from=None, date_to=None, filters=(), hydrate_first=False, connection=None):
+    """sql_aggregate(db, group, date_from=None, date_to=None, filters=(), hydrate_first=False, connection=None) -> list of (key, Aggregate)
+       Same result of aggregation.aggregate() on the stored invoices in the
+       date range, computed by a GROUP BY query; only the result rows are
+       hydrated. The filters are the (where, values) conditions returned
+       by sql_filter(). The first invoice of each group is loaded only if
+       hydrate_first is True.
+    """
+    sql_group_kinds = [_SQL_GROUP_KINDS[name] for name in group]
+    columns = []
+    for sql_group_kind in sql_group_kinds:
+        columns.extend(sql_group_kind.columns)
+    num_columns = len(columns)
+    where, values = _where(date_from, date_to, filters)
+    group_by = ', '.join(columns)
+    sql = """SELECT {columns}, COUNT(*), TOTAL(income), MIN(date), MAX(date), GROUP_CONCAT(DISTINCT tax_code) FROM invoices{where} GROUP BY {group_by};""".format(
+        columns=group_by,
+        where=where,
+        group_by=group_by,
+    )
+    with db.connect(connection) as connection:
+        for prepare in set(sql_group_kind.prepare for sql_group_kind in sql_group_kinds):
+            if prepare is not None:
+                prepare(db, connection)
+        cursor = connection.cursor()
+        rows = {}
+        for row in db.execute(cursor, sql, values):
+            key = _make_key(sql_group_kinds, row[:num_columns])
+            count, income, min_date, max_date, tax_codes = row[num_columns:]
+            group_aggregate = Aggregate()
+            group_aggregate.count = count
+            group_aggregate.income = income
+            if tax_codes is not None:
+                group_aggregate.clients = set(tax_codes.split(','))
+            if min_date is not None:
+                group_aggregate.date_from = Date.db_from(min_date)
+                group_aggregate.date_to = Date.db_from(max_date)
+            rows[key] = group_aggregate
+        if hydrate_first:
+            # with a single MIN() aggregate, sqlite takes the bare ID
+            # column from the row holding the minimum
+            sql = """SELECT {columns}, ID, MIN(year * 1000000 + number) FROM invoices{where} GROUP BY {group_by};""".format(
+                columns=group_by,
+                where=where,
+                group_by=group_by,
+            )
+            first_ids = {}
+            for row in db.execute(cursor, sql, values):
+                first_ids[row[num_columns]] = _make_key(sql_group_kinds, row[:num_columns])
+            id_list = list(first_ids)
+            for index in range(0, len(id_list), _CHUNK_SIZE):
+                chunk = id_list[index:index + _CHUNK_SIZE]
+                sql = """SELECT ID, {field_names} FROM invoices WHERE ID IN ({ids});""".format(
+                    field_names=', '.join(db.TABLES['invoices'].field_names),
+                    ids=', '.join('?' for i in chunk),
+                )
+                for row in db.execute(cursor, sql, chunk):
+                    rows[first_ids[row[0]]].first = db.make_record('invoices', row[1:])
+    return sorted(rows.items(), key=lambda item: item[0])
+
+
+def sql_totals(db, date_from=None, date_to=None, filters=(), connection=None):
+    """sql_totals(db, date_from=None, date_to=None, filters=(), connection=None) -> (invoice_count, income, client_count)
+    """
+    where, values = _where(date_from, date_to, filters)
+    sql = """SELECT COUNT(*), TOTAL(income), COUNT(DISTINCT tax_code) FROM invoices{where};""".format(where=where)
+    with db.connect(connection) as connection:
+        cursor = connection.cursor()
+        return tuple(db.execute(cursor, sql, values).fetchone())
+
+
+def _make_key(sql_group_kinds, values):
+    key = []
+    offset = 0
+    for sql_group_kind in sql_group_kinds:
+        num_columns = len(sql_group_kind.columns)
+        key.append(sql_group_kind.make_key(values[offset:offset + num_columns]))
+        offset += num_columns
+    return tuple(key)
+
+
+def _single_key(values):
+    return values[0]
+
+
+def _date_key(values):
+    return Date.db_from(values[0])
+
+
+def _week_key(values):
+    year, week_number = values
+    if week_number is None:
+        # as the python key function
+        raise IndexError("settimana non disponibile")
+    return year, week_number
+
+
+def _prepare_calendar(db, connection):
+    db.ensure_calendar(connection=connection)
+
+
+register_sql_group_kind(conf.STATS_GROUP_YEAR, ('year', ))
+register_sql_group_kind(conf.STATS_GROUP_MONTH, ('year', _SQL_MONTH), tuple)
+register_sql_group_kind(conf.STATS_GROUP_WEEK, ('year', _SQL_WEEK), _week_key, _prepare_calendar)
+register_sql_group_kind(conf.STATS_GROUP_DAY, ('date', ), _date_key)
+register_sql_group_kind(conf.STATS_GROUP_WEEKDAY, (_SQL_WEEKDAY, ))
+register_sql_group_kind(conf.STATS_GROUP_SERVICE, ('service', ))
+register_sql_group_kind(conf.STATS_GROUP_TASK, ('tax_code', 'name', 'service'), tuple)
+register_sql_group_kind(conf.STATS_GROUP_CLIENT, ('tax_code', ))
+register_sql_group_kind(conf.STATS_GROUP_CITY, ('city', ))
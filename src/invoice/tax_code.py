@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TaxCodeCheck',
+    'KIND_PERSONAL',
+    'KIND_VAT_NUMBER',
+    'ERROR_LENGTH',
+    'ERROR_SYMBOLS',
+    'ERROR_CONTROL',
+    'check_tax_code',
+    'check_tax_codes',
+    'cin_personal',
+    'cin_luhn',
+]
+
+import collections
+import functools
+
+
+TaxCodeCheck = collections.namedtuple('TaxCodeCheck', ('tax_code', 'valid', 'kind', 'error', 'positions', 'expected'))
+TaxCodeCheck.__doc__ = """TaxCodeCheck(tax_code, valid, kind, error, positions, expected)
+   Result of a tax code check: kind is KIND_PERSONAL or KIND_VAT_NUMBER;
+   error is None, ERROR_LENGTH, ERROR_SYMBOLS or ERROR_CONTROL; positions
+   are the offending positions; expected is the expected length or control
+   character."""
+
+KIND_PERSONAL = 'personal'
+KIND_VAT_NUMBER = 'vat_number'
+
+ERROR_LENGTH = 'length'
+ERROR_SYMBOLS = 'symbols'
+ERROR_CONTROL = 'control'
+
+TAX_CODE_CACHE_SIZE = 4096
+
+PERSONAL_LENGTH = 16
+VAT_NUMBER_LENGTH = 11
+
+_DIGITS = frozenset('0123456789')
+_LETTERS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_PERSONAL_SYMBOLS = tuple({'L': _LETTERS, 'N': _DIGITS}[symbol_type] for symbol_type in 'LLLLLLNNLNNLNNNL')
+
+_TAX_CODE_EVEN_ODD = {
+    'A':	(0,	1),
+    'B':	(1,	0),
+    'C':	(2,	5),
+    'D':	(3,	7),
+    'E':	(4,	9),
+    'F':	(5,	13),
+    'G':	(6,	15),
+    'H':	(7,	17),
+    'I':	(8,	19),
+    'J':	(9,	21),
+    'K':	(10,	2),
+    'L':	(11,	4),
+    'M':	(12,	18),
+    'N':	(13,	20),
+    'O':	(14,	11),
+    'P':	(15,	3),
+    'Q':	(16,	6),
+    'R':	(17,	8),
+    'S':	(18,	12),
+    'T':	(19,	14),
+    'U':	(20,	16),
+    'V':	(21,	10),
+    'W':	(22,	22),
+    'X':	(23,	25),
+    'Y':	(24,	24),
+    'Z':	(25,	23),
+}
+
+for digit in range(10):
+    letter = chr(ord('A') + digit)
+    _TAX_CODE_EVEN_ODD[str(digit)] = _TAX_CODE_EVEN_ODD[letter]
+
+# value of each symbol for odd (1-based) and even positions
+_ODD_VALUES = {symbol: even_odd[1] for symbol, even_odd in _TAX_CODE_EVEN_ODD.items()}
+_EVEN_VALUES = {symbol: even_odd[0] for symbol, even_odd in _TAX_CODE_EVEN_ODD.items()}
+
+_TAX_CODE_CONTROL_LETTER = {i: chr(i + ord('A')) for i in range(26)}
+
+# doubled digit values for the luhn algorithm
+_LUHN_DOUBLE = tuple((2 * i) % 9 for i in range(10))
+
+
+def cin_personal(tax_code):
+    # control internal number for personal tax_code
+    odd_values = _ODD_VALUES
+    even_values = _EVEN_VALUES
+    s = sum(odd_values[symbol] for symbol in tax_code[0:-1:2]) + \
+        sum(even_values[symbol] for symbol in tax_code[1:-1:2])
+    return _TAX_CODE_CONTROL_LETTER[s % 26]
+
+
+def cin_luhn(tax_code):
+    # control internal number for vat number
+    digits = [int(i) for i in tax_code[:-1]]
+    value_x = sum(digits[0::2])
+    value_y = sum(_LUHN_DOUBLE[i] for i in digits[1::2])
+    value_t = (value_x + value_y) % 10
+    value_c = (10 - value_t) % 10
+    return str(value_c)
+
+
+@functools.lru_cache(maxsize=TAX_CODE_CACHE_SIZE)
+def check_tax_code(tax_code):
+    """check_tax_code(tax_code) -> TaxCodeCheck
+       Checks a personal tax code or a vat number (only digits); results
+       are memoized.
+    """
+    if _DIGITS.issuperset(tax_code):
+        kind = KIND_VAT_NUMBER
+        if len(tax_code) != VAT_NUMBER_LENGTH:
+            return TaxCodeCheck(tax_code, False, kind, ERROR_LENGTH, (), VAT_NUMBER_LENGTH)
+        cin = cin_luhn(tax_code)
+    else:
+        kind = KIND_PERSONAL
+        if len(tax_code) != PERSONAL_LENGTH:
+            return TaxCodeCheck(tax_code, False, kind, ERROR_LENGTH, (), PERSONAL_LENGTH)
+        positions = tuple(position for position, (symbol, symbols) in enumerate(zip(tax_code, _PERSONAL_SYMBOLS)) if symbol not in symbols)
+        if positions:
+            return TaxCodeCheck(tax_code, False, kind, ERROR_SYMBOLS, positions, None)
+        cin = cin_personal(tax_code)
+    if cin != tax_code[-1]:
+        return TaxCodeCheck(tax_code, False, kind, ERROR_CONTROL, (len(tax_code) - 1, ), cin)
+    return TaxCodeCheck(tax_code, True, kind, None, (), None)
+
+
+def check_tax_codes(tax_codes):
+    """check_tax_codes(tax_codes) -> list of TaxCodeCheck
+       Checks a column of tax codes; each distinct tax code is checked once.
+    """
+    results = {}
+    for tax_code in tax_codes:
+        if tax_code not in results:
+            results[tax_code] = check_tax_code(tax_code)
+    return [results[tax_code] for tax_code in tax_codes]
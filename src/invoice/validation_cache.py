@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'ValidationCache',
+]
+
+import hashlib
+import json
+
+from .invoice import Invoice
+from .validation_result import ValidationResult, ValidationRecorder
+
+
+class ValidationCache(object):
+    """ValidationCache(fingerprint)
+       Per-invoice validation cache: the entries added by Invoice.validate
+       are stored by invoice content hash, and replayed on the validation
+       result when an identical invoice is validated again.
+       The fingerprint identifies the validation rules and modes; a cache
+       with a different fingerprint must be discarded.
+    """
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.new_entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def make_fingerprint(cls, validation_result):
+        rules = (
+            Invoice.VALIDATION_RULES_VERSION,
+            tuple(validation_result.warning_mode),
+            tuple(validation_result.error_mode),
+            tuple(sorted(validation_result.changed_tax_codes)),
+        )
+        return hashlib.sha1(repr(rules).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def content_hash(cls, invoice):
+        return hashlib.sha1(repr(tuple(invoice)).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def dump_entries(cls, entries):
+        return json.dumps([(kind, exc_type.exc_code(), str(message)) for kind, exc_type, message in entries])
+
+    @classmethod
+    def load_entries(cls, entries_s):
+        exc_types = ValidationResult.exc_types()
+        return tuple((kind, exc_types[exc_code], message) for kind, exc_code, message in json.loads(entries_s))
+
+    def lookup(self, invoice):
+        key = self.content_hash(invoice)
+        self.used.add(key)
+        entries = self.entries.get(key, None)
+        if entries is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entries
+
+    def record(self, invoice, entries):
+        key = self.content_hash(invoice)
+        entries = tuple(entries)
+        self.entries[key] = entries
+        self.new_entries[key] = entries
+
+    def validate(self, invoice, validation_result, tax_code_check=None):
+        entries = self.lookup(invoice)
+        if entries is None:
+            recorder = ValidationRecorder(validation_result)
+            invoice.validate(validation_result=recorder, tax_code_check=tax_code_check)
+            self.record(invoice, recorder.entries)
+        else:
+            validation_result.replay(invoice, entries)
+        return validation_result
+
+    def unused_keys(self):
+        return set(self.entries).difference(self.used)
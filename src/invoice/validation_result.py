@@ -17,7 +17,9 @@
 
 __author__ = "Simone Campagna"
 __all__ = [
+    'ValidationMessage',
     'ValidationResult',
+    'ValidationRecorder',
 ]
 
 import collections
@@ -25,6 +27,52 @@ import fnmatch
 
 from .error import InvoiceValidationError
 
+
+class ValidationMessage(object):
+    """ValidationMessage(fmt, *args, **kwargs)
+       A validation message formatted only when it is rendered (logged,
+       printed or queried); it compares equal to the rendered string.
+    """
+    __slots__ = ('fmt', 'args', 'kwargs', '_text')
+
+    def __init__(self, fmt, *args, **kwargs):
+        self.fmt = fmt
+        self.args = args
+        self.kwargs = kwargs
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = self.fmt.format(*self.args, **self.kwargs)
+        return self._text
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __format__(self, format_spec):
+        return format(str(self), format_spec)
+
+    def __eq__(self, other):
+        if isinstance(other, (str, ValidationMessage)):
+            return str(self) == str(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __getstate__(self):
+        return (self.fmt, self.args, self.kwargs, self._text)
+
+    def __setstate__(self, state):
+        self.fmt, self.args, self.kwargs, self._text = state
+
+
 class ValidationResult(object):
     WARNING_ACTION_LOG = 'log'
     WARNING_ACTION_ERROR = 'error'
@@ -42,12 +90,17 @@ class ValidationResult(object):
     DEFAULT_ERROR_MODE = ("{}:*".format(DEFAULT_ERROR_ACTION), )
 
     Entry = collections.namedtuple('Entry', ('exc_type', 'message'))
+    ENTRY_ERROR = 'error'
+    ENTRY_WARNING = 'warning'
+    _EXC_TYPES = None
 
     def __init__(self, logger, warning_mode=DEFAULT_WARNING_MODE, error_mode=DEFAULT_ERROR_MODE, changed_tax_codes=None):
         self._failing_invoices = dict()
         self.logger = logger
         self._errors = collections.OrderedDict()
         self._warnings = collections.OrderedDict()
+        self._error_counts = collections.Counter()
+        self._warning_counts = collections.Counter()
 
         if error_mode is None:
             error_mode = self.DEFAULT_ERROR_MODE
@@ -125,6 +178,12 @@ class ValidationResult(object):
     def _make_error_action(cls, mode):
         return cls._make_action(default_action=cls.DEFAULT_ERROR_ACTION, type_function=cls.type_error_mode, mode=mode)
 
+    @classmethod
+    def exc_types(cls):
+        if cls._EXC_TYPES is None:
+            cls._EXC_TYPES = {exc_type.exc_code(): exc_type for exc_type in InvoiceValidationError.subclasses()}
+        return cls._EXC_TYPES
+
     def filter_invoices(self, invoices):
         validated_invoices = []
         failing_invoices = []
@@ -147,20 +206,28 @@ class ValidationResult(object):
     def format_message(self, exc_type, message):
         return "[{}] {}".format(exc_type.exc_code(), message)
 
+    # messages are passed to the logger as arguments, so they are
+    # rendered only if the record is actually emitted
     def impl_add_critical(self, invoice, exc_type, message):
+        exc_code = exc_type.exc_code()
         self._errors.setdefault(invoice.doc_filename, []).append(self.Entry(exc_type, message))
+        self._error_counts[exc_code] += 1
         self._failing_invoices[invoice.doc_filename] = invoice
-        self.logger.critical(self.format_message(exc_type, message))
-        raise exc_type(message)
+        self.logger.critical("[%s] %s", exc_code, message)
+        raise exc_type(str(message))
 
     def impl_add_error(self, invoice, exc_type, message):
+        exc_code = exc_type.exc_code()
         self._errors.setdefault(invoice.doc_filename, []).append(self.Entry(exc_type, message))
+        self._error_counts[exc_code] += 1
         self._failing_invoices[invoice.doc_filename] = invoice
-        self.logger.error(self.format_message(exc_type, message))
+        self.logger.error("[%s] %s", exc_code, message)
 
     def impl_add_warning(self, invoice, exc_type, message):
+        exc_code = exc_type.exc_code()
         self._warnings.setdefault(invoice.doc_filename, []).append(self.Entry(exc_type, message))
-        self.logger.warning(self.format_message(exc_type, message))
+        self._warning_counts[exc_code] += 1
+        self.logger.warning("[%s] %s", exc_code, message)
 
     def impl_ignore(self, invoice, exc_type, message):
         pass
@@ -177,17 +244,55 @@ class ValidationResult(object):
         function = self.warning_function[action]
         function(invoice, exc_type, message)
 
+    def replay(self, invoice, entries):
+        for kind, exc_type, message in entries:
+            if kind == self.ENTRY_ERROR:
+                self.add_error(invoice, exc_type, message)
+            else:
+                self.add_warning(invoice, exc_type, message)
+
     def __bool__(self):
         return len(self._errors) == 0
 
     def num_errors(self):
-        return sum(len(l) for l in self._errors.values())
+        return sum(self._error_counts.values())
 
     def num_warnings(self):
-        return sum(len(l) for l in self._warnings.values())
+        return sum(self._warning_counts.values())
+
+    def error_counts(self):
+        return self._error_counts
+
+    def warning_counts(self):
+        return self._warning_counts
 
     def errors(self):
         return self._errors
 
     def warnings(self):
         return self._warnings
+
+
+class ValidationRecorder(object):
+    """ValidationRecorder(validation_result=None)
+       Records the (kind, exc_type, message) entries added by a validation
+       function; entries are forwarded to validation_result, if given.
+       The recorded entries can be replayed with ValidationResult.replay().
+    """
+    def __init__(self, validation_result=None):
+        self.validation_result = validation_result
+        if validation_result is None:
+            self.changed_tax_codes = ()
+        else:
+            self.changed_tax_codes = validation_result.changed_tax_codes
+        self.entries = []
+
+    def add_error(self, invoice, exc_type, message):
+        self.entries.append((ValidationResult.ENTRY_ERROR, exc_type, message))
+        if self.validation_result is not None:
+            self.validation_result.add_error(invoice, exc_type, message)
+
+    def add_warning(self, invoice, exc_type, message):
+        self.entries.append((ValidationResult.ENTRY_WARNING, exc_type, message))
+        if self.validation_result is not None:
+            self.validation_result.add_warning(invoice, exc_type, message)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'ValidatorCache',
+]
+
+import collections
+import hashlib
+import importlib.util
+import marshal
+import os
+
+from .invoice import Invoice
+from .invoice_db import InvoiceDb
+from .log import get_default_logger
+
+
+class ValidatorCache(object):
+    """ValidatorCache(cache_filename=None, logger=None)
+       Cache of the compiled user validators, keyed by the contents of the
+       validators table. The compiled code is kept in memory, so that the
+       scans repeated by the spy daemon do not compile it again, and, if
+       cache_filename is given, marshalled on disk for the next command.
+    """
+    MEMORY_SIZE = 8
+    _memory = collections.OrderedDict()
+
+    SOURCE_MEMORY = 'memory'
+    SOURCE_DISK = 'disk'
+    SOURCE_COMPILE = 'compile'
+
+    def __init__(self, cache_filename=None, logger=None):
+        if logger is None:
+            logger = get_default_logger()
+        self.logger = logger
+        self.cache_filename = cache_filename
+        self.source = None
+
+    @classmethod
+    def make_key(cls, validators):
+        rules = (
+            importlib.util.MAGIC_NUMBER,
+            tuple(tuple(validator) for validator in validators),
+        )
+        return hashlib.sha1(repr(rules).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def clear_memory(cls):
+        cls._memory.clear()
+
+    def load(self, key):
+        if self.cache_filename is None or not os.path.exists(self.cache_filename):
+            return None
+        try:
+            with open(self.cache_filename, 'rb') as f_in:
+                magic_number, cache_key, codes = marshal.load(f_in)
+        except (OSError, EOFError, ValueError, TypeError) as err:
+            self.logger.debug("cache dei validatori {!r} non leggibile: {}".format(self.cache_filename, err))
+            return None
+        if magic_number != importlib.util.MAGIC_NUMBER or cache_key != key:
+            return None
+        return codes
+
+    def store(self, key, codes):
+        if self.cache_filename is None:
+            return
+        tmp_filename = self.cache_filename + '.tmp'
+        try:
+            with open(tmp_filename, 'wb') as f_out:
+                marshal.dump((importlib.util.MAGIC_NUMBER, key, codes), f_out)
+            os.replace(tmp_filename, self.cache_filename)
+        except OSError as err:
+            self.logger.debug("cache dei validatori {!r} non scrivibile: {}".format(self.cache_filename, err))
+
+    def compile(self, validators):
+        """compile(validators) -> list of (validator, compiled_validator)
+           Returns the compiled validators, as expected by the
+           InvoiceCollectionValidator.
+        """
+        validators = list(validators)
+        key = self.make_key(validators)
+        memory = self._memory
+        codes = memory.get(key, None)
+        if codes is not None:
+            self.source = self.SOURCE_MEMORY
+            memory.move_to_end(key)
+        else:
+            codes = self.load(key)
+            if codes is not None:
+                self.source = self.SOURCE_DISK
+            else:
+                self.source = self.SOURCE_COMPILE
+                codes = tuple((Invoice.compile_filter_code(validator.filter_function),
+                               Invoice.compile_filter_code(validator.check_function)) for validator in validators)
+                self.store(key, codes)
+            memory[key] = codes
+            while len(memory) > self.MEMORY_SIZE:
+                memory.popitem(last=False)
+        self.logger.debug("validatori: {} ({})".format(len(validators), self.source))
+        user_validators = []
+        for validator, (filter_code, check_code) in zip(validators, codes):
+            user_validators.append((validator, InvoiceDb.Validator(
+                Invoice.make_filter_function(filter_code),
+                Invoice.make_filter_function(check_code),
+                validator.message)))
+        return user_validators
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'CLIENTS',
+    'make_invoice',
+    'make_year_invoices',
+    'InvoiceDbTestCase',
+]
+
+import datetime
+import os
+import tempfile
+import unittest
+
+from invoice import conf
+from invoice.invoice import Invoice
+from invoice.invoice_db import InvoiceDb
+from invoice.invoice_program import InvoiceProgram
+from invoice.log import get_null_logger
+from invoice.string_printer import StringPrinter
+
+
+def make_invoice(year, number, date, name='Bruce Wayne', tax_code='WNYBRC01G01H663S', doc_filename=None):
+    if doc_filename is None:
+        doc_filename = '{}_{:03d}.doc'.format(year, number)
+    return Invoice(
+        doc_filename=doc_filename,
+        year=year, number=number,
+        name=name, tax_code=tax_code,
+        city='Gotham City', date=date,
+        service='therapy',
+        fee=50.0, vat=0.0, cpa=0.0, deduction=0.0,
+        p_vat=0.0, p_deduction=0.0, p_cpa=0.0, refunds=0.0, taxes=0.0,
+        income=50.0, currency='euro', exceptions='')
+
+
+CLIENTS = (
+    ('Bruce Wayne', 'WNYBRC01G01H663S'),
+    ('Peter Parker', 'PRKPRT01G01H663M'),
+    ('Bruce Banner', 'BNNBRC01G01H663S'),
+    ('Clark Kent', 'KNTCRK01G01H663X'),
+    ('Bruce Wayne', 'BNNBRC01G01H663S'),
+)
+
+def make_year_invoices(rnd, year, first_number, num_invoices, date=None, anomalies=False):
+    if date is None:
+        date = datetime.date(year, 1, 1)
+    invoices = []
+    number = first_number
+    for i in range(num_invoices):
+        date += datetime.timedelta(days=rnd.randrange(3))
+        name, tax_code = rnd.choice(CLIENTS)
+        i_number, i_date = number, date
+        if anomalies:
+            anomaly = rnd.randrange(8)
+            if anomaly == 0:
+                i_number = number + 2
+            elif anomaly == 1:
+                i_date = date - datetime.timedelta(days=5)
+        invoices.append(make_invoice(year, i_number, i_date, name=name, tax_code=tax_code,
+                                     doc_filename='{}_{:03d}_{}.doc'.format(year, i_number, i)))
+        number += 1
+    return invoices
+
+
+# the globals set by conf.setup
+CONF_NAMES = ('RC_DIR_EXPR', 'DB_FILE_EXPR', 'RC_DIR', 'TMP_DOCS_DIR', 'DB_FILE', 'SCANNER_CONFIG_FILE',
+              'PARSER_CONFIG_FILE', 'INFO_CONFIG_FILE', 'SPY_LOCK_FILE', 'SPY_LOG_FILE')
+
+
+class InvoiceDbTestCase(unittest.TestCase):
+    """InvoiceDbTestCase
+       Base class of the tests working on a temporary db: setup_db creates
+       the db with the given invoices and an InvoiceProgram printing on a
+       StringPrinter.
+    """
+    def setup_db(self, invoices, use_rc_dir=False):
+        """setup_db(invoices, use_rc_dir=False)
+           Sets logger, tmpdir, db_filename, db, invoices (as read from the
+           db), p and invoice_program; with use_rc_dir the db is the one of
+           a conf rc_dir in tmpdir, and the conf values are restored at
+           cleanup.
+        """
+        self.logger = get_null_logger()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        if use_rc_dir:
+            conf_values = {name: getattr(conf, name) for name in CONF_NAMES}
+            self.addCleanup(lambda: [setattr(conf, name, value) for name, value in conf_values.items()])
+            conf.setup(rc_dir=self.tmpdir.name)
+            self.db_filename = conf.get_db_file()
+        else:
+            self.db_filename = os.path.join(self.tmpdir.name, 'x.db')
+        self.db = InvoiceDb(self.db_filename, self.logger)
+        self.db.initialize()
+        self.db.write('invoices', invoices)
+        self.invoices = self.db.read('invoices')
+        self.p = StringPrinter()
+        self.invoice_program = InvoiceProgram(db_filename=self.db_filename, logger=self.logger, printer=self.p)
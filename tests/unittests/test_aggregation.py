@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestAggregation',
+]
+
+import datetime
+import random
+import unittest
+
+from invoice import aggregation
+from invoice.aggregation import aggregate, group_value, parse_group, register_group_kind, group_label
+
+from .fixtures import make_year_invoices
+
+
+class TestAggregation(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(4)
+        self.invoices = []
+        for year in 2014, 2015:
+            self.invoices.extend(make_year_invoices(rnd, year, 1, 60, date=datetime.date(year, 1, 2)))
+
+    def test_aggregates(self):
+        groups = aggregate(iter(self.invoices), 'year')
+        self.assertEqual([key for key, group_aggregate in groups], [(2014, ), (2015, )])
+        for (year, ), group_aggregate in groups:
+            invoices = [invoice for invoice in self.invoices if invoice.year == year]
+            self.assertEqual(group_aggregate.count, len(invoices))
+            self.assertAlmostEqual(group_aggregate.income, sum(invoice.income for invoice in invoices))
+            self.assertEqual(group_aggregate.clients, set(invoice.tax_code for invoice in invoices))
+            self.assertEqual((group_aggregate.date_from, group_aggregate.date_to),
+                             (min(invoice.date for invoice in invoices), max(invoice.date for invoice in invoices)))
+            self.assertIs(group_aggregate.first, invoices[0])
+            self.assertIs(group_aggregate.invoices, None)
+
+    def test_composite(self):
+        groups = aggregate(self.invoices, ('year', 'client'), keep_invoices=True)
+        self.assertEqual(sum(group_aggregate.count for key, group_aggregate in groups), len(self.invoices))
+        for key, group_aggregate in groups:
+            self.assertEqual(set((invoice.year, invoice.tax_code) for invoice in group_aggregate.invoices), {key})
+            values, date_from, date_to = group_value('year,client', key, group_aggregate)
+            self.assertEqual(values, key)
+            self.assertEqual((date_from, date_to), (group_aggregate.date_from, group_aggregate.date_to))
+        key, group_aggregate = aggregate(self.invoices, 'month,service')[0]
+        self.assertEqual(key, ((2014, 1), 'therapy'))
+        self.assertEqual(group_value('month,service', key, group_aggregate)[0], ('2014-01', 'therapy'))
+
+    def test_register(self):
+        try:
+            register_group_kind('quarter', 'trimestre', lambda invoice: (invoice.year, (invoice.date.month - 1) // 3 + 1),
+                lambda key, group_aggregate: ("{}Q{}".format(*key), group_aggregate.date_from, group_aggregate.date_to))
+            self.assertEqual(parse_group('quarter,client'), ('quarter', 'client'))
+            self.assertEqual(group_label('quarter,client'), 'trimestre,codice_fiscale')
+            key, group_aggregate = aggregate(self.invoices, 'quarter')[0]
+            self.assertEqual(group_value('quarter', key, group_aggregate)[0], ('2014Q1', ))
+        finally:
+            aggregation._GROUP_KINDS.pop('quarter', None)
+        with self.assertRaises(ValueError):
+            parse_group('year,quarter')
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestCalendar',
+]
+
+import datetime
+import random
+
+from invoice.calendar_table import Calendar
+from invoice.week import WeekManager
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestCalendar(InvoiceDbTestCase):
+    def _week(self, week_manager, day):
+        try:
+            return week_manager.week(day)
+        except IndexError:
+            return None
+
+    def test_week_manager(self):
+        week_manager = WeekManager()
+        # 1960 and 2101 are outside the precomputed range
+        for calendar in Calendar(), Calendar(first_year=2012, last_year=2013):
+            for year in 1960, 2012, 2013, 2015, 2016, 2101:
+                day = datetime.date(year, 1, 1)
+                while day.year == year:
+                    self.assertEqual(self._week(calendar, day), self._week(week_manager, day))
+                    day += datetime.timedelta(days=1)
+                self.assertEqual(calendar.get_year_weeks(year), week_manager.get_year_weeks(year))
+
+    def test_last_day(self):
+        calendar = Calendar()
+        with self.assertRaises(IndexError):
+            calendar.week_number(datetime.date(2015, 12, 31))
+        self.assertEqual(calendar.week_number(datetime.date(2015, 12, 30)), 53)
+
+    def test_year_days(self):
+        calendar = Calendar()
+        calendar_days = calendar.year_days(2016)
+        self.assertEqual(len(calendar_days), 366)
+        for calendar_day in calendar_days[:-1]:
+            self.assertEqual(calendar_day.week_number, calendar.week_number(calendar_day.date))
+            self.assertEqual((calendar_day.week_first, calendar_day.week_last),
+                             calendar.week_range(2016, calendar_day.week_number))
+            self.assertEqual((calendar_day.month, calendar_day.weekday), (calendar_day.date.month, calendar_day.date.weekday()))
+        self.assertEqual(calendar_days[-1].week_number, None)
+
+    def test_db(self):
+        rnd = random.Random(3)
+        self.setup_db(make_year_invoices(rnd, 2014, 1, 10) + make_year_invoices(rnd, 2015, 1, 10))
+        self.assertEqual(self.db.ensure_calendar(), [2014, 2015])
+        self.assertEqual(self.db.ensure_calendar(), [])
+        self.assertEqual(self.db.count('calendar'), 365 * 2)
+        self.db.write('invoices', make_year_invoices(rnd, 2016, 1, 10))
+        self.assertEqual(self.db.ensure_calendar(), [2016])
+        calendar_days = self.db.read('calendar', where="date == '2016-01-05'")
+        self.assertEqual(calendar_days, [Calendar().year_days(2016)[4]])
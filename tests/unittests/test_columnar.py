@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestColumnar',
+]
+
+import datetime
+import os
+import random
+import zipfile
+
+from invoice import conf
+from invoice.columnar import write_columnar, read_columnar, get_columnar_format, ARROW_AVAILABLE, \
+                             INVOICE_COLUMN_KINDS, KIND_INT, KIND_FLOAT, KIND_DATE, KIND_STR, KIND_CATEGORY
+from invoice.invoice_collection import InvoiceCollection
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestColumnar(InvoiceDbTestCase):
+    def setUp(self):
+        rnd = random.Random(13)
+        self.setup_db(make_year_invoices(rnd, 2014, 1, 40) + make_year_invoices(rnd, 2015, 1, 40))
+
+    def _columnar_formats(self):
+        columnar_formats = [conf.EXPORT_FORMAT_NPZ]
+        if ARROW_AVAILABLE: # pragma: no cover
+            columnar_formats.append(conf.EXPORT_FORMAT_ARROW)
+        return columnar_formats
+
+    def test_get_columnar_format(self):
+        if ARROW_AVAILABLE: # pragma: no cover
+            self.assertEqual(get_columnar_format(conf.EXPORT_FORMAT_AUTO), conf.EXPORT_FORMAT_ARROW)
+        else:
+            self.assertEqual(get_columnar_format(conf.EXPORT_FORMAT_AUTO), conf.EXPORT_FORMAT_NPZ)
+            with self.assertRaises(ImportError):
+                get_columnar_format(conf.EXPORT_FORMAT_ARROW)
+
+    def test_none_values(self):
+        column_kinds = {'i': KIND_INT, 'f': KIND_FLOAT, 'd': KIND_DATE, 's': KIND_STR, 'c': KIND_CATEGORY}
+        rows = [
+            (1, 1.5, datetime.date(1969, 12, 31), "città", "b"),
+            (None, None, None, None, None),
+            (-3, 0.0, "2015-02-03", "", "b"),
+        ]
+        filename = os.path.join(self.tmpdir.name, 'x')
+        for columnar_format in self._columnar_formats():
+            self.assertEqual(write_columnar(filename, rows, column_kinds=column_kinds, columnar_format=columnar_format, batch_size=2), 3)
+            field_names, read_rows = read_columnar(filename)
+            self.assertEqual(list(field_names), list(column_kinds))
+            self.assertEqual(list(read_rows), [rows[0], rows[1], (-3, 0.0, datetime.date(2015, 2, 3), "", "b")])
+
+    def test_npz_layout(self):
+        filename = os.path.join(self.tmpdir.name, 'x.npz')
+        self.invoice_program.impl_export(output_filename=filename, export_format=conf.EXPORT_FORMAT_NPZ)
+        with zipfile.ZipFile(filename) as zip_file:
+            names = set(zip_file.namelist())
+            data = zip_file.read('tax_code.npy')
+        self.assertIn('tax_code.categories.npy', names)
+        self.assertEqual(set(name for name in names if name.count('.') == 1), set(field_name + '.npy' for field_name in INVOICE_COLUMN_KINDS))
+        self.assertEqual(data[:8], b'\x93NUMPY\x01\x00')
+        self.assertEqual((10 + int.from_bytes(data[8:10], 'little')) % 64, 0)
+        self.assertIn(b"'descr': '<i4'", data)
+
+    def test_export(self):
+        date_from = datetime.date(2014, 7, 1)
+        for columnar_format in self._columnar_formats():
+            filename = os.path.join(self.tmpdir.name, 'x.' + columnar_format)
+            self.p.reset()
+            self.assertEqual(self.invoice_program.impl_export(output_filename=filename, export_format=columnar_format), 80)
+            self.assertEqual(self.p.string(), "esportate 80 fatture in {} (formato {})\n".format(filename, columnar_format))
+            self.assertEqual(list(InvoiceCollection.from_columnar(filename)), self.invoices)
+            selected = [invoice for invoice in self.invoices if invoice.date >= date_from and invoice.year == 2014]
+            for filters in (lambda invoice: invoice.year == 2014, ), ("anno == 2014", ):
+                self.invoice_program.impl_export(output_filename=filename, filters=filters, date_from=date_from, export_format=columnar_format)
+                self.assertEqual(list(InvoiceCollection.from_columnar(filename)), selected)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestClientDateIndex',
+    'TestIncomeIndex',
+]
+
+import collections
+import datetime
+import random
+import unittest
+
+from invoice.date_index import ClientDateIndex, IncomeIndex
+
+
+Doc = collections.namedtuple('Doc', ('tax_code', 'date'))
+IncomeDoc = collections.namedtuple('IncomeDoc', ('date', 'income'))
+
+
+class TestClientDateIndex(unittest.TestCase):
+    def test_brute_force(self):
+        rnd = random.Random(3)
+        tax_codes = ['A', 'B', 'C']
+        first_date = datetime.date(2014, 1, 1)
+        docs = [Doc(rnd.choice(tax_codes), first_date + datetime.timedelta(days=rnd.randrange(400))) for i in range(200)]
+        client_date_index = ClientDateIndex(docs)
+        interval = datetime.timedelta(days=30)
+        for i in range(500):
+            tax_code = rnd.choice(tax_codes + ['D'])
+            date = first_date + datetime.timedelta(days=rnd.randrange(-40, 440))
+            self.assertEqual(client_date_index.any_before(tax_code, date, interval),
+                             any(doc.tax_code == tax_code and date - interval <= doc.date < date for doc in docs))
+            self.assertEqual(client_date_index.any_after(tax_code, date, interval),
+                             any(doc.tax_code == tax_code and date < doc.date <= date + interval for doc in docs))
+
+    def test_count(self):
+        day = datetime.date(2014, 1, 10)
+        client_date_index = ClientDateIndex([Doc('A', day), Doc('A', day), Doc('A', day + datetime.timedelta(days=1))])
+        self.assertEqual(client_date_index.count('A', day, day), 2)
+        self.assertEqual(client_date_index.count('A', day, day, include_from=False), 0)
+        self.assertEqual(client_date_index.count('A', day, day + datetime.timedelta(days=1), include_from=False), 1)
+        self.assertEqual(client_date_index.count('B', day, day), 0)
+
+
+class TestIncomeIndex(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(5)
+        self.first_date = datetime.date(2014, 1, 1)
+        self.docs = [IncomeDoc(self.first_date + datetime.timedelta(days=rnd.randrange(400)), float(rnd.randrange(10, 100))) for i in range(300)]
+        self.docs.append(IncomeDoc(None, 10.0))
+        self.docs.append(IncomeDoc(self.first_date, None))
+        self.income_index = IncomeIndex(self.docs)
+
+    def _totals(self, date_from, date_to):
+        docs = [doc for doc in self.docs if doc.date is not None and date_from <= doc.date <= date_to]
+        return len(docs), sum(doc.income for doc in docs if doc.income is not None)
+
+    def test_totals(self):
+        rnd = random.Random(7)
+        for i in range(300):
+            date_from = self.first_date + datetime.timedelta(days=rnd.randrange(-20, 420))
+            date_to = date_from + datetime.timedelta(days=rnd.randrange(-5, 100))
+            invoice_count, income = self.income_index.totals(date_from, date_to)
+            expected_count, expected_income = self._totals(date_from, date_to)
+            self.assertEqual(invoice_count, expected_count)
+            self.assertAlmostEqual(income, expected_income, places=6)
+        self.assertEqual(self.income_index.totals()[0], len(self.docs) - 1)
+
+    def test_rolling(self):
+        window = datetime.timedelta(days=30)
+        rolling = list(self.income_index.rolling(window))
+        self.assertEqual([date_to for date_from, date_to, invoice_count, income in rolling],
+                         sorted(set(doc.date for doc in self.docs if doc.date is not None)))
+        for date_from, date_to, invoice_count, income in rolling:
+            self.assertEqual(date_to - date_from, window - datetime.timedelta(days=1))
+            expected_count, expected_income = self._totals(date_from, date_to)
+            self.assertEqual(invoice_count, expected_count)
+            self.assertAlmostEqual(income, expected_income, places=6)
+
+    def test_rolling_range(self):
+        window = datetime.timedelta(days=30)
+        range_from = self.first_date + datetime.timedelta(days=100)
+        range_to = self.first_date + datetime.timedelta(days=200)
+        rolling = list(self.income_index.rolling(window, date_from=range_from, date_to=range_to))
+        self.assertEqual([date_to for date_from, date_to, invoice_count, income in rolling],
+                         sorted(set(doc.date for doc in self.docs if doc.date is not None and range_from <= doc.date <= range_to)))
+        for date_from, date_to, invoice_count, income in rolling:
+            expected_count, expected_income = self._totals(max(date_from, range_from), date_to)
+            self.assertEqual(invoice_count, expected_count)
+            self.assertAlmostEqual(income, expected_income, places=6)
+        self.assertEqual(self.income_index.bounds(range_from, range_to), (rolling[0][1], rolling[-1][1]))
+        self.assertEqual(self.income_index.bounds(), (self.income_index.days[0], self.income_index.days[-1]))
+        self.assertIsNone(self.income_index.bounds(range_to, range_from))
+        self.assertEqual(list(self.income_index.rolling(window, date_from=range_to, date_to=range_from)), [])
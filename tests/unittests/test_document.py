@@ -17,14 +17,19 @@
 
 import collections
 import io
+import os
+import tempfile
 import unittest
 
-from invoice.document import document
+import openpyxl
+
+from invoice.document import document, documents, parse_output, DocumentOutput, Formats, Formula
 from invoice import conf
 
 __author__ = "Simone Campagna"
 __all__ = [
     'TestDocument',
+    'TestFormats',
 ]
 
 
@@ -104,3 +109,164 @@ Peter Parker,450.00,PRKPRT01A01B001C
 Clark Kent,423.12,KNTCKR01A01B001C
 """)
 
+
+    def test_render_iterator(self):
+        sio = io.StringIO()
+        with document(file=sio) as doc:
+            page_template = doc.create_page_template(field_names=_Invoice._fields, header=True)
+            doc.add_page(page_template, iter(self.invoices))
+            doc.add_page(page_template, iter([]))
+        self.assertEqual(sio.getvalue(), """\
+name         income  tax_code        
+Peter Parker 400.0   PRKPRT01A01B001C
+Peter Parker 450.0   PRKPRT01A01B001C
+Clark Kent   423.122 KNTCKR01A01B001C
+""")
+
+    def test_render_documents(self):
+        outputs = [DocumentOutput(file=io.StringIO(), mode=mode) for mode in (conf.TABLE_MODE_TEXT, conf.TABLE_MODE_CSV, conf.TABLE_MODE_TEXT)]
+        consumed = []
+        def invoices():
+            for invoice in self.invoices:
+                consumed.append(invoice)
+                yield invoice
+        with documents(outputs) as doc:
+            page_template = doc.create_page_template(field_names=_Invoice._fields, header=True)
+            doc.add_page(page_template, invoices())
+        # the iterator is consumed once
+        self.assertEqual(consumed, self.invoices)
+        for output in outputs:
+            sio = io.StringIO()
+            with document(mode=output.mode, file=sio) as doc:
+                page_template = doc.create_page_template(field_names=_Invoice._fields, header=True)
+                doc.add_page(page_template, self.invoices)
+            self.assertEqual(output.file.getvalue(), sio.getvalue())
+
+    def test_parse_output(self):
+        self.assertEqual(parse_output("a.csv:csv"), DocumentOutput(file="a.csv", mode=conf.TABLE_MODE_CSV))
+        self.assertEqual(parse_output("a.csv"), DocumentOutput(file="a.csv", mode=None))
+        self.assertEqual(parse_output("a:b.txt"), DocumentOutput(file="a:b.txt", mode=None))
+        self.assertEqual(parse_output("a:b.txt:text"), DocumentOutput(file="a:b.txt", mode=conf.TABLE_MODE_TEXT))
+
+    def test_render_sample_width(self):
+        self._test_render(
+            options={'width': 'sample', 'sample_size': 2},
+            convert=None,
+            align={'income': '>'},
+            header=True,
+            output="""\
+name         income tax_code        
+Peter Parker  400.0 PRKPRT01A01B001C
+Peter Parker  450.0 PRKPRT01A01B001C
+Clark Kent   423.122 KNTCKR01A01B001C
+""")
+
+    def test_render_fixed_width(self):
+        self._test_render(
+            options={'width': {'name': 14, 'income': 8}},
+            convert=None,
+            align={'income': '>'},
+            header=True,
+            output="""\
+name             income tax_code
+Peter Parker      400.0 PRKPRT01A01B001C
+Peter Parker      450.0 PRKPRT01A01B001C
+Clark Kent      423.122 KNTCKR01A01B001C
+""")
+
+    def test_render_csv_quoting(self):
+        self.invoices.append(_Invoice(name='Bruce "Batman" Wayne, Jr.', income=None, tax_code="WNYBRC01G01H663S"))
+        self._test_render(
+            mode=conf.TABLE_MODE_CSV,
+            convert={'income': lambda value: '{:.2f}'.format(value).replace('.', ',') if value else '-'},
+            align=None,
+            header=True,
+            output="""\
+name,income,tax_code
+Peter Parker,"400,00",PRKPRT01A01B001C
+Peter Parker,"450,00",PRKPRT01A01B001C
+Clark Kent,"423,12",KNTCKR01A01B001C
+"Bruce ""Batman"" Wayne, Jr.",-,WNYBRC01G01H663S
+""")
+
+    def test_render_scsv(self):
+        self._test_render(
+            mode=conf.TABLE_MODE_SCSV,
+            convert=None,
+            align=None,
+            header=False,
+            output="""\
+Peter Parker;400.0;PRKPRT01A01B001C
+Peter Parker;450.0;PRKPRT01A01B001C
+Clark Kent;423.122;KNTCKR01A01B001C
+""")
+
+    def test_csv_getlines(self):
+        with document(mode=conf.TABLE_MODE_CSV, file=io.StringIO()) as doc:
+            page_template = doc.create_page_template(field_names=_Invoice._fields, header=True)
+            self.assertEqual(list(page_template.getlines(self.invoices[:1] + [_Invoice('a,b', 1.5, None)])),
+                             ['name,income,tax_code', 'Peter Parker,400.0,PRKPRT01A01B001C', '"a,b",1.5,'])
+
+    def _xlsx_values(self, constant_memory):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'x.xlsx')
+            formats = Formats()
+            formats.add_format("bold", row=1)
+            formats.add_format("money", col=1)
+            formats.add_format("money_bold", row=5, col=1)
+            with document(mode=conf.TABLE_MODE_XLSX, file=filename, constant_memory=constant_memory) as doc:
+                doc.define_format("bold", {"bold": True})
+                doc.define_format("money", {"num_format": "0.00"})
+                doc.define_format("money_bold", {"num_format": "0.00", "bold": True})
+                page_template = doc.create_page_template(field_names=_Invoice._fields, header=True)
+                total = _Invoice(name="TOTALE", income=Formula("SUM", 1, 2, 4, value=1273.122), tax_code=None)
+                doc.add_page(page_template, iter(self.invoices + [total]), title="p", formats=formats,
+                             prologue=[("prologo",)])
+            worksheet = openpyxl.load_workbook(filename).active
+            return [[(cell.value, cell.number_format, cell.font.b) for cell in row] for row in worksheet.iter_rows(min_row=3, max_col=3)]
+
+    def test_render_xlsx(self):
+        values = self._xlsx_values(constant_memory=True)
+        self.assertEqual(values, self._xlsx_values(constant_memory=False))
+        self.assertEqual(values[0], [("name", "General", True), ("income", "General", True), ("tax_code", "General", True)])
+        self.assertEqual(values[1], [("Peter Parker", "General", False), (400.0, "0.00", False), ("PRKPRT01A01B001C", "General", False)])
+        self.assertEqual(values[4][:2], [("TOTALE", "General", False), ("=SUM(B4:B6)", "0.00", True)])
+
+
+class TestFormats(unittest.TestCase):
+    def setUp(self):
+        self.formats = Formats()
+        self.formats.add_format("a", row=None, col=None)
+        self.formats.add_format("b", row=None, col=1)
+        self.formats.add_format("c", row=2, col=None)
+        self.formats.add_format("d", row=2, col=2)
+        self.formats.add_format("e", row=3, col=0)
+
+    def test_row_formats(self):
+        formats = self.formats
+        self.assertEqual(formats.row_formats(0, 3), ("a", "b", "a"))
+        self.assertEqual(formats.row_formats(2, 4), ("c", "c", "d", "c"))
+        self.assertEqual(formats.row_formats(3, 3), ("e", "b", "a"))
+        for row in range(5):
+            self.assertEqual(formats.row_formats(row, 3), tuple(formats.get_format(row, col) for col in range(3)))
+
+    def test_apply_offset(self):
+        formats = self.formats
+        formats.apply_offset(1, 2)
+        formats.apply_offset(5, 1)
+        self.assertEqual(formats.row_formats(2, 3), ("a", "b", "a"))
+        self.assertEqual(formats.row_formats(4, 3), ("c", "c", "d"))
+        self.assertEqual(formats.row_formats(5, 3), ("a", "b", "a"))
+        self.assertEqual(formats.row_formats(6, 3), ("e", "b", "a"))
+        formats.add_format("f", row=5, col=0)
+        self.assertEqual(formats.row_formats(5, 2), ("f", "b"))
+        self.assertEqual(formats.row_formats(6, 2), ("e", "b"))
+        self.assertEqual(formats.get_format(4, 2), "d")
+
+    def test_copy(self):
+        formats = self.formats
+        formats.apply_offset(1, 2)
+        formats_copy = formats.copy()
+        formats.apply_offset(0, 1)
+        self.assertEqual(formats_copy.row_formats(4, 3), ("c", "c", "d"))
+        self.assertEqual(formats.row_formats(5, 3), ("c", "c", "d"))
@@ -41,7 +41,7 @@ class TestInvoiceCollection(unittest.TestCase):
             service='therapy',
             fee=200.0, vat=0.0, cpa=0.0, deduction=0.0,
             p_vat=0.0, p_deduction=0.0, p_cpa=0.0, refunds=0.0, taxes=0.0,
-            income=200.0, currency='euro')
+            income=200.0, currency='euro', exceptions='')
         self._invoice_002_peter_parker = Invoice(
             doc_filename='2015_002_peter_parker.doc',
             year=2015, number=2,
@@ -50,7 +50,7 @@ class TestInvoiceCollection(unittest.TestCase):
             service='therapy',
             fee=100.0, vat=0.0, cpa=0.0, deduction=0.0,
             p_vat=0.0, p_deduction=0.0, p_cpa=0.0, refunds=0.0, taxes=0.0,
-            income=100.0, currency='euro')
+            income=100.0, currency='euro', exceptions='')
         self._invoice_003_peter_parker = Invoice(
             doc_filename='2015_003_peter_parser.doc',
             year=2015, number=3,
@@ -59,7 +59,7 @@ class TestInvoiceCollection(unittest.TestCase):
             service='therapy',
             fee=150.0, vat=0.0, cpa=0.0, deduction=0.0,
             p_vat=0.0, p_deduction=0.0, p_cpa=0.0, refunds=0.0, taxes=0.0,
-            income=150.0, currency='euro')
+            income=150.0, currency='euro', exceptions='')
         self._invoices = [
             self._invoice_001_peter_parker,
             self._invoice_002_peter_parker,
@@ -91,5 +91,30 @@ class TestInvoiceCollection(unittest.TestCase):
         with self.assertRaises(InvoiceSyntaxError):
             invoice_collection_7 = invoice_collection.filter("città = 'Gotham City'")
 
-        
+    def test_sort(self):
+        invoice_2014 = self._invoice_001_peter_parker._replace(doc_filename='2014_001.doc', year=2014, date=datetime.date(2014, 12, 30))
+        invoice_none = self._invoice_002_peter_parker._replace(doc_filename='none.doc', number=None)
+        invoices = [self._invoice_003_peter_parker, invoice_none, self._invoice_001_peter_parker, invoice_2014, self._invoice_002_peter_parker]
+        invoice_collection = InvoiceCollection(invoices, logger=self.logger)
+        invoice_collection.sort()
+        self.assertTrue(invoice_collection.is_sorted())
+        self.assertEqual(list(invoice_collection), [invoice_2014, invoice_none] + self._invoices)
+        self.assertEqual(invoice_collection.years(), (2014, 2015))
+
+    def test_sort_merge(self):
+        invoice_collection = InvoiceCollection(self._invoices[::2], logger=self.logger)
+        invoice_collection.sort()
+        invoice_2016 = self._invoice_001_peter_parker._replace(doc_filename='2016_001.doc', year=2016, date=datetime.date(2016, 1, 1))
+        invoice_collection.add(invoice_2016)
+        invoice_collection.add(self._invoice_002_peter_parker)
+        self.assertFalse(invoice_collection.is_sorted())
+        invoice_collection.sort()
+        self.assertEqual(list(invoice_collection), self._invoices + [invoice_2016])
+        self.assertEqual(invoice_collection.years(), (2015, 2016))
 
+    def test_filter_keeps_order(self):
+        invoice_collection = InvoiceCollection(self._invoices[::-1], logger=self.logger)
+        invoice_collection_2 = invoice_collection.filter(lambda invoice: invoice.number != 2)
+        self.assertTrue(invoice_collection_2.is_sorted())
+        self.assertEqual(list(invoice_collection_2), [self._invoice_001_peter_parker, self._invoice_003_peter_parker])
+        self.assertEqual(invoice_collection_2.years(), (2015,))
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestInvoiceCollectionValidator',
+    'TestIncrementalValidation',
+    'TestParallelValidation',
+    'TestTargetedValidation',
+]
+
+import datetime
+import os
+import random
+import tempfile
+import unittest
+
+from invoice.log import get_null_logger
+from invoice.error import InvoiceError, \
+                          InvoiceDuplicatedNumberError, \
+                          InvoiceWrongNumberError, \
+                          InvoiceDateError, \
+                          InvoiceMultipleNamesError, \
+                          InvoiceMultipleInvoicesPerDayError
+from invoice.invoice import Invoice
+from invoice.invoice_collection import InvoiceCollection
+from invoice.invoice_db import InvoiceDb
+from invoice.invoice_collection_validator import InvoiceCollectionValidator, ValidationState
+from invoice.validation_result import ValidationResult, ValidationMessage
+
+from .fixtures import CLIENTS, make_invoice, make_year_invoices
+
+
+class TestInvoiceCollectionValidator(unittest.TestCase):
+    def setUp(self):
+        self.logger = get_null_logger()
+
+    def _validate(self, invoices, warning_mode=None):
+        validation_result = ValidationResult(logger=self.logger, warning_mode=warning_mode)
+        validator = InvoiceCollectionValidator(validation_result, logger=self.logger)
+        validator.validate(InvoiceCollection(invoices, logger=self.logger))
+        return validation_result
+
+    def _error_types(self, validation_result):
+        return {doc_filename: [entry.exc_type for entry in entries] for doc_filename, entries in validation_result.errors().items()}
+
+    def test_ok(self):
+        invoices = [
+            make_invoice(2014, 1, datetime.date(2014, 1, 3)),
+            make_invoice(2014, 2, datetime.date(2014, 1, 4)),
+            make_invoice(2015, 1, datetime.date(2015, 1, 2)),
+        ]
+        validation_result = self._validate(invoices[::-1])
+        self.assertEqual(validation_result.num_errors(), 0)
+        self.assertEqual(validation_result.num_warnings(), 0)
+
+    def test_numbering(self):
+        invoices = [
+            make_invoice(2014, 1, datetime.date(2014, 1, 3)),
+            make_invoice(2014, 1, datetime.date(2014, 1, 4), doc_filename='2014_001_bis.doc'),
+            make_invoice(2014, 3, datetime.date(2014, 1, 5)),
+            make_invoice(2015, 1, datetime.date(2015, 1, 5)),
+            make_invoice(2015, 2, datetime.date(2015, 1, 4)),
+        ]
+        validation_result = self._validate(invoices)
+        self.assertEqual(self._error_types(validation_result), {
+            '2014_001_bis.doc': [InvoiceDuplicatedNumberError],
+            '2014_003.doc': [InvoiceWrongNumberError],
+            '2015_002.doc': [InvoiceDateError],
+        })
+        message = validation_result.errors()['2014_001_bis.doc'][0].message
+        self.assertIsInstance(message, ValidationMessage)
+        self.assertEqual(str(message), "fattura 2014_001_bis.doc: il numero 2014/1 è duplicato [presente anche in 1:2014_001.doc]")
+
+    def test_failing_invoice_skipped_in_numbering(self):
+        invoices = [
+            make_invoice(2014, 1, datetime.date(2014, 1, 3)),
+            make_invoice(2014, 2, datetime.date(2014, 1, 4), tax_code='WNYBRC01G01H663X'),
+            make_invoice(2014, 3, datetime.date(2014, 1, 5)),
+        ]
+        validation_result = self._validate(invoices)
+        self.assertEqual(list(validation_result.errors()), ['2014_002.doc', '2014_003.doc'])
+        self.assertEqual(self._error_types(validation_result)['2014_003.doc'], [InvoiceWrongNumberError])
+
+    def test_warnings(self):
+        invoices = [
+            make_invoice(2014, 1, datetime.date(2014, 1, 3)),
+            make_invoice(2014, 2, datetime.date(2014, 1, 3), name='Bruce Banner'),
+        ]
+        validation_result = self._validate(invoices)
+        self.assertEqual(validation_result.num_errors(), 0)
+        warnings = validation_result.warnings()
+        self.assertEqual([entry.exc_type for entry in warnings['2014_001.doc']], [InvoiceMultipleInvoicesPerDayError])
+        self.assertEqual([entry.exc_type for entry in warnings['2014_002.doc']], [InvoiceMultipleNamesError, InvoiceMultipleInvoicesPerDayError])
+
+    def test_warnings_as_errors(self):
+        invoices = [
+            make_invoice(2014, 1, datetime.date(2014, 1, 3)),
+            make_invoice(2014, 2, datetime.date(2014, 1, 3)),
+            make_invoice(2014, 3, datetime.date(2014, 1, 4)),
+        ]
+        validation_result = self._validate(invoices, warning_mode=('error:009',))
+        self.assertEqual(self._error_types(validation_result), {
+            '2014_001.doc': [InvoiceMultipleInvoicesPerDayError],
+            '2014_002.doc': [InvoiceMultipleInvoicesPerDayError],
+            '2014_003.doc': [InvoiceWrongNumberError],
+        })
+
+
+class TestIncrementalValidation(unittest.TestCase):
+    def setUp(self):
+        self.logger = get_null_logger()
+
+    def _validator(self, warning_mode):
+        validation_result = ValidationResult(logger=self.logger, warning_mode=warning_mode)
+        return InvoiceCollectionValidator(validation_result, logger=self.logger)
+
+    def _state_dict(self, validation_state):
+        return validation_state.years, validation_state.client_names, validation_state.client_days, validation_state.warnings
+
+    def _check(self, stored_invoices, touched_invoices, replaced_invoices=(), warning_mode=None):
+        # stored invoices and their validation state
+        base_validator = self._validator(warning_mode)
+        base_validator.validate(InvoiceCollection(stored_invoices, logger=self.logger))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # the validation state is read back from the db
+            db = InvoiceDb(os.path.join(tmpdir, 'x.db'), self.logger)
+            db.initialize()
+            db.store_validation_state(base_validator.make_validation_state('fp'))
+            base_state = db.load_validation_state()
+        failing = base_validator.validation_result.failing_invoices()
+        stored_invoices = [invoice for invoice in stored_invoices if invoice.doc_filename not in failing]
+
+        replaced = set(invoice.doc_filename for invoice in replaced_invoices)
+        invoices = [invoice for invoice in stored_invoices if invoice.doc_filename not in replaced] + list(touched_invoices)
+
+        full_validator = self._validator(warning_mode)
+        full_result = full_validator.validate(InvoiceCollection(invoices, logger=self.logger))
+        inc_validator = self._validator(warning_mode)
+        inc_result = inc_validator.validate_incremental(InvoiceCollection(invoices, logger=self.logger), base_state,
+            touched_invoices=touched_invoices, replaced_invoices=replaced_invoices)
+
+        self.assertEqual(dict(inc_result.errors()), dict(full_result.errors()))
+        self.assertEqual(dict(inc_result.warnings()), dict(full_result.warnings()))
+        self.assertEqual(set(inc_result.failing_invoices()), set(full_result.failing_invoices()))
+        self.assertEqual(inc_result.error_counts(), full_result.error_counts())
+        self.assertEqual(inc_result.warning_counts(), full_result.warning_counts())
+        self.assertEqual(self._state_dict(inc_validator.make_validation_state('fp')),
+                         self._state_dict(full_validator.make_validation_state('fp')))
+        return inc_result
+
+    def _stored_invoices(self, rnd):
+        stored_invoices = []
+        for year in 2013, 2014, 2015:
+            stored_invoices.extend(make_year_invoices(rnd, year, 1, 30))
+        return stored_invoices
+
+    def test_appended(self):
+        for seed in range(10):
+            rnd = random.Random(seed)
+            stored_invoices = self._stored_invoices(rnd)
+            last = stored_invoices[-1]
+            touched_invoices = make_year_invoices(rnd, 2015, 31, 10, date=last.date, anomalies=True) + \
+                               make_year_invoices(rnd, 2016, 1, 10, anomalies=True)
+            self._check(stored_invoices, touched_invoices)
+
+    def test_appended_same_day(self):
+        stored_invoices = [
+            make_invoice(2014, 1, datetime.date(2014, 1, 3)),
+            make_invoice(2014, 2, datetime.date(2014, 1, 4)),
+        ]
+        touched_invoices = [
+            make_invoice(2014, 3, datetime.date(2014, 1, 4)),
+        ]
+        for warning_mode in None, ('error:009', ):
+            validation_result = self._check(stored_invoices, touched_invoices, warning_mode=warning_mode)
+            self.assertEqual(len(validation_result.failing_invoices()), 0 if warning_mode is None else 2)
+
+    def test_backfilled(self):
+        for seed in range(10):
+            rnd = random.Random(seed)
+            stored_invoices = [invoice for invoice in self._stored_invoices(rnd) if invoice.year != 2014 or invoice.number <= 20]
+            touched_invoices = make_year_invoices(rnd, 2014, 21, 10, date=datetime.date(2014, 3, 1), anomalies=True)
+            self._check(stored_invoices, touched_invoices)
+            self._check(stored_invoices, touched_invoices, warning_mode=('error:*', ))
+
+    def test_modified(self):
+        for seed in range(10):
+            rnd = random.Random(seed)
+            stored_invoices = self._stored_invoices(rnd)
+            replaced_invoices = rnd.sample(stored_invoices, 3)
+            touched_invoices = []
+            for invoice in replaced_invoices:
+                name, tax_code = rnd.choice(CLIENTS)
+                touched_invoices.append(invoice._replace(name=name, tax_code=tax_code,
+                    date=invoice.date + datetime.timedelta(days=rnd.randrange(-2, 3))))
+            self._check(stored_invoices, touched_invoices, replaced_invoices)
+            self._check(stored_invoices, touched_invoices, replaced_invoices, warning_mode=('error:*', ))
+
+    def test_removed(self):
+        for seed in range(10):
+            rnd = random.Random(seed)
+            stored_invoices = self._stored_invoices(rnd)
+            replaced_invoices = [invoice for invoice in stored_invoices if invoice.year == 2014 and invoice.number >= 25]
+            touched_invoices = make_year_invoices(rnd, 2016, 1, 5)
+            self._check(stored_invoices, touched_invoices, replaced_invoices)
+
+    def test_fingerprint(self):
+        validation_result = ValidationResult(logger=self.logger)
+        fingerprint = ValidationState.make_fingerprint(validation_result)
+        self.assertEqual(fingerprint, ValidationState.make_fingerprint(ValidationResult(logger=self.logger)))
+        self.assertNotEqual(fingerprint, ValidationState.make_fingerprint(ValidationResult(logger=self.logger, warning_mode=('error:*', ))))
+        self.assertNotEqual(fingerprint, ValidationState.make_fingerprint(ValidationResult(logger=self.logger, changed_tax_codes=('WNYBRC01G01H663S', ))))
+
+
+class TestParallelValidation(unittest.TestCase):
+    def setUp(self):
+        self.logger = get_null_logger()
+        rnd = random.Random(1)
+        self.invoices = []
+        for year in 2013, 2014, 2015:
+            self.invoices.extend(make_year_invoices(rnd, year, 1, 40, anomalies=True))
+        self.invoices.append(make_invoice(2015, 41, datetime.date(2015, 12, 30), tax_code='WNYBRC01G01H663X'))
+        validator = InvoiceDb.Validator('year == 2014', 'fee > 100.0', 'compenso troppo basso')
+        self.user_validators = [(validator, InvoiceDb.Validator(Invoice.compile_filter_function(validator.filter_function),
+                                                                Invoice.compile_filter_function(validator.check_function),
+                                                                validator.message))]
+
+    def _validate(self, jobs, **n_args):
+        validation_result = ValidationResult(logger=self.logger, **n_args)
+        validator = InvoiceCollectionValidator(validation_result, user_validators=self.user_validators, logger=self.logger, jobs=jobs)
+        validator.validate(InvoiceCollection(self.invoices, logger=self.logger))
+        return validation_result, validator
+
+    def _entries(self, entries_d):
+        return [(doc_filename, [tuple(entry) for entry in entries]) for doc_filename, entries in entries_d.items()]
+
+    def test_parallel(self):
+        for warning_mode in None, ('error:*', ):
+            serial_result, serial_validator = self._validate(1, warning_mode=warning_mode)
+            parallel_result, parallel_validator = self._validate(2, warning_mode=warning_mode)
+            self.assertGreater(serial_result.num_errors(), 0)
+            self.assertEqual(self._entries(parallel_result.errors()), self._entries(serial_result.errors()))
+            self.assertEqual(self._entries(parallel_result.warnings()), self._entries(serial_result.warnings()))
+            self.assertEqual(list(parallel_result.failing_invoices()), list(serial_result.failing_invoices()))
+            self.assertEqual({year: year_numbering.state() for year, year_numbering in parallel_validator.year_numberings.items()},
+                             {year: year_numbering.state() for year, year_numbering in serial_validator.year_numberings.items()})
+
+    def test_parallel_raise(self):
+        for error_mode in ('raise:*', ), ('raise:005', ), ('raise:012', ):
+            exceptions = []
+            for jobs in 1, 2:
+                with self.assertRaises(InvoiceError) as cm:
+                    self._validate(jobs, error_mode=error_mode)
+                exceptions.append((type(cm.exception), str(cm.exception)))
+            self.assertEqual(exceptions[0], exceptions[1])
+
+
+class TestTargetedValidation(unittest.TestCase):
+    def setUp(self):
+        self.logger = get_null_logger()
+        rnd = random.Random(2)
+        self.invoices = []
+        for year in 2013, 2014, 2015:
+            self.invoices.extend(make_year_invoices(rnd, year, 1, 30))
+
+    def _user_validators(self, *validators):
+        return [(validator, InvoiceDb.Validator(Invoice.compile_filter_function(validator.filter_function),
+                                                Invoice.compile_filter_function(validator.check_function),
+                                                validator.message)) for validator in validators]
+
+    def _entries(self, entries_d):
+        return [(doc_filename, [tuple(entry) for entry in entries]) for doc_filename, entries in entries_d.items()]
+
+    def test_targeted(self):
+        old_validator = InvoiceDb.Validator('True', 'fee > 0.0', 'compenso nullo')
+        new_validator = InvoiceDb.Validator('year == 2014', 'tax_code != "KNTCRK01G01H663X"', 'cliente non valido')
+        user_validators = self._user_validators(old_validator, new_validator)
+
+        full_result = ValidationResult(logger=self.logger)
+        InvoiceCollectionValidator(full_result, user_validators=user_validators, logger=self.logger).validate(
+            InvoiceCollection(self.invoices, logger=self.logger))
+        self.assertGreater(full_result.num_errors(), 0)
+
+        targeted_result = ValidationResult(logger=self.logger)
+        years = InvoiceCollectionValidator(targeted_result, user_validators=user_validators, logger=self.logger).revalidate_user_validators(
+            InvoiceCollection(self.invoices, logger=self.logger), user_validators[1:])
+        self.assertEqual(years, {2014})
+        self.assertEqual(self._entries(targeted_result.errors()), self._entries(full_result.errors()))
+        self.assertEqual(list(targeted_result.failing_invoices()), list(full_result.failing_invoices()))
+
+        # unchanged validators are not evaluated
+        validation_result = ValidationResult(logger=self.logger)
+        years = InvoiceCollectionValidator(validation_result, user_validators=user_validators, logger=self.logger).revalidate_user_validators(
+            InvoiceCollection(self.invoices, logger=self.logger), user_validators[:1])
+        self.assertEqual((years, validation_result.num_errors()), (set(), 0))
+
+    def test_validators_generation(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = InvoiceDb(os.path.join(tmpdir, 'x.db'), self.logger)
+            db.initialize()
+            self.assertEqual(db.load_validators_generation(), (0, 0))
+            validator = InvoiceDb.make_validator('True', 'fee > 0.0', 'compenso nullo')
+            db.write('validators', [validator])
+            db.write('validators', [validator._replace(message='x')])
+            self.assertEqual(db.load_validators_generation(), (2, 0))
+            db.store_validated_validators(db.load_validators())
+            self.assertEqual(db.load_validators_generation(), (2, 2))
+            self.assertEqual(db.load_validated_validators(), [validator, validator._replace(message='x')])
+            db.clear('validators')
+            self.assertGreater(db.load_validators_generation().generation, 2)
+            self.assertEqual(db.load_internal_options().needs_refresh, False)
+            # a legacy db with a pending needs_refresh
+            db.store_internal_options(db.InternalOptions(needs_refresh=True))
+            with db.connect() as connection:
+                for table_name in db.VALIDATORS_GENERATION_TABLES:
+                    connection.execute("DROP TABLE {};".format(table_name))
+            self.assertEqual(db.load_validators_generation(), (1, 0))
+            self.assertEqual(db.load_internal_options().needs_refresh, False)
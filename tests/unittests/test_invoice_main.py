@@ -715,11 +715,11 @@ FT            20140129      5            20140129      KNTCRK01G01H663X SP
             elif table_mode == conf.TABLE_MODE_CSV:
                 assert p.string() == """\
 TipoDocumento,DataDocumento,NumDocumento,DataPagamento,CodiceFiscale,TipoSpesa,FlagTipoSpesa,Importo,DataDocumentoRimborso,NumDocumentoRimborso
-FT,20140103,1,20140103,WNYBRC01G01H663S,SP,,51,00,,
-FT,20140103,2,20140103,PRKPRT01G01H663M,SP,,76,50,,
-FT,20140122,3,20140122,BNNBRC01G01H663S,SP,,107,00,,
-FT,20140125,4,20140125,WNYBRC01G01H663S,SP,,51,00,,
-FT,20140129,5,20140129,KNTCRK01G01H663X,SP,,155,00,,
+FT,20140103,1,20140103,WNYBRC01G01H663S,SP,,"51,00",,
+FT,20140103,2,20140103,PRKPRT01G01H663M,SP,,"76,50",,
+FT,20140122,3,20140122,BNNBRC01G01H663S,SP,,"107,00",,
+FT,20140125,4,20140125,WNYBRC01G01H663S,SP,,"51,00",,
+FT,20140129,5,20140129,KNTCRK01G01H663X,SP,,"155,00",,
 """
             elif table_mode == conf.TABLE_MODE_SCSV:
                 assert p.string() == """\
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestListPage',
+]
+
+import datetime
+import random
+import sqlite3
+
+from invoice import conf
+from invoice.error import InvoiceArgumentError
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestListPage(InvoiceDbTestCase):
+    def setUp(self):
+        rnd = random.Random(13)
+        self.setup_db(make_year_invoices(rnd, 2015, 1, 40) + make_year_invoices(rnd, 2014, 1, 40))
+
+    def _list(self, python, **kwargs):
+        self.p.reset()
+        if python:
+            # a python filter forces the InvoiceCollection path
+            kwargs['filters'] = (lambda invoice: True, )
+        self.invoice_program.impl_list(table_mode=conf.TABLE_MODE_CSV, list_field_names=('year', 'number', 'tax_code', 'income'), **kwargs)
+        return self.p.string()
+
+    def test_page(self):
+        order_field_names = ((False, 'tax_code'), (True, 'income'))
+        pages = (
+            {'limit': 10},
+            {'limit': 10, 'offset': 75},
+            {'offset': 30},
+            {'last': 20},
+            {'last': 20, 'offset': 70},
+            {'last': 0},
+        )
+        for order in None, order_field_names:
+            for page in pages:
+                output = self._list(False, order_field_names=order, **page)
+                self.assertEqual(output, self._list(True, order_field_names=order, **page))
+        self.assertEqual(self._list(False, last=200), self._list(False))
+        self.assertEqual(self._list(False, date_from=datetime.date(2015, 1, 1), last=5),
+                         self._list(True, date_from=datetime.date(2015, 1, 1), last=5))
+
+    def test_page_digits(self):
+        # 80 invoices: numbers are 2 digits wide in every page, however short
+        rows = self._list(False).split('\n')[1:4]
+        for python in False, True:
+            self.assertEqual(self._list(python, limit=3).split('\n')[1:4], rows)
+        self.assertEqual(self.db.count_invoices(), 80)
+        self.assertEqual(self.db.count_invoices(date_from=datetime.date(2015, 1, 1)), 40)
+
+    def test_last(self):
+        invoices = self.db.load_invoice_page(last=3)
+        self.assertEqual([(invoice.year, invoice.number) for invoice in invoices], [(2015, 38), (2015, 39), (2015, 40)])
+        with self.assertRaises(InvoiceArgumentError):
+            self.invoice_program.impl_list(limit=3, last=3)
+
+    def test_index(self):
+        with sqlite3.connect(self.db_filename) as connection:
+            connection.execute("DROP INDEX invoices_sort_key;")
+        self.db.load_invoice_page(last=3)
+        with sqlite3.connect(self.db_filename) as connection:
+            plan = connection.execute("EXPLAIN QUERY PLAN SELECT * FROM invoices ORDER BY year DESC, number DESC, date DESC, ID DESC LIMIT 3;").fetchall()
+        self.assertIn("invoices_sort_key", str(plan))
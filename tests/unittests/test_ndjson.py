@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestNdjson',
+]
+
+import datetime
+import io
+import json
+import random
+
+from invoice import conf
+from invoice.document import document, item_getter
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestNdjson(InvoiceDbTestCase):
+    def setUp(self):
+        rnd = random.Random(11)
+        self.setup_db(make_year_invoices(rnd, 2014, 1, 50) + make_year_invoices(rnd, 2015, 1, 50))
+
+    def test_document(self):
+        rows = [
+            {'date': datetime.date(2015, 3, 1), 'income': 102.3, 'p_cpa': 0.04, 'name': "Niccolò", 'number': 3},
+            {'date': None, 'income': None, 'p_cpa': 0.04, 'name': "a\nb", 'number': 4},
+        ]
+        sio = io.StringIO()
+        with document(mode=conf.TABLE_MODE_NDJSON, file=sio) as doc:
+            page_template = doc.create_page_template(field_names=('number', 'date', 'name', 'income', 'p_cpa'),
+                                                     header=True, getter=item_getter, convert={'income': str})
+            doc.add_page(page_template, iter(rows), title="t", prologue=[("p",)])
+        self.assertEqual(sio.getvalue(), """\
+{"number":3,"date":"2015-03-01","name":"Niccolò","income":10230,"p_cpa":0.04}
+{"number":4,"date":null,"name":"a\\nb","income":null,"p_cpa":0.04}
+""")
+
+    def _list(self, **kwargs):
+        self.p.reset()
+        self.invoice_program.impl_list(table_mode=conf.TABLE_MODE_NDJSON, **kwargs)
+        return [json.loads(line) for line in self.p.string().splitlines()]
+
+    def test_list(self):
+        field_names = ('year', 'number', 'date', 'tax_code', 'income', 'p_cpa')
+        date_from = datetime.date(2014, 6, 1)
+        # the python filter forces the InvoiceCollection path
+        python_filter = lambda invoice: True
+        for kwargs in {}, {'date_from': date_from}:
+            streamed = self._list(list_field_names=field_names, **kwargs)
+            loaded = self._list(list_field_names=field_names, filters=(python_filter, ), **kwargs)
+            self.assertEqual(streamed, loaded)
+        self.assertEqual(len(streamed), len([invoice for invoice in self.invoices if invoice.date >= date_from]))
+        invoice = self.invoices[0]
+        self.assertEqual(self._list(list_field_names=field_names)[0], {
+            'year': invoice.year,
+            'number': invoice.number,
+            'date': invoice.date.isoformat(),
+            'tax_code': invoice.tax_code,
+            'income': int(round(invoice.income * 100)),
+            'p_cpa': invoice.p_cpa,
+        })
+
+    def test_stats(self):
+        self.p.reset()
+        self.invoice_program.impl_stats(filters=(), stats_group=conf.STATS_GROUP_YEAR, total=True,
+                                        table_mode=conf.TABLE_MODE_NDJSON)
+        rows = [json.loads(line) for line in self.p.string().splitlines()]
+        self.assertEqual([row['year'] for row in rows], [2014, 2015, "TOTALE"])
+        self.assertEqual(rows[0]['from'], "2014-01-01")
+        self.assertEqual(rows[2]['invoice_count'], 100)
+        self.assertLessEqual(abs(rows[2]['income'] - sum(row['income'] for row in rows[:2])), 1)
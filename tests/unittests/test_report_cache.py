@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestReportCache',
+]
+
+import os
+import random
+
+from invoice import conf
+from invoice.invoice_program import InvoiceProgram
+from invoice.report_cache import make_report_key, dump_report_contents, load_report_contents
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestReportCache(InvoiceDbTestCase):
+    def setUp(self):
+        self.rnd = random.Random(17)
+        self.setup_db(make_year_invoices(self.rnd, 2015, 1, 60), use_rc_dir=True)
+
+    def _stats(self, **kwargs):
+        self.p.reset()
+        self.invoice_program.program_stats(table_mode=conf.TABLE_MODE_TEXT, **kwargs)
+        return self.p.string()
+
+    def _fail(self, **kwargs):
+        raise AssertionError("report not cached")
+
+    def test_contents(self):
+        contents = ["a\nè", b"\x00\xff"]
+        self.assertEqual(load_report_contents(dump_report_contents(contents)), contents)
+        self.assertEqual(make_report_key('stats', {'a': 1, 'b': None}, 3), make_report_key('stats', {'b': None, 'a': 1}, 3))
+        self.assertNotEqual(make_report_key('stats', {'a': 1}, 3), make_report_key('stats', {'a': 1}, 4))
+
+    def test_hit(self):
+        stats = self._stats()
+        stats_client = self._stats(stats_group=conf.STATS_GROUP_CLIENT)
+        self.assertEqual(self.db.count('report_cache'), 2)
+        impl_stats = self.invoice_program.impl_stats
+        self.invoice_program.impl_stats = self._fail
+        self.assertEqual(self._stats(), stats)
+        self.assertEqual(self._stats(stats_group=conf.STATS_GROUP_CLIENT), stats_client)
+        # a change of the invoices makes the cached reports stale
+        self.db.write('invoices', make_year_invoices(self.rnd, 2016, 1, 10))
+        with self.assertRaises(AssertionError):
+            self._stats()
+        self.invoice_program.impl_stats = impl_stats
+        self.assertNotEqual(self._stats(), stats)
+        self.assertEqual(self.db.count('report_cache'), 1)
+
+    def test_files(self):
+        filename = os.path.join(self.tmpdir.name, "summary.xlsx")
+        self.invoice_program.program_summary(year=2015, output_filename=[filename + ":xlsx", "-:text"])
+        with open(filename, "rb") as f_in:
+            content = f_in.read()
+        summary = self.p.string()
+        os.remove(filename)
+        self.p.reset()
+        self.invoice_program.impl_summary = self._fail
+        self.invoice_program.program_summary(year=2015, output_filename=[filename + ":xlsx", "-:text"])
+        self.assertEqual(self.p.string(), summary)
+        with open(filename, "rb") as f_in:
+            self.assertEqual(f_in.read(), content)
+
+    def test_disabled(self):
+        invoice_program = InvoiceProgram(db_filename=self.db_filename, logger=self.logger, printer=self.p, report_cache_size=0)
+        invoice_program.program_yreport(year=2015)
+        self.assertEqual(self.db.count('report_cache'), 0)
+
+    def test_lru(self):
+        for key in 'a', 'b', 'c':
+            self.assertTrue(self.db.store_report(key, 1, key * 10, 25))
+            self.db.load_report('a')
+        self.assertEqual(self.db.load_report('b'), None)
+        self.assertEqual(self.db.load_report('a'), 'a' * 10)
+        self.assertEqual(self.db.load_report('c'), 'c' * 10)
+        self.assertFalse(self.db.store_report('d', 1, 'd' * 30, 25))
+        self.assertTrue(self.db.store_report('e', 2, 'e', 25))
+        self.assertEqual(self.db.count('report_cache'), 1)
+
+    def test_hit_read_only(self):
+        self.db.store_report('a', 1, 'a', 25)
+        self.db.store_report('b', 1, 'b', 25)
+        with self.db.connect() as connection:
+            self.assertEqual(self.db.load_report('b', connection=connection), 'b')
+            self.assertEqual(connection.total_changes, 0)
+            self.assertEqual(self.db.load_report('a', connection=connection), 'a')
+            self.assertEqual(connection.total_changes, 1)
+            self.assertEqual(self.db.load_report('a', connection=connection), 'a')
+            self.assertEqual(connection.total_changes, 1)
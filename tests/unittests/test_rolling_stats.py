@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestRollingStats',
+]
+
+import datetime
+import random
+
+from invoice import conf
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestRollingStats(InvoiceDbTestCase):
+    def setUp(self):
+        rnd = random.Random(19)
+        self.setup_db(make_year_invoices(rnd, 2015, 1, 80, date=datetime.date(2015, 1, 1)))
+
+    def _rolling(self, **kwargs):
+        self.p.reset()
+        self.invoice_program.impl_stats(stats_mode=conf.STATS_MODE_ROLLING, table_mode=conf.TABLE_MODE_CSV, header=False, **kwargs)
+        return [line.split(',') for line in self.p.string().splitlines()]
+
+    def _window(self, tax_code, date_from, date_to):
+        invoices = [invoice for invoice in self.invoices \
+                    if tax_code in {None, invoice.tax_code} and date_from <= invoice.date <= date_to]
+        return [str(len(invoices)), '{:.2f}'.format(sum(invoice.income for invoice in invoices))]
+
+    def test_rolling(self):
+        rows = self._rolling(stats_window=datetime.timedelta(days=10), total=True)
+        days = sorted(set(invoice.date for invoice in self.invoices))
+        self.assertEqual([row[1] for row in rows[:-1]], [str(day) for day in days])
+        for row in rows[:-1]:
+            date_from, date_to = (datetime.datetime.strptime(d, "%Y-%m-%d").date() for d in row[:2])
+            self.assertEqual(date_to - date_from, datetime.timedelta(days=9))
+            self.assertEqual(row[2:], self._window(None, date_from, date_to))
+        self.assertEqual(rows[-1], ['TOTALE', str(days[-1])] + self._window(None, days[0], days[-1]))
+
+    def test_rolling_client(self):
+        rows = self._rolling(stats_group=conf.STATS_GROUP_CLIENT, total=False)
+        tax_codes = sorted(set(invoice.tax_code for invoice in self.invoices))
+        self.assertEqual(sorted(set(row[0] for row in rows)), tax_codes)
+        for row in rows:
+            date_from, date_to = (datetime.datetime.strptime(d, "%Y-%m-%d").date() for d in row[1:3])
+            self.assertEqual(date_to - date_from, datetime.timedelta(days=conf.DEFAULT_STATS_WINDOW_DAYS - 1))
+            self.assertEqual(row[3:], self._window(row[0], date_from, date_to))
+
+    def test_rolling_date_range(self):
+        range_from, range_to = datetime.date(2015, 2, 1), datetime.date(2015, 3, 31)
+        rows = self._rolling(date_from=range_from, date_to=range_to, total=True)
+        days = sorted(set(invoice.date for invoice in self.invoices if range_from <= invoice.date <= range_to))
+        self.assertEqual([row[1] for row in rows[:-1]], [str(day) for day in days])
+        for row in rows[:-1]:
+            date_from, date_to = (datetime.datetime.strptime(d, "%Y-%m-%d").date() for d in row[:2])
+            self.assertEqual(row[2:], self._window(None, max(date_from, range_from), date_to))
+        self.assertEqual(rows[-1], ['TOTALE', str(days[-1])] + self._window(None, range_from, range_to))
+        # a user filter still goes through the collection
+        tax_code = self.invoices[0].tax_code
+        rows = self._rolling(filters=("tax_code == {!r}".format(tax_code), ), date_from=range_from, date_to=range_to, total=False)
+        for row in rows:
+            date_from, date_to = (datetime.datetime.strptime(d, "%Y-%m-%d").date() for d in row[:2])
+            self.assertEqual(row[2:], self._window(tax_code, max(date_from, range_from), date_to))
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestSnapshot',
+]
+
+import os
+import random
+
+from invoice.invoice import Invoice
+from invoice.snapshot import write_snapshot, read_snapshot, read_snapshot_generation
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestSnapshot(InvoiceDbTestCase):
+    def setUp(self):
+        self.rnd = random.Random(17)
+        # not in sort order
+        self.setup_db(make_year_invoices(self.rnd, 2015, 1, 30) + make_year_invoices(self.rnd, 2014, 1, 30))
+
+    def test_generation(self):
+        generation = self.db.load_invoices_generation()
+        self.db.write('invoices', make_year_invoices(self.rnd, 2016, 1, 2))
+        self.assertEqual(self.db.load_invoices_generation(), generation + 2)
+        self.db.delete('invoices', where="year == 2016")
+        self.assertEqual(self.db.load_invoices_generation(), generation + 4)
+
+    def test_load(self):
+        self.assertIsNone(self.db.load_snapshot())
+        self.db.store_snapshot()
+        self.assertEqual(read_snapshot_generation(self.db.get_snapshot_filename()), self.db.load_invoices_generation())
+        invoice_collection = self.db.load_snapshot()
+        self.assertEqual(list(invoice_collection), self.db.read('invoices'))
+        self.assertEqual(invoice_collection.years(), (2014, 2015))
+        invoice_collection.sort()
+        self.assertEqual([(invoice.year, invoice.number) for invoice in invoice_collection][:2], [(2014, 1), (2014, 2)])
+        self.assertEqual(list(self.db.load_invoice_collection()), self.db.read('invoices'))
+
+    def test_stale(self):
+        self.db.store_snapshot()
+        self.db.write('invoices', make_year_invoices(self.rnd, 2016, 1, 2))
+        self.assertIsNone(self.db.load_snapshot())
+        invoice_collection = self.db.load_invoice_collection()
+        self.assertEqual(len(invoice_collection), 62)
+
+    def test_legacy_db(self):
+        with self.db.connect() as connection:
+            cursor = connection.cursor()
+            for trigger_name in self.db.INVOICES_GENERATION_TRIGGERS:
+                cursor.execute("DROP TRIGGER {};".format(trigger_name))
+            cursor.execute("DROP TABLE invoices_generation;")
+        self.assertEqual(self.db.load_invoices_generation(), 1)
+        self.db.store_snapshot()
+        self.assertIsNotNone(self.db.load_snapshot())
+        self.db.delete('invoices', where="year == 2015")
+        self.assertIsNone(self.db.load_snapshot())
+
+    def test_recreated_db(self):
+        self.db.store_snapshot()
+        generation = self.db.load_invoices_generation()
+        os.remove(self.db_filename)
+        self.db.initialize()
+        self.assertFalse(os.path.exists(self.db.get_snapshot_filename()))
+        self.db.write('invoices', make_year_invoices(self.rnd, 2020, 1, generation))
+        self.assertEqual(self.db.load_invoices_generation(), generation)
+        self.assertIsNone(self.db.load_snapshot())
+        self.assertEqual(self.db.load_invoice_collection().years(), (2020, ))
+        # a stale snapshot left by another db is not trusted either
+        self.db.store_snapshot()
+        snapshot_filename = self.db.get_snapshot_filename()
+        with open(snapshot_filename, 'rb') as f_in:
+            snapshot_data = f_in.read()
+        os.remove(self.db_filename)
+        self.db.initialize()
+        with open(snapshot_filename, 'wb') as f_out:
+            f_out.write(snapshot_data)
+        self.db.write('invoices', make_year_invoices(self.rnd, 2021, 1, generation))
+        self.assertIsNone(self.db.load_snapshot())
+        self.assertEqual(self.db.load_invoice_collection().years(), (2021, ))
+
+    def test_none_values(self):
+        filename = os.path.join(self.tmpdir.name, 'x.snapshot')
+        invoice = self.db.read('invoices')[0]
+        invoices = [invoice, Invoice(*(None for field_name in Invoice._fields)), invoice._replace(name="Niccolò", p_vat=0.0)]
+        columns = [list(values) for values in zip(*invoices)]
+        write_snapshot(filename, 7, Invoice._fields, columns, db_id='a')
+        self.assertIsNone(read_snapshot(filename, generation=8))
+        self.assertIsNone(read_snapshot(filename, generation=7, db_id='b'))
+        field_names, read_columns = read_snapshot(filename, generation=7, db_id='a')
+        self.assertEqual(tuple(field_names), Invoice._fields)
+        self.assertEqual(read_columns, columns)
+        self.assertEqual(read_snapshot(filename + '.missing'), None)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestSqlAggregation',
+]
+
+import datetime
+import random
+
+from invoice import conf
+from invoice.aggregation import aggregate, group_kind_names
+from invoice.error import InvoiceArgumentError
+from invoice.invoice import Invoice
+from invoice.invoice_program import InvoiceProgram
+from invoice.sql_aggregation import sql_aggregate, sql_totals, sql_group_supported, sql_filter, sql_filters
+from invoice.string_printer import StringPrinter
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestSqlAggregation(InvoiceDbTestCase):
+    def setUp(self):
+        rnd = random.Random(7)
+        invoices = []
+        for year in 2014, 2015, 2016:
+            invoices.extend(make_year_invoices(rnd, year, 1, 200, date=datetime.date(year, 1, 1)))
+        self.setup_db(invoices)
+
+    def _select(self, date_from, date_to):
+        return [invoice for invoice in self.invoices \
+                   if (date_from is None or invoice.date >= date_from) and (date_to is None or invoice.date <= date_to)]
+
+    def _compare(self, group, date_from=None, date_to=None):
+        invoices = self._select(date_from, date_to)
+        groups = aggregate(invoices, group)
+        sql_groups = sql_aggregate(self.db, group, date_from=date_from, date_to=date_to, hydrate_first=True)
+        self.assertEqual([key for key, group_aggregate in sql_groups], [key for key, group_aggregate in groups])
+        for (key, group_aggregate), (sql_key, sql_group_aggregate) in zip(groups, sql_groups):
+            self.assertEqual(sql_group_aggregate.count, group_aggregate.count)
+            self.assertAlmostEqual(sql_group_aggregate.income, group_aggregate.income)
+            self.assertEqual(sql_group_aggregate.clients, group_aggregate.clients)
+            self.assertEqual((sql_group_aggregate.date_from, sql_group_aggregate.date_to),
+                             (group_aggregate.date_from, group_aggregate.date_to))
+            self.assertEqual(sql_group_aggregate.first, group_aggregate.first)
+
+    def test_groups(self):
+        for name in group_kind_names():
+            self.assertTrue(sql_group_supported((name, )))
+            self._compare((name, ))
+
+    def test_composite_groups(self):
+        for group in ('year', 'client'), ('month', 'service'), ('week', 'weekday'), ('city', 'task'):
+            self._compare(group)
+
+    def test_date_range(self):
+        date_from, date_to = datetime.date(2014, 3, 10), datetime.date(2015, 2, 20)
+        for name in 'month', 'week', 'client':
+            self._compare((name, ), date_from=date_from, date_to=date_to)
+        self.assertEqual(sql_aggregate(self.db, ('year', ), date_from=datetime.date(2020, 1, 1)), [])
+
+    def test_totals(self):
+        date_from = datetime.date(2015, 6, 1)
+        invoices = self._select(date_from, None)
+        invoice_count, income, client_count = sql_totals(self.db, date_from=date_from)
+        self.assertEqual(invoice_count, len(invoices))
+        self.assertAlmostEqual(income, sum(invoice.income for invoice in invoices))
+        self.assertEqual(client_count, len(set(invoice.tax_code for invoice in invoices)))
+
+    def test_stats_backends(self):
+        p = StringPrinter()
+        invoice_program = InvoiceProgram(db_filename=self.db_filename, logger=self.logger, printer=p)
+        date_from = datetime.date(2014, 5, 1)
+        for stats_group in 'year', 'month', 'week', 'client', 'task', 'year,weekday':
+            for stats_mode in conf.STATS_MODES:
+                outputs = []
+                for stats_backend in conf.STATS_BACKEND_PYTHON, conf.STATS_BACKEND_SQL:
+                    p.reset()
+                    invoice_program.impl_stats(filters=(), date_from=date_from, stats_group=stats_group,
+                                               stats_mode=stats_mode, stats_backend=stats_backend)
+                    outputs.append(p.string())
+                self.assertEqual(outputs[1], outputs[0])
+
+    def test_sql_filter(self):
+        for filter_source in ("year == 2014", "anno in {2014, 2015}", "tax_code == 'WNYBRC01G01H663S'",
+                              "date >= Date('2014-03-01') and income > 10", "2015 <= year", "year != 2015",
+                              "tax_code not in ('WNYBRC01G01H663S', 'PRKPRT01G01H663M') or number < 10"):
+            where, values = sql_filter(self.db, filter_source)
+            sql_invoices = [self.db.make_record('invoices', row) for row in self.db.iter_values('invoices', where=where, values=values)]
+            python_invoices = [invoice for invoice in self.invoices if Invoice.compile_filter_function(filter_source)(invoice)]
+            self.assertEqual(sql_invoices, python_invoices)
+        for filter_source in ("year + 1 == 2015", "doc_filename == 'a.doc'", "year == '2014'", "date >= '2014-03-01'",
+                              "not year == 2014", "year == True", "Weekday == 1", lambda invoice: invoice.year == 2014):
+            self.assertIs(sql_filter(self.db, filter_source), None)
+        sql_conditions, python_filters = sql_filters(self.db, ("year == 2014", "year + 1 == 2015"))
+        self.assertEqual(len(sql_conditions), 1)
+        self.assertEqual(python_filters, ["year + 1 == 2015"])
+
+    def test_filters(self):
+        filters = ("year in {2014, 2015}", "tax_code != 'WNYBRC01G01H663S'")
+        compiled_filters = [Invoice.compile_filter_function(filter_source) for filter_source in filters]
+        invoices = [invoice for invoice in self.invoices if all(f(invoice) for f in compiled_filters)]
+        sql_conditions, python_filters = sql_filters(self.db, filters)
+        self.assertEqual(python_filters, [])
+        for group in ('year', ), ('month', 'client'):
+            groups = aggregate(invoices, group)
+            sql_groups = sql_aggregate(self.db, group, filters=sql_conditions)
+            self.assertEqual([(key, group_aggregate.count) for key, group_aggregate in sql_groups],
+                             [(key, group_aggregate.count) for key, group_aggregate in groups])
+        invoice_count, income, client_count = sql_totals(self.db, filters=sql_conditions)
+        self.assertEqual((invoice_count, client_count), (len(invoices), len(set(invoice.tax_code for invoice in invoices))))
+
+    def test_stats_backend_filters(self):
+        invoice_program = InvoiceProgram(db_filename=self.db_filename, logger=self.logger, printer=StringPrinter())
+        filters = ("year == 2014", )
+        python_filters = ("year + 1 == 2015", )
+        self.assertEqual(invoice_program.get_stats_backend(conf.STATS_BACKEND_AUTO, filters, ('year', ))[0], conf.STATS_BACKEND_SQL)
+        self.assertEqual(invoice_program.get_stats_backend(conf.STATS_BACKEND_AUTO, python_filters, ('year', ))[0], conf.STATS_BACKEND_PYTHON)
+        self.assertEqual(invoice_program.get_stats_backend(conf.STATS_BACKEND_AUTO, (), ('year', ))[0], conf.STATS_BACKEND_SQL)
+        with self.assertRaises(InvoiceArgumentError):
+            invoice_program.get_stats_backend(conf.STATS_BACKEND_SQL, filters + python_filters, ('year', ))
+
+    def test_backends_with_filters(self):
+        p = StringPrinter()
+        invoice_program = InvoiceProgram(db_filename=self.db_filename, logger=self.logger, printer=p)
+        filters = ("year in {2014, 2015}", "tax_code == 'PRKPRT01G01H663M' or tax_code == 'KNTCRK01G01H663X'")
+        for stats_group in 'year', 'month', 'client', 'task':
+            outputs = []
+            for stats_backend in conf.STATS_BACKEND_PYTHON, conf.STATS_BACKEND_SQL:
+                p.reset()
+                invoice_program.impl_stats(filters=filters, stats_group=stats_group, stats_backend=stats_backend)
+                outputs.append(p.string())
+            self.assertEqual(outputs[1], outputs[0])
+        for report_filters in (), filters:
+            outputs = []
+            for stats_backend in conf.STATS_BACKEND_PYTHON, conf.STATS_BACKEND_SQL:
+                p.reset()
+                invoice_program.impl_report(filters=report_filters, stats_backend=stats_backend)
+                outputs.append(p.string())
+            self.assertEqual(outputs[1], outputs[0])
+            self.assertIn("settimana:", outputs[0])
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestSummary',
+]
+
+import datetime
+import json
+import os
+import random
+import tempfile
+
+from invoice import conf
+from invoice.error import InvoiceArgumentError
+from invoice.invoice_collection import InvoiceCollection
+
+from .fixtures import InvoiceDbTestCase, make_year_invoices
+
+
+class TestSummary(InvoiceDbTestCase):
+    def setUp(self):
+        rnd = random.Random(5)
+        invoices = []
+        for year in 2014, 2015, 2016:
+            invoices.extend(make_year_invoices(rnd, year, 1, 150, date=datetime.date(year, 1, 1)))
+        self.setup_db(invoices, use_rc_dir=True)
+
+    def test_bucket_by_month(self):
+        invoice_collection = InvoiceCollection(self.invoices)
+        month_invoices = self.invoice_program.bucket_by_month(invoice_collection, (2014, 2016))
+        self.assertEqual(list(month_invoices), [(year, month) for year in (2014, 2016) for month in range(1, 13)])
+        for (year, month), invoices in month_invoices.items():
+            m_filter = lambda invoice: invoice.year == year and invoice.date.month == month
+            self.assertEqual(invoices, list(invoice_collection.filter(m_filter)))
+
+    def _summary(self, year):
+        self.p.reset()
+        self.invoice_program.impl_summary(year=year, table_mode=conf.TABLE_MODE_TEXT)
+        return self.p.string()
+
+    def test_years(self):
+        summary_2014 = self._summary(2014)
+        self.assertTrue(summary_2014.startswith("=== Gennaio ===\n"))
+        self.assertEqual(self._summary((2014, )), summary_2014)
+        summary = self._summary((2014, 2015))
+        self.assertEqual(summary.count("=== Gennaio 2014 ==="), 1)
+        self.assertEqual(summary.count("=== Dicembre 2015 ==="), 1)
+        self.assertEqual(summary.split("=== Gennaio 2015 ===")[0].replace(" 2014 ===", " ==="), summary_2014)
+
+    def test_summary_years(self):
+        for jobs in 1, 2:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                for year in 2014, 2016:
+                    os.makedirs(os.path.join(tmpdir, str(year)))
+                output_filename = os.path.join(tmpdir, '{year}', 'summary.txt')
+                self.p.reset()
+                results = self.invoice_program.impl_summary_years(years=(2014, 2015, 2016), jobs=jobs,
+                    table_mode=conf.TABLE_MODE_TEXT, output_filename=output_filename)
+                self.assertEqual([result.year for result in results], [2014, 2015, 2016])
+                # the 2015 directory is missing: only that year fails
+                self.assertEqual([result.error is None for result in results], [True, False, True])
+                self.assertEqual([result.invoice_count for result in results], [150, 150, 150])
+                self.assertIn("2015: 150 fatture", self.p.string())
+                for year in 2014, 2016:
+                    with open(output_filename.format(year=year)) as f_in:
+                        self.assertEqual(f_in.read(), self._summary(year))
+
+    def test_summary_years_mode_pattern(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_filename = os.path.join(tmpdir, 'summary_{year}.{mode}')
+            self.p.reset()
+            results = self.invoice_program.impl_summary_years(years=(2014, 2016), jobs=1,
+                table_mode=conf.TABLE_MODE_TEXT, output_filename=output_filename)
+            self.assertEqual([result.error for result in results], [None, None])
+            self.assertIn(os.path.join(tmpdir, 'summary_2014.text'), self.p.string())
+            for year in 2014, 2016:
+                with open(os.path.join(tmpdir, 'summary_{}.{}'.format(year, conf.TABLE_MODE_TEXT))) as f_in:
+                    self.assertEqual(f_in.read(), self._summary(year))
+
+    def test_outputs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            txt_filename = os.path.join(tmpdir, 'summary.txt')
+            csv_filename = os.path.join(tmpdir, 'summary.csv')
+            self.invoice_program.impl_summary(year=2015, table_mode=conf.TABLE_MODE_CSV,
+                output_filename=[txt_filename + ':' + conf.TABLE_MODE_TEXT, csv_filename])
+            with open(txt_filename) as f_in:
+                self.assertEqual(f_in.read(), self._summary(2015))
+            self.p.reset()
+            self.invoice_program.impl_summary(year=2015, table_mode=conf.TABLE_MODE_CSV)
+            with open(csv_filename) as f_in:
+                self.assertEqual(f_in.read(), self.p.string())
+
+    def test_summary_ndjson(self):
+        self.p.reset()
+        self.invoice_program.impl_summary(year=2014, table_mode=conf.TABLE_MODE_NDJSON)
+        objs = [json.loads(line) for line in self.p.string().splitlines()]
+        money_keys = ('fee', 'refunds', 'cpa', 'taxable_income', 'vat', 'deduction', 'taxes', 'income')
+        month_objs = []
+        total_count = 0
+        for obj in objs:
+            for key in money_keys:
+                self.assertIsInstance(obj[key], int)
+            if obj['number'] == "TOTALE":
+                total_count += 1
+                for key in money_keys:
+                    self.assertEqual(obj[key], sum(month_obj[key] for month_obj in month_objs))
+                month_objs = []
+            else:
+                month_objs.append(obj)
+        self.assertEqual(total_count, 12)
+        self.assertEqual(sum(obj['income'] for obj in objs if obj['number'] == "TOTALE"),
+                         int(round(sum(invoice.income for invoice in self.invoices if invoice.year == 2014) * 100)))
+
+    def test_summary_years_output(self):
+        with self.assertRaises(InvoiceArgumentError):
+            self.invoice_program.impl_summary_years(years=(2014, 2015), output_filename='summary.xlsx')
+
+    def test_conf_restored(self):
+        self.assertTrue(conf.get_db_file().startswith(self.tmpdir.name))
+        self.doCleanups()
+        self.assertFalse(conf.get_db_file().startswith(self.tmpdir.name))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestTaxCode',
+]
+
+import datetime
+import unittest
+
+from invoice.error import InvoiceMalformedTaxCodeError
+from invoice.invoice_collection import InvoiceCollection
+from invoice.invoice_collection_validator import InvoiceCollectionValidator
+from invoice.log import get_null_logger
+from invoice.validation_result import ValidationResult
+from invoice.tax_code import check_tax_code, check_tax_codes, cin_luhn, \
+                             KIND_PERSONAL, KIND_VAT_NUMBER, \
+                             ERROR_LENGTH, ERROR_SYMBOLS, ERROR_CONTROL
+
+from .fixtures import make_invoice
+
+
+class TestTaxCode(unittest.TestCase):
+    def test_personal_ok(self):
+        for tax_code in 'WNYBRC01G01H663S', 'PRKPRT01G01H663M', 'BNNBRC01G01H663S', 'KNTCRK01G01H663X':
+            tax_code_check = check_tax_code(tax_code)
+            self.assertTrue(tax_code_check.valid)
+            self.assertEqual(tax_code_check.kind, KIND_PERSONAL)
+            self.assertIs(tax_code_check.error, None)
+
+    def test_personal_length(self):
+        tax_code_check = check_tax_code('WNYBRC01G01H663')
+        self.assertFalse(tax_code_check.valid)
+        self.assertEqual((tax_code_check.kind, tax_code_check.error, tax_code_check.expected), (KIND_PERSONAL, ERROR_LENGTH, 16))
+
+    def test_personal_symbols(self):
+        tax_code_check = check_tax_code('WNYBR101GO1H663S')
+        self.assertFalse(tax_code_check.valid)
+        self.assertEqual(tax_code_check.error, ERROR_SYMBOLS)
+        self.assertEqual(tax_code_check.positions, (5, 9))
+
+    def test_personal_control(self):
+        tax_code_check = check_tax_code('WNYBRC01G01H663X')
+        self.assertFalse(tax_code_check.valid)
+        self.assertEqual(tax_code_check.error, ERROR_CONTROL)
+        self.assertEqual(tax_code_check.positions, (15, ))
+        self.assertEqual(tax_code_check.expected, 'S')
+
+    def test_vat_number(self):
+        vat_number = '1234567890'
+        vat_number += cin_luhn(vat_number + '0')
+        tax_code_check = check_tax_code(vat_number)
+        self.assertTrue(tax_code_check.valid)
+        self.assertEqual(tax_code_check.kind, KIND_VAT_NUMBER)
+        wrong_vat_number = vat_number[:-1] + str((int(vat_number[-1]) + 1) % 10)
+        self.assertEqual(check_tax_code(wrong_vat_number).error, ERROR_CONTROL)
+        tax_code_check = check_tax_code('123456789')
+        self.assertEqual((tax_code_check.kind, tax_code_check.error, tax_code_check.expected), (KIND_VAT_NUMBER, ERROR_LENGTH, 11))
+
+    def test_memo(self):
+        check_tax_code.cache_clear()
+        check_tax_code('WNYBRC01G01H663S')
+        check_tax_code('WNYBRC01G01H663S')
+        cache_info = check_tax_code.cache_info()
+        self.assertEqual((cache_info.hits, cache_info.misses), (1, 1))
+
+    def test_batch(self):
+        tax_codes = ['WNYBRC01G01H663S', 'WNYBRC01G01H663X', 'WNYBRC01G01H663S']
+        self.assertEqual([tax_code_check.valid for tax_code_check in check_tax_codes(tax_codes)], [True, False, True])
+        self.assertEqual([tax_code_check.tax_code for tax_code_check in check_tax_codes(tax_codes)], tax_codes)
+
+    def test_collection_batch(self):
+        logger = get_null_logger()
+        invoices = [make_invoice(2015, number, datetime.date(2015, 1, number),
+                                 tax_code='WNYBRC01G01H663S' if number % 2 else 'WNYBRC01G01H663X') for number in range(1, 21)]
+        check_tax_code.cache_clear()
+        validation_result = ValidationResult(logger=logger)
+        InvoiceCollectionValidator(validation_result, logger=logger).validate(InvoiceCollection(invoices, logger=logger))
+        cache_info = check_tax_code.cache_info()
+        self.assertEqual((cache_info.hits, cache_info.misses), (0, 2))
+        self.assertEqual(validation_result.error_counts()[InvoiceMalformedTaxCodeError.exc_code()], 10)
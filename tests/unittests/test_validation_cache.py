@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestValidationCache',
+]
+
+import datetime
+import os
+import tempfile
+import unittest
+
+from invoice.error import InvoiceMalformedTaxCodeError, \
+                          InvoiceUnsupportedCurrencyError
+from invoice.invoice import Invoice
+from invoice.invoice_db import InvoiceDb
+from invoice.log import get_null_logger
+from invoice.validation_cache import ValidationCache
+from invoice.validation_result import ValidationResult
+
+
+class TestValidationCache(unittest.TestCase):
+    def setUp(self):
+        self.logger = get_null_logger()
+        self.invoice = Invoice(
+            doc_filename='2014_001.doc',
+            year=2014, number=1,
+            name='Bruce Wayne', tax_code='WNYBRC01G01H663X',
+            city='Gotham City', date=datetime.date(2014, 1, 3),
+            service='therapy',
+            fee=50.0, vat=0.0, cpa=0.0, deduction=0.0,
+            p_vat=0.0, p_deduction=0.0, p_cpa=0.0, refunds=0.0, taxes=0.0,
+            income=50.0, currency='dollar', exceptions='')
+
+    def _entries(self, validation_result):
+        return [(entry.exc_type, entry.message) for entry in validation_result.errors()[self.invoice.doc_filename]]
+
+    def test_hit(self):
+        validation_result = ValidationResult(logger=self.logger)
+        validation_cache = ValidationCache(ValidationCache.make_fingerprint(validation_result))
+        validation_cache.validate(self.invoice, validation_result)
+        self.assertEqual((validation_cache.hits, validation_cache.misses), (0, 1))
+
+        cached_validation_result = ValidationResult(logger=self.logger)
+        validation_cache.validate(self.invoice, cached_validation_result)
+        self.assertEqual((validation_cache.hits, validation_cache.misses), (1, 1))
+        self.assertEqual(self._entries(cached_validation_result), self._entries(validation_result))
+        self.assertEqual([exc_type for exc_type, message in self._entries(validation_result)],
+                         [InvoiceUnsupportedCurrencyError, InvoiceMalformedTaxCodeError])
+
+    def test_changed_invoice(self):
+        validation_result = ValidationResult(logger=self.logger)
+        validation_cache = ValidationCache(ValidationCache.make_fingerprint(validation_result))
+        validation_cache.validate(self.invoice, validation_result)
+        validation_cache.validate(self.invoice._replace(currency='euro'), ValidationResult(logger=self.logger))
+        self.assertEqual((validation_cache.hits, validation_cache.misses), (0, 2))
+
+    def test_replay_raise(self):
+        validation_result = ValidationResult(logger=self.logger)
+        validation_cache = ValidationCache(ValidationCache.make_fingerprint(validation_result))
+        validation_cache.validate(self.invoice, validation_result)
+        with self.assertRaises(InvoiceUnsupportedCurrencyError):
+            validation_cache.validate(self.invoice, ValidationResult(logger=self.logger, error_mode=('raise:*', )))
+
+    def test_fingerprint(self):
+        fingerprint = ValidationCache.make_fingerprint(ValidationResult(logger=self.logger))
+        self.assertNotEqual(fingerprint, ValidationCache.make_fingerprint(ValidationResult(logger=self.logger, error_mode=('ignore:*', ))))
+        self.assertNotEqual(fingerprint, ValidationCache.make_fingerprint(ValidationResult(logger=self.logger, warning_mode=('error:*', ))))
+
+    def test_db(self):
+        validation_result = ValidationResult(logger=self.logger)
+        fingerprint = ValidationCache.make_fingerprint(validation_result)
+        content_hash = ValidationCache.content_hash(self.invoice)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = InvoiceDb(os.path.join(tmpdir, 'x.db'), self.logger)
+            db.initialize()
+            validation_cache = db.load_validation_cache(fingerprint)
+            validation_cache.validate(self.invoice, validation_result)
+            db.store_validation_cache(validation_cache)
+
+            validation_cache = db.load_validation_cache(fingerprint, content_hashes=[content_hash])
+            self.assertEqual(list(validation_cache.entries), [content_hash])
+            cached_validation_result = ValidationResult(logger=self.logger)
+            validation_cache.validate(self.invoice, cached_validation_result)
+            self.assertEqual(validation_cache.hits, 1)
+            self.assertEqual(self._entries(cached_validation_result), self._entries(validation_result))
+
+            # a different fingerprint discards the cache
+            other_fingerprint = ValidationCache.make_fingerprint(ValidationResult(logger=self.logger, error_mode=('ignore:*', )))
+            self.assertEqual(db.load_validation_cache(other_fingerprint).entries, {})
+            db.store_validation_cache(db.load_validation_cache(other_fingerprint))
+            self.assertEqual(db.load_validation_cache(fingerprint).entries, {})
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestValidationResult',
+]
+
+import collections
+import pickle
+import unittest
+
+from invoice.error import InvoiceMalformedTaxCodeError, \
+                          InvoiceUnsupportedCurrencyError
+from invoice.log import get_null_logger
+from invoice.validation_result import ValidationResult, ValidationMessage
+
+
+Doc = collections.namedtuple('Doc', ('doc_filename', ))
+
+
+class TestValidationResult(unittest.TestCase):
+    def setUp(self):
+        self.logger = get_null_logger()
+
+    def test_message(self):
+        message = ValidationMessage("fattura {}: la valuta {!r} non è supportata", "a.doc", "dollar")
+        self.assertIs(message._text, None)
+        self.assertEqual(message, "fattura a.doc: la valuta 'dollar' non è supportata")
+        self.assertEqual(str(message), "fattura a.doc: la valuta 'dollar' non è supportata")
+        self.assertEqual(message, ValidationMessage("fattura {d}: la valuta {c!r} non è supportata", d="a.doc", c="dollar"))
+        self.assertNotEqual(message, "fattura a.doc")
+        self.assertEqual(pickle.loads(pickle.dumps(message)), message)
+
+    def test_ignored_message_not_rendered(self):
+        validation_result = ValidationResult(logger=self.logger, error_mode=('ignore:*', ))
+        message = ValidationMessage("fattura {}: errore", "a.doc")
+        validation_result.add_error(Doc("a.doc"), InvoiceUnsupportedCurrencyError, message)
+        self.assertIs(message._text, None)
+        self.assertEqual(validation_result.num_errors(), 0)
+
+    def test_counts(self):
+        validation_result = ValidationResult(logger=self.logger)
+        for doc_filename in "a.doc", "b.doc":
+            validation_result.add_error(Doc(doc_filename), InvoiceUnsupportedCurrencyError, ValidationMessage("fattura {}", doc_filename))
+        validation_result.add_error(Doc("a.doc"), InvoiceMalformedTaxCodeError, "fattura a.doc")
+        self.assertEqual(validation_result.num_errors(), 3)
+        self.assertEqual(validation_result.num_warnings(), 0)
+        self.assertEqual(validation_result.error_counts(), {
+            InvoiceUnsupportedCurrencyError.exc_code(): 2,
+            InvoiceMalformedTaxCodeError.exc_code(): 1,
+        })
+        self.assertEqual([entry.message for entry in validation_result.errors()["a.doc"]], ["fattura a.doc", "fattura a.doc"])
+
+    def test_critical(self):
+        validation_result = ValidationResult(logger=self.logger, error_mode=('raise:*', ))
+        with self.assertRaises(InvoiceUnsupportedCurrencyError) as cm:
+            validation_result.add_error(Doc("a.doc"), InvoiceUnsupportedCurrencyError, ValidationMessage("fattura {}", "a.doc"))
+        self.assertEqual(str(cm.exception), "fattura a.doc")
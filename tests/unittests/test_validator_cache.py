@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 Simone Campagna
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+__author__ = "Simone Campagna"
+__all__ = [
+    'TestValidatorCache',
+]
+
+import datetime
+import os
+import tempfile
+import unittest
+
+from invoice.invoice import Invoice
+from invoice.invoice_db import InvoiceDb
+from invoice.invoice_collection_validator import evaluate_user_validators
+from invoice.log import get_null_logger
+from invoice.validator_cache import ValidatorCache
+
+
+class TestValidatorCache(unittest.TestCase):
+    def setUp(self):
+        self.logger = get_null_logger()
+        self.validators = [
+            InvoiceDb.make_validator('fee > 100', 'p_vat > 0', 'iva mancante'),
+            InvoiceDb.make_validator('Date("2014-06-01") <= date', 'currency == "euro"', 'valuta errata'),
+        ]
+        self.invoices = []
+        for number, (fee, p_vat, currency) in enumerate([(50.0, 0.0, 'euro'), (150.0, 0.0, 'euro'), (150.0, 22.0, 'dollar')]):
+            self.invoices.append(Invoice(
+                doc_filename='2014_{:03d}.doc'.format(number + 1),
+                year=2014, number=number + 1,
+                name='Bruce Wayne', tax_code='WNYBRC01G01H663S',
+                city='Gotham City', date=datetime.date(2014, 6, number + 1),
+                service='therapy',
+                fee=fee, vat=0.0, cpa=0.0, deduction=0.0,
+                p_vat=p_vat, p_deduction=0.0, p_cpa=0.0, refunds=0.0, taxes=0.0,
+                income=fee, currency=currency, exceptions=''))
+        ValidatorCache.clear_memory()
+
+    def tearDown(self):
+        ValidatorCache.clear_memory()
+
+    def test_sources(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_filename = os.path.join(tmpdir, 'x.db.validators')
+            validator_cache = ValidatorCache(cache_filename, logger=self.logger)
+            validator_cache.compile(self.validators)
+            self.assertEqual(validator_cache.source, ValidatorCache.SOURCE_COMPILE)
+            self.assertTrue(os.path.exists(cache_filename))
+            validator_cache.compile(self.validators)
+            self.assertEqual(validator_cache.source, ValidatorCache.SOURCE_MEMORY)
+            ValidatorCache.clear_memory()
+            user_validators = validator_cache.compile(self.validators)
+            self.assertEqual(validator_cache.source, ValidatorCache.SOURCE_DISK)
+            self.assertEqual([validator for validator, compiled_validator in user_validators], self.validators)
+            self.assertEqual([compiled_validator.filter_function(self.invoices[1]) for validator, compiled_validator in user_validators], [True, True])
+
+            # changed validators
+            validator_cache.compile(self.validators[:1])
+            self.assertEqual(validator_cache.source, ValidatorCache.SOURCE_COMPILE)
+
+            # corrupted cache file
+            ValidatorCache.clear_memory()
+            with open(cache_filename, 'wb') as f_out:
+                f_out.write(b'xyz')
+            validator_cache.compile(self.validators)
+            self.assertEqual(validator_cache.source, ValidatorCache.SOURCE_COMPILE)
+
+    def test_evaluate(self):
+        user_validators = ValidatorCache(logger=self.logger).compile(self.validators)
+        expected = []
+        for invoice in self.invoices:
+            expected.append([validator for validator, compiled_validator in user_validators \
+                             if compiled_validator.filter_function(invoice) and not compiled_validator.check_function(invoice)])
+        self.assertEqual(evaluate_user_validators(self.invoices, user_validators), expected)
+        self.assertEqual(expected, [[], [self.validators[0]], [self.validators[1]]])